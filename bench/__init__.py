@@ -0,0 +1,5 @@
+"""
+Benchmarks of the canvas operations
+
+Run them from the solution directory, e.g. python -m bench.bench_fill
+"""
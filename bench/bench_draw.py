@@ -0,0 +1,76 @@
+"""
+Compares the slice based line and rectangle drawing with the former point by
+point drawing, per edge length (the undo history is left out of both)
+
+    python -m bench.bench_draw [--size 5000] [--repeat 20]
+"""
+
+import argparse
+import time
+
+from canvas import Canvas, Point, Line, Rectangle
+
+
+def legacy_draw_line(canvas, line):
+    """
+    The point by point drawing Canvas._draw_line used before slice assignments
+    """
+    for point in line.get_points():
+        canvas._draw_point(point)
+
+
+def legacy_draw_rectangle(canvas, rectangle):
+    """
+    The rectangle drawing built on the point by point line drawing
+    """
+    for line in rectangle.get_lines():
+        legacy_draw_line(canvas, line)
+
+
+def sliced_draw_rectangle(canvas, rectangle):
+    """
+    The rectangle drawing of Canvas.draw_rectangle, without the undo history
+    """
+    for line in rectangle.get_lines():
+        canvas._draw_line(line)
+
+
+def _time_per_call(draw, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        draw()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    """
+    Runs the benchmark and prints the cost of drawing an edge of various lengths
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    canvas = Canvas(args.size, args.size)
+    lengths = [length for length in (10, 100, 1000, 5000, 20000) if length <= args.size]
+    print("{:<22} {:>6} {:>14} {:>14} {:>9}".format(
+        "shape", "edge", "legacy/edge", "slices/edge", "speedup"))
+    for length in lengths:
+        last = length - 1
+        shapes = [
+            ("line along a row", Line(Point(0, 1), Point(last, 1)),
+             legacy_draw_line, Canvas._draw_line, 1),
+            ("line along a column", Line(Point(1, 0), Point(1, last)),
+             legacy_draw_line, Canvas._draw_line, 1),
+            ("rectangle", Rectangle(Point(0, 0), Point(last, last)),
+             legacy_draw_rectangle, sliced_draw_rectangle, 4),
+        ]
+        for name, shape, legacy_draw, draw, edges in shapes:
+            legacy = _time_per_call(lambda: legacy_draw(canvas, shape), args.repeat) / edges
+            sliced = _time_per_call(lambda: draw(canvas, shape), args.repeat) / edges
+            print("{:<22} {:>6} {:>12.2f}us {:>12.2f}us {:>8.0f}x".format(
+                name, length, legacy * 1e6, sliced * 1e6, legacy / sliced))
+
+
+if __name__ == "__main__":
+    main()
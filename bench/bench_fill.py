@@ -0,0 +1,108 @@
+"""
+Compares the scanline bucket fill with the former point by point flood fill,
+and with filling again a component known by the canvas component index
+
+    python -m bench.bench_fill [--size 2000] [--legacy-max 300]
+
+The former flood fill is quadratic in the size of its frontier: on a 2000x2000
+canvas it runs for hours, so it is only measured on canvases up to --legacy-max.
+"""
+
+import argparse
+import time
+
+from canvas import Canvas, CanvasCellContentType, Point, Rectangle
+
+
+def legacy_bucket_fill(canvas, point, colour, reset_content_type=False):
+    """
+    The point by point flood fill Canvas._bucket_fill used before the scanline fill
+    """
+    cells = canvas.cells
+    content_type_to_fill, _ = cells[point.x][point.y]
+    processed = set()
+    to_process = [point]
+
+    def can_process_cell(cell):
+        #pylint: disable=missing-docstring
+        return (cell not in processed and
+                cell not in to_process and
+                not canvas._point_is_out_of_bound(cell))
+
+    while to_process != []:
+        current_point = to_process.pop()
+        processed.add(current_point)
+
+        current_point_type, _ = cells[current_point.x][current_point.y]
+        if current_point_type == content_type_to_fill:
+            if reset_content_type:
+                cells[current_point.x][current_point.y] = (CanvasCellContentType.Empty, colour)
+            else:
+                cells[current_point.x][current_point.y] = (content_type_to_fill, colour)
+            for neighbour in (Point(current_point.x - 1, current_point.y),
+                              Point(current_point.x + 1, current_point.y),
+                              Point(current_point.x, current_point.y - 1),
+                              Point(current_point.x, current_point.y + 1)):
+                if can_process_cell(neighbour):
+                    to_process.insert(0, neighbour)
+
+
+def open_canvas(size):
+    """
+    Returns an empty canvas: the fill covers the whole canvas
+    """
+    return Canvas(size, size)
+
+
+def maze_canvas(size):
+    """
+    Returns a canvas of nested rectangles opened by a gap on alternate sides
+    """
+    canvas = Canvas(size, size)
+    for offset in range(1, size // 2 - 1, 3):
+        last = size - 1 - offset
+        canvas.draw_rectangle(Rectangle(Point(offset, offset), Point(last, last)))
+        gap_x = offset + 1 if offset % 2 else last - 1
+        canvas.cells[gap_x][offset] = (CanvasCellContentType.Empty, ' ')
+    return canvas
+
+
+def _time(fill, canvas):
+    start = time.perf_counter()
+    fill(canvas)
+    return time.perf_counter() - start
+
+
+def main():
+    """
+    Runs the benchmark and prints one line per canvas layout and fill implementation
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=2000)
+    parser.add_argument('--legacy-max', type=int, default=300)
+    args = parser.parse_args()
+
+    fills = [
+        ('scanline', lambda canvas: canvas.bucket_fill(Point(0, 0), 'o')),
+        ('legacy', lambda canvas: legacy_bucket_fill(canvas, Point(0, 0), 'o')),
+    ]
+    sizes = sorted({min(args.size, args.legacy_max), args.size})
+    for layout in (open_canvas, maze_canvas):
+        for size in sizes:
+            for name, fill in fills:
+                if name == 'legacy' and size > args.legacy_max:
+                    print("{:<12} {:>5}x{:<5} {:<9} skipped (above --legacy-max)".format(
+                        layout.__name__, size, size, name))
+                    continue
+                canvas = layout(size)
+                elapsed = _time(fill, canvas)
+                print("{:<12} {:>5}x{:<5} {:<9} {:10.4f} s".format(
+                    layout.__name__, size, size, name, elapsed))
+                if name == 'scanline':
+                    elapsed = _time(lambda canvas: canvas.bucket_fill(Point(0, 0), 'p'), canvas)
+                    print("{:<12} {:>5}x{:<5} {:<9} {:10.4f} s".format(
+                        layout.__name__, size, size, 'repeat', elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Measures how rendering and bucket fill scale with the number of worker processes
+
+    python -m bench.bench_parallel [--size 4000] [--workers 1 2 4 8]
+
+The 'serial' rows are the canvas without parallel mode, for reference. The
+render times are full renders: every row is marked as modified beforehand.
+"""
+
+import argparse
+import time
+
+from canvas import Canvas, Point, Rectangle
+
+
+def draw_maze(canvas):
+    """
+    Draws nested rectangles opened by a gap on alternate sides
+    """
+    size = min(canvas.width, canvas.height)
+    for offset in range(1, size // 2 - 1, 3):
+        last = size - 1 - offset
+        canvas.draw_rectangle(Rectangle(Point(offset, offset), Point(last, last)))
+        gap_x = offset + 1 if offset % 2 else last - 1
+        canvas._grid.set(gap_x, offset, 1, ord(' '))
+
+
+def _time(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def _measure(canvas):
+    canvas._grid.dirty_rows.update(range(canvas.height))
+    render = _time(lambda: str(canvas))
+    open_fill = _time(lambda: canvas.bucket_fill(Point(0, 0), 'o'))
+    draw_maze(canvas)
+    maze_fill = _time(lambda: canvas.bucket_fill(Point(0, 0), 'm'))
+    return render, open_fill, maze_fill
+
+
+def main():
+    """
+    Runs the benchmark and prints one line per number of workers
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=4000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print("{:<8} {:>10} {:>10} {:>10}".format("workers", "render", "open fill", "maze fill"))
+    print("{:<8} {:>9.3f}s {:>9.3f}s {:>9.3f}s".format(
+        "serial", *_measure(Canvas(args.size, args.size, sparse=False))))
+    for workers in args.workers:
+        canvas = Canvas(args.size, args.size, workers=workers)
+        try:
+            print("{:<8} {:>9.3f}s {:>9.3f}s {:>9.3f}s".format(workers, *_measure(canvas)))
+        finally:
+            canvas.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Compares the allocation and hashing cost of Point with the former Point class
+
+    python -m bench.bench_point [--size 300]
+"""
+
+import argparse
+import sys
+import time
+
+from canvas import Point
+
+
+class LegacyPoint(object):
+    #pylint: disable=too-few-public-methods
+    """
+    The Point class used before Point became an immutable tuple
+    """
+    def __init__(self, x, y):
+        #pylint: disable=invalid-name
+        self.x = int(x)
+        self.y = int(y)
+
+    def __eq__(self, other):
+        return self.x == other.x and self.y == other.y
+
+    def __hash__(self):
+        return hash(self.x * 97 + self.y * 101)
+
+
+def _time(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    """
+    Runs the benchmark on the points of a size x size grid
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=300)
+    args = parser.parse_args()
+    coordinates = [(x, y) for x in range(args.size) for y in range(args.size)]
+
+    print("{:<12} {:>12} {:>12} {:>14} {:>12} {:>10}".format(
+        "class", "alloc/point", "hash/point", "set add/point", "bytes/point", "hashes"))
+    for point_class in (LegacyPoint, Point):
+        alloc_time, points = _time(lambda: [point_class(x, y) for x, y in coordinates])
+        hash_time, hashes = _time(lambda: [hash(point) for point in points])
+        set_time, _ = _time(lambda: set(points))
+        size = sys.getsizeof(points[0])
+        if hasattr(points[0], '__dict__'):
+            size += sys.getsizeof(points[0].__dict__)
+        print("{:<12} {:>10.0f}ns {:>10.0f}ns {:>12.0f}ns {:>12} {:>10}".format(
+            point_class.__name__,
+            alloc_time / len(points) * 1e9,
+            hash_time / len(points) * 1e9,
+            set_time / len(points) * 1e9,
+            size,
+            len(set(hashes))))
+    print("({} points, the hashes column counts the distinct hash values)".format(len(coordinates)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Compares reproducing canvases by executing a text script with replaying its
+binary command log, from the beginning and from its last checkpoint
+
+    python -m bench.bench_replay [--size 500] [--commands 20000]
+"""
+
+import argparse
+import io
+import random
+import time
+
+from commandlog import CommandLogWriter, replay
+import main as main_module
+from pipeline import ScriptExecutor, compile_script
+from workspace import Workspace
+
+
+def random_script(size, count, seed=0):
+    """
+    Returns the lines of a script drawing `count` random lines and rectangles
+    and filling from random points on a size x size canvas
+    """
+    generator = random.Random(seed)
+    lines = ["C {} {}".format(size, size)]
+    for index in range(count):
+        coordinates = [generator.randrange(size) for _ in range(4)]
+        if index % 50 == 49:
+            lines.append("B {} {} {}".format(coordinates[0], coordinates[1],
+                                             generator.choice('o.#')))
+        elif index % 3 == 0:
+            # horizontal or vertical lines only
+            coordinates[index % 2] = coordinates[2 + index % 2]
+            lines.append("L {} {} {} {}".format(*coordinates))
+        else:
+            lines.append("{} {} {} {} {}".format('R' if index % 3 == 1 else 'F', *coordinates))
+    return [line + '\n' for line in lines]
+
+
+def _time(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    """
+    Runs the benchmark on a random script
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=500)
+    parser.add_argument('--commands', type=int, default=20000)
+    args = parser.parse_args()
+    script = random_script(args.size, args.commands)
+
+    workspace = Workspace()
+    log_file = io.BytesIO()
+    command_log = CommandLogWriter(log_file, workspace, args.commands // 4)
+    operations, _ = compile_script(script)
+    executor = ScriptExecutor(workspace=workspace, command_log=command_log)
+    for operation in operations:
+        executor.execute(operation)
+    command_log.close()
+    expected = str(workspace.current)
+
+    main_module.workspace = Workspace()
+    script_time, _ = _time(lambda: main_module.run_script(script, io.StringIO(), 'never'))
+    print("{:<24} {:>10.3f} s {:>12} bytes".format(
+        "text script", script_time, sum(len(line) for line in script)))
+    for name, from_checkpoint in (("log", False), ("log from checkpoint", True)):
+        log_file.seek(0)
+        replay_time, replayed = _time(lambda: replay(log_file, from_checkpoint=from_checkpoint))
+        assert str(replayed.current) == expected
+        print("{:<24} {:>10.3f} s {:>12} bytes".format(
+            name, replay_time, len(log_file.getvalue())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Runs the benchmark suite of the canvas operations and compares it with a baseline
+
+    python -m bench.run [--sizes 100 300 1000] [--repeat 5] [--output FILE]
+                        [--baseline bench/baseline.json] [--threshold 0.25]
+                        [--noise 0.001]
+
+Each case is timed --repeat times at each size, on a canvas prepared outside of
+the timing, and its minimum and median times are reported as JSON (to --output,
+or to the standard output). With --baseline, the minimum time of each case is
+compared with the one of the baseline file, a previous output of this runner:
+the run fails with exit status 1 if a case is more than --threshold slower
+(0.25 for 25%) and more than --noise seconds slower. The baseline file may hold
+a "thresholds" object overriding --threshold per case name, e.g.
+{"fill_maze": 0.5}.
+
+The timings depend on the machine: the baseline must be generated on the one
+the suite is run on, e.g. with --output bench/baseline.json.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+from bench.bench_fill import maze_canvas
+from canvas import Canvas, Line, Point, Rectangle
+
+UNDO_CHAIN_LENGTH = 100
+
+
+def _drawn_canvas(size):
+    canvas = Canvas(size, size)
+    canvas.draw_filled_rectangle(Rectangle(Point(0, 0), Point(size // 2, size // 2)))
+    return canvas
+
+
+def _undo_chain_canvas(size):
+    canvas = Canvas(size, size)
+    for index in range(UNDO_CHAIN_LENGTH):
+        canvas.draw_line(Line(Point(0, index % size), Point(size - 1, size - 1 - index % size)))
+    return canvas
+
+
+def _rendered_canvas(size):
+    canvas = Canvas(size, size)
+    str(canvas)
+    return canvas
+
+
+def _undo_chain(canvas):
+    for _ in range(UNDO_CHAIN_LENGTH):
+        canvas.undo()
+
+
+def _render_after_edit(canvas):
+    size = canvas.width
+    canvas.draw_line(Line(Point(0, size // 2), Point(size - 1, size // 2)))
+    str(canvas)
+
+
+def _draw_lines(canvas):
+    last = canvas.width - 1
+    canvas.draw_line(Line(Point(0, 0), Point(last, 0)))
+    canvas.draw_line(Line(Point(0, 0), Point(0, last)))
+    canvas.draw_line(Line(Point(0, 0), Point(last, last)))
+
+
+# name -> (function preparing the argument of the timed function from the
+# canvas size, timed function)
+CASES = {
+    'create': (lambda size: size, lambda size: Canvas(size, size)),
+    'line': (lambda size: Canvas(size, size), _draw_lines),
+    'rectangle': (lambda size: Canvas(size, size), lambda canvas: canvas.draw_rectangle(
+        Rectangle(Point(0, 0), Point(canvas.width - 1, canvas.height - 1)))),
+    'fill_open': (lambda size: Canvas(size, size),
+                  lambda canvas: canvas.bucket_fill(Point(0, 0), 'o')),
+    'fill_maze': (maze_canvas, lambda canvas: canvas.bucket_fill(Point(0, 0), 'o')),
+    'delete': (_drawn_canvas, lambda canvas: canvas.delete(Point(0, 0))),
+    'undo_chain': (_undo_chain_canvas, _undo_chain),
+    'render': (lambda size: Canvas(size, size), str),
+    'render_after_edit': (_rendered_canvas, _render_after_edit),
+}
+
+
+def run_suite(sizes, repeat, case_names=None):
+    """
+    Times the cases of the suite and returns their results
+
+    Args:
+        sizes: the sizes of the square canvases to run each case on
+        repeat: the number of times each case is timed
+        case_names: the names of the cases to run, all of them by default
+
+    Returns:
+        a dictionary of the {"min": seconds, "median": seconds} of each case,
+        by "name/size" key
+    """
+    results = {}
+    for name in case_names or CASES:
+        prepare, run = CASES[name]
+        for size in sizes:
+            timings = []
+            for _ in range(repeat):
+                argument = prepare(size)
+                start = time.perf_counter()
+                run(argument)
+                timings.append(time.perf_counter() - start)
+            results['{}/{}'.format(name, size)] = {
+                'min': min(timings), 'median': statistics.median(timings)}
+    return results
+
+
+def compare(results, baseline, threshold, noise=0.0):
+    """
+    Compares results with a baseline
+
+    Args:
+        results: the results returned by run_suite
+        baseline: a previous output of the runner
+        threshold: the maximum relative slowdown of a case, unless overridden by
+            the "thresholds" of the baseline
+        noise: the slowdown in seconds below which a case is never a regression,
+            since the shortest cases vary more than their threshold between runs
+
+    Returns:
+        the list of the (key, baseline time, time, ratio, whether it is a
+        regression) tuples of the cases of both the results and the baseline
+    """
+    thresholds = baseline.get('thresholds', {})
+    comparisons = []
+    for key, timing in sorted(results.items()):
+        baseline_timing = baseline['results'].get(key)
+        if baseline_timing is None:
+            continue
+        ratio = timing['min'] / baseline_timing['min']
+        case_threshold = thresholds.get(key.split('/')[0], threshold)
+        comparisons.append((key, baseline_timing['min'], timing['min'], ratio,
+                            ratio > 1 + case_threshold and
+                            timing['min'] - baseline_timing['min'] > noise))
+    return comparisons
+
+
+def main(argv=None):
+    """
+    Runs the suite, writes its JSON results and compares them with the baseline
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 300, 1000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES))
+    parser.add_argument('--output', metavar='FILE')
+    parser.add_argument('--baseline', metavar='FILE')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    parser.add_argument('--noise', type=float, default=0.001)
+    args = parser.parse_args(argv)
+
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'repeat': args.repeat,
+        'results': run_suite(args.sizes, args.repeat, args.cases),
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+            output.write('\n')
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = 0
+        for key, baseline_time, elapsed, ratio, is_regression in compare(
+                report['results'], baseline, args.threshold, args.noise):
+            regressions += is_regression
+            print("{:<28} {:10.4f} s {:10.4f} s {:6.2f}x{}".format(
+                key, baseline_time, elapsed, ratio, "  REGRESSION" if is_regression else ""),
+                  file=sys.stderr)
+        if regressions:
+            print("{} regressions".format(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,32 +2,249 @@
 This module defines the canvas and the shape objects of the application
 """
 
+from collections import namedtuple
 from enum import Enum
-from copy import deepcopy
+
+from components import ComponentIndex
+from history import DEFAULT_MAX_BYTES, UndoJournal
+from instrumentation import instrumented
+from lazy import PendingLog
+from parallel import ParallelEngine
+from render import CanvasRenderer
+from storage import COLUMN, ROW, DenseGrid, RunGrid, TiledGrid, dump_cells, load_cells
+
+SPARSE_CELLS_THRESHOLD = 16 * 1024 * 1024
+# the number of characters render_to() writes to its stream at once
+RENDER_CHUNK_SIZE = 1 << 16
 
 
 class Canvas(object):
     """
     Represents a canvas of arbitrary size to draw on
+
+    Args:
+        width, height: the size of the canvas
+        history_depth: the maximum number of actions that can be undone, None for no limit
+        history_bytes: the memory budget of the undo history, None for no limit
+        history_spill: whether the oldest undo history entries are moved to a
+            temporary file rather than forgotten when the memory budget is exceeded
+        grid: the storage holding the cells of the canvas, a new empty one by default
+        sparse: whether a new storage only allocates the parts of the canvas that
+            are drawn on, by default only canvases of more than
+            SPARSE_CELLS_THRESHOLD cells do
+        workers: the number of processes rendering and filling the canvas in
+            parallel, None to do it in the current process (see parallel.py).
+            A parallel canvas must be closed with close().
+        instrumentation: the Instrumentation the drawing, undo and rendering
+            calls are reported to, None to not report them (see instrumentation.py)
+        run_length: whether a new storage holds each row as runs of identical
+            cells, which suits canvases of mostly long lines and filled areas
+        lazy: whether the drawings are only applied when the cells they change
+            are read (see the lazy attribute)
     """
-    def __init__(self, width, height):
+    def __init__(self, width, height, history_depth=None, history_bytes=DEFAULT_MAX_BYTES,
+                 history_spill=False, grid=None, sparse=None, workers=None,
+                 instrumentation=None, run_length=False, lazy=False):
+        #pylint: disable=too-many-arguments
         self.width = int(width)
         self.height = int(height)
-        self.cells = [
-            [(CanvasCellContentType.Empty, ' ')
-             for i in range(self.width)]
-            for j in range(self.height)
-        ]
-        self._previous_states = []
+        self.instrumentation = instrumentation
+        self._parallel = None
+        if workers is not None:
+            if grid is not None or sparse or run_length:
+                raise ValueError("A parallel canvas uses its own dense storage")
+            self._parallel = ParallelEngine(self.width, self.height,
+                                            CanvasCellContentType.Empty.value,
+                                            EMPTY_COLOUR_CODE, int(workers))
+            grid = self._parallel.grid
+        if grid is None:
+            if sparse is None:
+                sparse = self.width * self.height > SPARSE_CELLS_THRESHOLD
+            grid_class = RunGrid if run_length else TiledGrid if sparse else DenseGrid
+            grid = grid_class(self.width, self.height,
+                              CanvasCellContentType.Empty.value, EMPTY_COLOUR_CODE)
+        elif (grid.width, grid.height) != (self.width, self.height):
+            raise ValueError("The storage size does not match the canvas size")
+        self._journal = UndoJournal(history_depth, history_bytes, history_spill)
+        self._set_grid(grid)
+        # the storage class of an evicted canvas, None while its cells are in memory
+        self._evicted_grid_class = None
+        self._pending = None
+        self.lazy = lazy
+
+    def _set_grid(self, grid):
+        self._grid = grid
+        self._components = ComponentIndex(self._grid)
+        self._renderer = self._parallel or CanvasRenderer(self._grid)
+
+    def close(self):
+        """
+        Release the processes and shared memory of a parallel canvas
+        """
+        if self._parallel is not None:
+            self._parallel.close()
+
+    @property
+    def last_cell_count(self):
+        """
+        The number of cells written by the latest drawing, undo or redo
+        """
+        return self._journal.last_cell_count
+
+    @property
+    def written_cell_count(self):
+        """
+        The number of cells written since the canvas was created, including the
+        ones a lazy canvas writes when its pending drawings are applied
+        """
+        return self._journal.written_cell_count
+
+    @property
+    def history_nbytes(self):
+        """
+        The number of bytes used by the undo history, in memory and spilled
+        """
+        return self._journal.nbytes + self._journal.spilled_bytes
+
+    @property
+    def history_enabled(self):
+        """
+        Whether the drawings are recorded in the undo history. While it is
+        False, each drawing clears the history instead and is not counted in
+        written_cell_count.
+        """
+        return self._journal.enabled
+
+    @history_enabled.setter
+    def history_enabled(self, value):
+        self._journal.enabled = value
+
+    @property
+    def lazy(self):
+        """
+        Whether the canvas is lazy: its drawings are then appended to a pending
+        log (see lazy.py) and only applied to the cells when they are read, by
+        render_to() for the region it renders, or by flush(). The cells read
+        are always the ones an eager canvas would have. Setting it to False
+        applies the pending drawings.
+        """
+        return self._pending is not None
+
+    @lazy.setter
+    def lazy(self, value):
+        if value and self._pending is None:
+            self._pending = PendingLog(self._journal, self._bucket_fill)
+        elif not value and self._pending is not None:
+            self.flush()
+            self._pending = None
+
+    def flush(self, region=None):
+        """
+        Apply the pending drawings of a lazy canvas to the cells of a region
+
+        Args:
+            region: the Rectangle of the cells to bring up to date, the whole
+                canvas by default
+        """
+        if self._pending:
+            self._pending.flush(self._grid, None if region is None else self._box(region))
+
+    def _box(self, rectangle):
+        # returns the (left, top, right, bottom) box of the cells of a rectangle
+        # within the canvas bounds, the right and bottom bounds being excluded
+        first, second = rectangle.top_left_point, rectangle.bottom_right_point
+        left = max(0, min(first.x, second.x))
+        right = max(left, min(self.width, max(first.x, second.x) + 1))
+        top = max(0, min(first.y, second.y))
+        bottom = max(top, min(self.height, max(first.y, second.y) + 1))
+        return left, top, right, bottom
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes used in memory by the cells and the undo history
+        """
+        grid_nbytes = self._grid.nbytes if self._grid is not None else 0
+        return grid_nbytes + self._journal.nbytes
+
+    @property
+    def is_evicted(self):
+        """
+        Whether the cells of the canvas have been moved to a file by evict()
+        """
+        return self._evicted_grid_class is not None
+
+    def evict(self, file):
+        """
+        Writes the cells of the canvas to a file in a compressed form (see
+        storage.dump_cells) and releases their storage: the canvas cannot be
+        used until restore() is called, but keeps its undo history
+
+        Args:
+            file: a binary file open for writing
+        """
+        if self._parallel is not None:
+            raise ValueError("A parallel canvas cannot be evicted")
+        self.dump(file)
+        self._evicted_grid_class = type(self._grid)
+        self._grid = self._components = self._renderer = None
+
+    def restore(self, file):
+        """
+        Reads back the cells of an evicted canvas, into the same kind of storage
+
+        Args:
+            file: a binary file open for reading, written by evict()
+        """
+        grid = self._evicted_grid_class(self.width, self.height,
+                                        CanvasCellContentType.Empty.value, EMPTY_COLOUR_CODE)
+        load_cells(file, grid)
+        self._evicted_grid_class = None
+        self._set_grid(grid)
+
+    def dump(self, file):
+        """
+        Writes the cells of the canvas to a file in a compressed form (see
+        storage.dump_cells), without its undo history
+
+        Args:
+            file: a binary file open for writing
+        """
+        self.flush()
+        dump_cells(self._grid, file)
+
+    @classmethod
+    def load_dump(cls, file, width, height, **kwargs):
+        """
+        Returns a canvas whose cells are read from a file written by dump()
+
+        Args:
+            file: a binary file open for reading
+            width, height: the size of the dumped canvas
+            kwargs: the other arguments of the canvas constructor
+        """
+        canvas = cls(width, height, **kwargs)
+        load_cells(file, canvas._grid)
+        return canvas
+
+    @property
+    def cells(self):
+        """
+        The cells of the canvas, indexed as cells[x][y] and holding
+        (CanvasCellContentType, colour) tuples
+        """
+        self.flush()
+        return CanvasCells(self._grid)
 
     def _draw_point(self, point):
-        self.cells[point.x][point.y] = (CanvasCellContentType.Line, 'x')
+        self._grid.set(point.x, point.y, CanvasCellContentType.Line.value, LINE_COLOUR_CODE)
 
     def _point_is_out_of_bound(self, point):
         x_is_out_of_canvas_bound = point.x < 0 or point.x >= self.width
         y_is_out_of_canvas_bound = point.y < 0 or point.y >= self.height
         return x_is_out_of_canvas_bound or y_is_out_of_canvas_bound
 
+    @instrumented
     def draw_line(self, line):
         """
         Draw a line on the canvas
@@ -38,13 +255,23 @@ class Canvas(object):
         if (self._point_is_out_of_bound(line.from_point) or
             self._point_is_out_of_bound(line.to_point)):
             raise OutOfCanvasBoundError()
-        self._save_state()
-        self._draw_line(line)
+        if self._pending is not None:
+            self._pending.append_draw([_run_box(run) for run in line.iter_runs()],
+                                      CanvasCellContentType.Line.value, LINE_COLOUR_CODE)
+            return
+        with self._journal.record(self._grid):
+            self._draw_line(line)
 
     def _draw_line(self, line):
-        for point in line.get_points():
-            self._draw_point(point)
-
+        for kind, fixed, start, stop in line.iter_runs():
+            if kind == ROW:
+                self._grid.fill_span(fixed, start, stop,
+                                     CanvasCellContentType.Line.value, LINE_COLOUR_CODE)
+            else:
+                self._grid.fill_column(fixed, start, stop,
+                                       CanvasCellContentType.Line.value, LINE_COLOUR_CODE)
+
+    @instrumented
     def draw_rectangle(self, rectangle):
         """
         Draw a rectangle on the canvas
@@ -55,10 +282,38 @@ class Canvas(object):
         if (self._point_is_out_of_bound(rectangle.top_left_point) or
             self._point_is_out_of_bound(rectangle.bottom_right_point)):
             raise OutOfCanvasBoundError()
-        self._save_state()
-        for line in rectangle.get_lines():
-            self._draw_line(line)
+        if self._pending is not None:
+            self._pending.append_draw([_run_box(run) for line in rectangle.get_lines()
+                                       for run in line.iter_runs()],
+                                      CanvasCellContentType.Line.value, LINE_COLOUR_CODE)
+            return
+        with self._journal.record(self._grid):
+            for line in rectangle.get_lines():
+                self._draw_line(line)
+
+    @instrumented
+    def draw_filled_rectangle(self, rectangle):
+        """
+        Draw a rectangle and fill its inside with the same content
 
+        Args:
+            rectangle: the rectangle to be drawn on the canvas
+        """
+        if (self._point_is_out_of_bound(rectangle.top_left_point) or
+            self._point_is_out_of_bound(rectangle.bottom_right_point)):
+            raise OutOfCanvasBoundError()
+        start_x, stop_x = sorted((rectangle.top_left_point.x, rectangle.bottom_right_point.x))
+        start_y, stop_y = sorted((rectangle.top_left_point.y, rectangle.bottom_right_point.y))
+        if self._pending is not None:
+            self._pending.append_draw([(start_x, start_y, stop_x + 1, stop_y + 1)],
+                                      CanvasCellContentType.Line.value, LINE_COLOUR_CODE)
+            return
+        with self._journal.record(self._grid):
+            for y in range(start_y, stop_y + 1):
+                self._grid.fill_span(y, start_x, stop_x + 1,
+                                     CanvasCellContentType.Line.value, LINE_COLOUR_CODE)
+
+    @instrumented
     def bucket_fill(self, point, colour):
         """
         Paint a shape or a zone of the canvas with an arbitrary colour
@@ -69,74 +324,275 @@ class Canvas(object):
         """
         if self._point_is_out_of_bound(point):
             raise OutOfCanvasBoundError()
-        self._save_state()
-        self._bucket_fill(point, colour)
+        colour_code(colour)
+        if self._pending is not None:
+            self._pending.append_fill(point, colour)
+            return
+        with self._journal.record(self._grid):
+            self._bucket_fill(point, colour)
 
     def _bucket_fill(self, point, colour, reset_content_type=False):
-        content_type_to_fill, _ = self.cells[point.x][point.y]
-        processed = set()
-        to_process = [point]
-
-        def can_process_cell(cell):
+        grid = self._grid
+        type_to_fill, _ = grid.get(point.x, point.y)
+        new_type = CanvasCellContentType.Empty.value if reset_content_type else type_to_fill
+        new_colour = colour_code(colour)
+        if self._parallel is not None:
+            self._parallel.bucket_fill(point.x, point.y, new_type, new_colour)
+            return
+        known_runs = self._components.find(point.x, point.y)
+        if known_runs is not None:
+            for y, start, stop in known_runs:
+                grid.fill_span(y, start, stop, new_type, new_colour)
+        else:
+            runs = self._flood_fill(point, type_to_fill, new_type, new_colour)
+        # a fill only changes the colour of the cells, so the known components
+        # are unchanged, whereas a deletion makes the index stale
+        if not reset_content_type:
+            self._components.validate()
+            if known_runs is None:
+                self._components.add(runs)
+
+    def _flood_fill(self, point, type_to_fill, new_type, new_colour):
+        # Scanline fill: each popped seed is extended to the whole run of cells of
+        # the same content type on its row, the run is painted with one slice
+        # write, and one seed per run is queued on the rows above and below.
+        # `unvisited_rows` is the visited bitmap, built lazily one row at a time:
+        # it holds 1 for the cells of the filled content type not painted yet.
+        # Returns the (y, start, stop) painted runs.
+        grid = self._grid
+        width, height = self.width, self.height
+        type_to_fill_mask = bytes(int(code == type_to_fill) for code in range(256))
+        unvisited_rows = {}
+        runs = []
+
+        def get_unvisited_row(y):
             #pylint: disable=missing-docstring
-            return (cell not in processed and
-                    cell not in to_process and
-                    not self._point_is_out_of_bound(cell))
-
-        while to_process != []:
-            current_point = to_process.pop()
-            processed.add(current_point)
-
-            current_point_type, _ = self.cells[current_point.x][current_point.y]
-            if current_point_type == content_type_to_fill:
-                if reset_content_type:
-                    self.cells[current_point.x][current_point.y] = (CanvasCellContentType.Empty, colour)
-                else:
-                    self.cells[current_point.x][current_point.y] = (content_type_to_fill, colour)
-                #enqueue non processed neighbours
-                left_neighbour = Point(current_point.x - 1, current_point.y)
-                if can_process_cell(left_neighbour):
-                    to_process.insert(0, left_neighbour)
-                right_neighbour = Point(current_point.x + 1, current_point.y)
-                if can_process_cell(right_neighbour):
-                    to_process.insert(0, right_neighbour)
-                top_neighbour = Point(current_point.x, current_point.y - 1)
-                if can_process_cell(top_neighbour):
-                    to_process.insert(0, top_neighbour)
-                bottom_neighbour = Point(current_point.x, current_point.y + 1)
-                if can_process_cell(bottom_neighbour):
-                    to_process.insert(0, bottom_neighbour)
-
+            row = unvisited_rows.get(y)
+            if row is None:
+                row = bytearray(grid.row_types(y).translate(type_to_fill_mask))
+                unvisited_rows[y] = row
+            return row
+
+        seeds = [(point.x, point.y)]
+        while seeds:
+            x, y = seeds.pop()
+            row = get_unvisited_row(y)
+            if not row[x]:
+                continue
+            start = row.rfind(0, 0, x) + 1
+            stop = row.find(0, x)
+            if stop == -1:
+                stop = width
+            row[start:stop] = bytes(stop - start)
+            grid.fill_span(y, start, stop, new_type, new_colour)
+            runs.append((y, start, stop))
+            for neighbour_y in (y - 1, y + 1):
+                if 0 <= neighbour_y < height:
+                    neighbour_row = get_unvisited_row(neighbour_y)
+                    run_start = neighbour_row.find(1, start, stop)
+                    while run_start != -1:
+                        seeds.append((run_start, neighbour_y))
+                        run_stop = neighbour_row.find(0, run_start, stop)
+                        if run_stop == -1:
+                            break
+                        run_start = neighbour_row.find(1, run_stop, stop)
+        return runs
+
+    @instrumented
     def delete(self, point):
         """
         Delete a shape or reset the colour of a zone
         """
         if self._point_is_out_of_bound(point):
             raise OutOfCanvasBoundError()
-        self._save_state()
-        self._bucket_fill(point, ' ', reset_content_type=True)
+        if self._pending is not None:
+            self._pending.append_fill(point, ' ', is_deletion=True)
+            return
+        with self._journal.record(self._grid):
+            self._bucket_fill(point, ' ', reset_content_type=True)
 
+    @instrumented
     def undo(self):
         """
         Undo the last action
         """
-        if self._previous_states != []:
-            self.cells = self._previous_states.pop()
+        self.flush()
+        self._journal.undo(self._grid)
+
+    @instrumented
+    def redo(self):
+        """
+        Redo the last undone action
+        """
+        self.flush()
+        self._journal.redo(self._grid)
+
+    def save(self, path):
+        """
+        Save the canvas cells to a file
+
+        Args:
+            path: the path of the file to write
+        """
+        self.flush()
+        self._grid.save(path)
 
-    def _save_state(self):
-        self._previous_states.append(deepcopy(self.cells))
+    def clone(self):
+        """
+        Returns an independent copy of the canvas and of its undo history
+
+        The copy shares the storage of the canvas, whose parts are only
+        duplicated when either canvas first modifies them (see storage.py), and
+        the changes recorded in its history. The copy of a parallel canvas is
+        not parallel and gets a copy of its cells at once.
+        """
+        self.flush()
+        canvas = Canvas(self.width, self.height, grid=self._grid.copy(),
+                        instrumentation=self.instrumentation, lazy=self.lazy)
+        canvas._journal = self._journal.copy()
+        return canvas
+
+    def __deepcopy__(self, memo):
+        return self.clone()
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """
+        Returns a canvas whose cells are loaded from a file written by save().
+        The file is memory-mapped, so its content is only read when accessed.
+
+        Args:
+            path: the path of the file to read
+            kwargs: the other arguments of the canvas constructor
+        """
+        grid = DenseGrid.load(path)
+        return cls(grid.width, grid.height, grid=grid, **kwargs)
 
+    @instrumented
+    def take_changed_rows(self):
+        """
+        Returns the rows modified since the previous call, as a list of
+        (y, previous cells, cells) tuples sorted by y, where the cells are the
+        text of the row without its frame and the previous cells may be None
+        when unknown. The first call returns every row. See diff.py.
+        """
+        self.flush()
+        return self._renderer.take_changed_rows()
+
+    @instrumented
+    def render_to(self, stream, region=None):
+        """
+        Write the text representation of the canvas to a text stream: the same
+        text as str(canvas), without a final line terminator, but rendered from
+        the cells in chunks of rows rather than built as a single string
+
+        Args:
+            stream: the text stream to write to
+            region: the Rectangle of the cells to render, clipped to the canvas
+                bounds, the whole canvas by default
+        """
+        left, top, right, bottom = 0, 0, self.width, self.height
+        if region is not None:
+            left, top, right, bottom = self._box(region)
+        self.flush(region)
+        border = ' ' + '-' * (right - left) + ' '
+        lines = [border]
+        length = len(border)
+        for y in range(top, bottom):
+            if length >= RENDER_CHUNK_SIZE:
+                stream.write('\n'.join(lines) + '\n')
+                lines = []
+                length = 0
+            row = '|' + self._grid.row_colours(y, left, right).decode('latin-1') + '|'
+            lines.append(row)
+            length += len(row) + 1
+        lines.append(border)
+        stream.write('\n'.join(lines))
+
+    @instrumented
     def __str__(self):
-        #pylint: disable=invalid-name
-        canvas_str = ' ' + '-' * self.width + ' \n'
-        for y in range(self.height):
-            canvas_str += '|'
-            for x in range(self.width):
-                _, colour = self.cells[x][y]
-                canvas_str += colour
-            canvas_str += '|' + '\n'
-        canvas_str += ' ' + '-' * self.width + ' '
-        return canvas_str
+        self.flush()
+        return self._renderer.render()
+
+
+def _run_box(run):
+    # returns the (left, top, right, bottom) box of the cells of a run of
+    # Line.iter_runs(), the right and bottom bounds being excluded
+    kind, fixed, start, stop = run
+    if kind == ROW:
+        return start, fixed, stop, fixed + 1
+    return fixed, start, fixed + 1, stop
+
+
+class CanvasCells(object):
+    """
+    Gives access to the cells of a canvas storage as cells[x][y]
+
+    Args:
+        grid: the storage holding the cells
+    """
+    def __init__(self, grid):
+        self._grid = grid
+
+    def __getitem__(self, x):
+        return CanvasCellsColumn(self._grid, x)
+
+    def __len__(self):
+        return self._grid.width
+
+    def __eq__(self, other):
+        if not isinstance(other, CanvasCells):
+            return NotImplemented
+        return self._grid == other._grid
+
+    def __deepcopy__(self, memo):
+        return CanvasCells(self._grid.copy())
+
+
+class CanvasCellsColumn(object):
+    """
+    Gives access to the cells of a single column of a canvas storage
+
+    Args:
+        grid: the storage holding the cells
+        x: the index of the column
+    """
+    def __init__(self, grid, x):
+        self._grid = grid
+        self._x = x
+
+    def __getitem__(self, y):
+        self._check_bounds(y)
+        type_code, colour = self._grid.get(self._x, y)
+        return CanvasCellContentType(type_code), chr(colour)
+
+    def __setitem__(self, y, cell):
+        self._check_bounds(y)
+        content_type, colour = cell
+        self._grid.set(self._x, y, content_type.value, colour_code(colour))
+
+    def __len__(self):
+        return self._grid.height
+
+    def _check_bounds(self, y):
+        if not (0 <= self._x < self._grid.width and 0 <= y < self._grid.height):
+            raise IndexError("cell index out of range")
+
+
+def colour_code(colour):
+    """
+    Returns the code under which a colour is stored in the canvas cells
+
+    Args:
+        colour: a single character colour
+    """
+    try:
+        code = colour.encode('latin-1')
+    except (AttributeError, UnicodeEncodeError) as ex:
+        raise ValueError("Colour must be a single latin-1 character") from ex
+    if len(code) != 1:
+        raise ValueError("Colour must be a single latin-1 character")
+    return code[0]
 
 
 class CanvasCellContentType(Enum):
@@ -147,29 +603,29 @@ class CanvasCellContentType(Enum):
     Line = 2
 
 
+EMPTY_COLOUR_CODE = ord(' ')
+LINE_COLOUR_CODE = ord('x')
+
+
 class OutOfCanvasBoundError(Exception):
     #pylint: disable=missing-docstring
     pass
 
 
-class Point(object):
-    #pylint: disable=too-few-public-methods
+class Point(namedtuple('Point', ['x', 'y'])):
     """
     Represents a point of the canvas
 
+    Points are immutable tuples: they hash and compare as their (x, y) coordinates.
+
     Args:
         x, y: the integer coordinates of the point
     """
-    def __init__(self, x, y):
-        #pylint: disable=invalid-name
-        self.x = int(x)
-        self.y = int(y)
+    __slots__ = ()
 
-    def __eq__(self, other):
-        return self.x == other.x and self.y == other.y
-
-    def __hash__(self):
-        return hash(self.x * 97 + self.y * 101)
+    def __new__(cls, x, y):
+        #pylint: disable=invalid-name
+        return tuple.__new__(cls, (int(x), int(y)))
 
 
 class Line(object):
@@ -191,12 +647,63 @@ class Line(object):
         """
             Returns the list of the points that are part of the line
         """
+        return [Point(x, y) for x, y in self.iter_coordinates()]
+
+    def iter_coordinates(self):
+        #pylint: disable=invalid-name
+        """
+        Generates the (x, y) coordinates of the cells of the line, from its first
+        point to its last one, using Bresenham's algorithm for sloped lines
+        """
+        x, y = self.from_point.x, self.from_point.y
+        to_x, to_y = self.to_point.x, self.to_point.y
+        dx, dy = abs(to_x - x), -abs(to_y - y)
+        step_x = 1 if x <= to_x else -1
+        step_y = 1 if y <= to_y else -1
+        error = dx + dy
+        while True:
+            yield x, y
+            if x == to_x and y == to_y:
+                return
+            double_error = 2 * error
+            if double_error >= dy:
+                error += dy
+                x += step_x
+            if double_error <= dx:
+                error += dx
+                y += step_y
+
+    def iter_runs(self):
+        """
+        Generates the cells of the line grouped in runs of consecutive cells
+        of a row or of a column, as (ROW, y, start_x, stop_x) or
+        (COLUMN, x, start_y, stop_y) tuples where stop is excluded
+        """
+        from_point, to_point = self.from_point, self.to_point
         if self._is_horizontal():
-            return [Point(self.from_point.x, y) for y in range(self.from_point.y, self.to_point.y + 1)]
-        elif self._is_vertical():
-            return [Point(x, self.from_point.y) for x in range(self.from_point.x, self.to_point.x + 1)]
+            start, stop = sorted((from_point.y, to_point.y))
+            yield COLUMN, from_point.x, start, stop + 1
+            return
+        if self._is_vertical():
+            start, stop = sorted((from_point.x, to_point.x))
+            yield ROW, from_point.y, start, stop + 1
+            return
+        # a line closer to the horizontal has at most one cell per column, so
+        # it is made of runs along rows, and conversely
+        if abs(to_point.x - from_point.x) >= abs(to_point.y - from_point.y):
+            kind, fixed_index, moving_index = ROW, 1, 0
         else:
-            raise NotImplementedError("Only horizontal and vertical lines are implemented so far")
+            kind, fixed_index, moving_index = COLUMN, 0, 1
+        coordinates = self.iter_coordinates()
+        first = next(coordinates)
+        fixed, start = first[fixed_index], first[moving_index]
+        last = start
+        for coordinate in coordinates:
+            if coordinate[fixed_index] != fixed:
+                yield kind, fixed, min(start, last), max(start, last) + 1
+                fixed, start = coordinate[fixed_index], coordinate[moving_index]
+            last = coordinate[moving_index]
+        yield kind, fixed, min(start, last), max(start, last) + 1
 
     def _is_horizontal(self):
         return self.from_point.x == self.to_point.x
@@ -0,0 +1,546 @@
+"""
+This module defines the binary command log of a workspace and its replay
+
+The log records the operations executed on the canvases of a workspace (see
+pipeline.py) so that the canvases can be reproduced later, faster than by
+executing their command lines again. It starts with a LOG_HEADER, followed by
+records made of a one byte opcode and of its arguments, each an unsigned
+integer encoded as a varint (7 bits per byte, least significant first):
+
+- OP_CREATE width height, OP_NEW name width height, OP_SWITCH name: the C, N
+  and W commands creating or switching canvases;
+- OP_LINE, OP_RECTANGLE, OP_FILLED_RECTANGLE x1 y1 x2 y2: the L, R and F draws;
+- OP_FILL x y colour, OP_DELETE x y: the B and D commands, the colour being
+  its code;
+- OP_UNDO, OP_REDO: the U and Y commands;
+- OP_CANVAS name width height length dump: adds a canvas under a name, with an
+  empty undo history and the cells of a dump of `length` bytes (see
+  Canvas.dump), which is how the canvases opened by O commands are logged;
+- OP_CHECKPOINT count name: a checkpoint, followed by `count` OP_CANVAS records
+  holding every canvas of the workspace, `name` being the current one;
+- OP_END offset magic: the end of the log, `offset` being the position of its
+  last checkpoint, or 0 if there is none, as a fixed width 64-bit integer.
+
+The names are varint lengths followed by UTF-8 bytes. The commands that do not
+change the canvases (P, T, A, Q) and the saves are not logged.
+
+A log can be replayed from its start, or from its last checkpoint when it has
+been closed: the canvases of that checkpoint are then loaded, and only the
+records after it are executed. Since a checkpoint does not hold the undo
+histories, a new checkpoint is written after any undo or redo that reaches an
+action made before the previous checkpoint.
+
+Recording the undo history takes about half of the time of the drawings, so
+when the file is seekable, the replay first reads the records to find the
+actions a later undo record reverts, and only records those and the ones after
+the last checkpoint in the undo histories. Each action that is not recorded
+clears the history of its canvas, so the replayed canvases can undo the actions
+made after the last checkpoint, but not always the earlier ones, whether the log
+is replayed from its start or from that checkpoint.
+"""
+
+import io
+import struct
+
+from canvas import Canvas, Line, Point, Rectangle, colour_code
+from pipeline import (
+    BucketFill,
+    CreateCanvas,
+    Delete,
+    DrawFilledRectangle,
+    DrawLine,
+    DrawRectangle,
+    Exit,
+    ListCanvases,
+    NewCanvas,
+    OpenCanvas,
+    Print,
+    Redo,
+    SaveCanvas,
+    Stats,
+    SwitchCanvas,
+    Undo
+)
+from workspace import DEFAULT_NAME, Workspace
+
+LOG_MAGIC = b'PYCANLOG'
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct('<8sI')
+DEFAULT_CHECKPOINT_EVERY = 10000
+# the number of bytes buffered by the writer, and read at once by the replay
+LOG_BUFFER_SIZE = 1 << 20
+
+OP_CREATE = 1
+OP_NEW = 2
+OP_SWITCH = 3
+OP_LINE = 4
+OP_RECTANGLE = 5
+OP_FILLED_RECTANGLE = 6
+OP_FILL = 7
+OP_DELETE = 8
+OP_UNDO = 9
+OP_REDO = 10
+OP_CANVAS = 11
+OP_CHECKPOINT = 12
+OP_END = 13
+
+_END = struct.Struct('<BQ8s')
+# the opcode of the draws of each operation type
+_DRAW_OPCODES = {
+    DrawLine: OP_LINE,
+    DrawRectangle: OP_RECTANGLE,
+    DrawFilledRectangle: OP_FILLED_RECTANGLE
+}
+# the number of arguments of the records of the actions that can be undone
+_ACTION_ARGUMENT_COUNTS = {
+    OP_LINE: 4,
+    OP_RECTANGLE: 4,
+    OP_FILLED_RECTANGLE: 4,
+    OP_FILL: 3,
+    OP_DELETE: 2
+}
+# the operation types not changing the canvases, that are not logged
+_UNLOGGED_TYPES = frozenset((ListCanvases, SaveCanvas, Print, Stats, Exit))
+
+
+class CommandLogWriter(object):
+    """
+    Writes the operations executed on the canvases of a workspace to a log
+
+    A checkpoint is written first if the workspace already has canvases.
+
+    Args:
+        file: a binary file open for writing
+        workspace: the workspace the operations are executed on
+        checkpoint_every: the number of records between 2 checkpoints, None to
+            only write the required ones
+    """
+    def __init__(self, file, workspace, checkpoint_every=DEFAULT_CHECKPOINT_EVERY):
+        self.file = file
+        self.workspace = workspace
+        self.checkpoint_every = checkpoint_every
+        self._buffer = bytearray(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION))
+        self._offset = 0
+        self._last_checkpoint = 0
+        self._record_count = 0
+        # name -> [the number of actions that can be undone, and redone, since
+        # the last checkpoint] for each canvas
+        self._histories = {}
+        if len(workspace):
+            self.checkpoint()
+
+    def write(self, operation):
+        """
+        Logs an operation once it has been executed successfully
+
+        Args:
+            operation: the operation, as compiled by pipeline.compile_script()
+
+        Raises:
+            TypeError: if the operation cannot be logged
+        """
+        #pylint: disable=too-many-branches
+        operation_type = type(operation)
+        name = self.workspace.current_name
+        history = self._histories.setdefault(name, [0, 0])
+        checkpoint_needed = False
+        if operation_type in _DRAW_OPCODES:
+            self._record(_DRAW_OPCODES[operation_type], *_corners(operation))
+            history[:] = history[0] + 1, 0
+        elif operation_type is BucketFill:
+            self._record(OP_FILL, operation.point.x, operation.point.y,
+                         colour_code(operation.colour))
+            history[:] = history[0] + 1, 0
+        elif operation_type is Delete:
+            self._record(OP_DELETE, operation.point.x, operation.point.y)
+            history[:] = history[0] + 1, 0
+        elif operation_type in (Undo, Redo):
+            self._record(OP_UNDO if operation_type is Undo else OP_REDO)
+            done, undone = (0, 1) if operation_type is Undo else (1, 0)
+            if history[done] == 0:
+                checkpoint_needed = True
+            else:
+                history[done] -= 1
+                history[undone] += 1
+        elif operation_type is CreateCanvas:
+            self._record(OP_CREATE, operation.width, operation.height)
+            self._histories[name] = [0, 0]
+        elif operation_type is NewCanvas:
+            self._record(OP_NEW, _text(operation.name), operation.width, operation.height)
+            self._histories[name] = [0, 0]
+        elif operation_type is SwitchCanvas:
+            self._record(OP_SWITCH, _text(operation.name))
+        elif operation_type is OpenCanvas:
+            self._write_canvas(name, self.workspace.current)
+            self._histories[name] = [0, 0]
+        elif operation_type in _UNLOGGED_TYPES:
+            return
+        else:
+            raise TypeError("Cannot log the operation: {!r}".format(operation))
+        if checkpoint_needed or (self.checkpoint_every is not None and
+                                 self._record_count >= self.checkpoint_every):
+            self.checkpoint()
+
+    def checkpoint(self):
+        """
+        Writes a checkpoint holding the cells of every canvas of the workspace
+        """
+        workspace = self.workspace
+        current_name = workspace.current_name
+        self._last_checkpoint = self._offset + len(self._buffer)
+        self._record(OP_CHECKPOINT, len(workspace), _text(current_name or ''))
+        for name in workspace.sizes():
+            self._write_canvas(name, workspace.get(name))
+        if current_name is not None:
+            # restores the recency of the current canvas and the memory budget
+            workspace.switch(current_name)
+        self._histories = {name: [0, 0] for name in workspace.sizes()}
+        self._record_count = 0
+
+    def flush(self):
+        """
+        Writes the buffered records to the file
+        """
+        self.file.write(self._buffer)
+        self._offset += len(self._buffer)
+        self._buffer = bytearray()
+
+    def close(self):
+        """
+        Ends the log, which can then be replayed from its last checkpoint, and
+        flushes it. The file is not closed.
+        """
+        self._buffer += _END.pack(OP_END, self._last_checkpoint, LOG_MAGIC)
+        self.flush()
+        self.file.flush()
+
+    def _record(self, opcode, *args):
+        buffer = self._buffer
+        buffer.append(opcode)
+        for arg in args:
+            if isinstance(arg, bytes):
+                _append_varint(buffer, len(arg))
+                buffer += arg
+            else:
+                _append_varint(buffer, arg)
+        self._record_count += 1
+        if len(buffer) >= LOG_BUFFER_SIZE:
+            self.flush()
+
+    def _write_canvas(self, name, canvas):
+        dump = io.BytesIO()
+        canvas.dump(dump)
+        self._record(OP_CANVAS, _text(name), canvas.width, canvas.height, dump.getvalue())
+
+
+def replay(file, workspace=None, from_checkpoint=True, instrumentation=None):
+    """
+    Executes the operations of a log on the canvases of a workspace, without
+    rendering them. The replayed canvases can undo the actions made after the
+    last checkpoint of the log, but not always the earlier ones.
+
+    Args:
+        file: a binary file open for reading, positioned at the start of a log
+        workspace: the workspace the canvases of the log are added to, a new
+            one by default
+        from_checkpoint: whether to start from the last checkpoint of the log
+            when the file is seekable and the log has been closed
+        instrumentation: the Instrumentation given to the canvases the log
+            creates, None to not report their calls
+
+    Returns:
+        the workspace
+
+    Raises:
+        ValueError: if the file is not a valid log
+    """
+    if workspace is None:
+        workspace = Workspace()
+    reader = _LogReader(file)
+    header = reader.read(LOG_HEADER.size)
+    if len(header) < LOG_HEADER.size or LOG_HEADER.unpack(header) != (LOG_MAGIC, LOG_VERSION):
+        raise ValueError("Not a command log")
+    offset = _last_checkpoint(file) if from_checkpoint else 0
+    recorded_actions = None
+    if file.seekable():
+        reader.seek(offset or LOG_HEADER.size)
+        recorded_actions = _recorded_actions(reader, workspace.current_name)
+        reader.seek(offset or LOG_HEADER.size)
+    elif offset:
+        reader.seek(offset)
+    _replay_records(reader, workspace, recorded_actions, instrumentation)
+    return workspace
+
+
+def _replay_records(reader, workspace, recorded_actions, instrumentation):
+    #pylint: disable=too-many-branches
+    canvas = workspace.current
+    varint = reader.varint
+    action = 0
+    while True:
+        opcode = reader.opcode()
+        if opcode is None or opcode == OP_END:
+            return
+        if opcode in _ACTION_ARGUMENT_COUNTS:
+            if recorded_actions is None or recorded_actions(action):
+                _replay_action(canvas, opcode, varint)
+            else:
+                canvas.history_enabled = False
+                try:
+                    _replay_action(canvas, opcode, varint)
+                finally:
+                    canvas.history_enabled = True
+            action += 1
+        elif opcode == OP_UNDO:
+            canvas.undo()
+        elif opcode == OP_REDO:
+            canvas.redo()
+        elif opcode in (OP_CREATE, OP_NEW):
+            name = reader.text() if opcode == OP_NEW else None
+            canvas = Canvas(varint(), varint(), instrumentation=instrumentation)
+            workspace.add(name or workspace.current_name or DEFAULT_NAME, canvas)
+        elif opcode == OP_SWITCH:
+            workspace.switch(reader.text())
+            canvas = workspace.current
+        elif opcode == OP_CANVAS:
+            name = reader.text()
+            width, height = varint(), varint()
+            canvas = Canvas.load_dump(io.BytesIO(reader.read(varint())), width, height,
+                                      instrumentation=instrumentation)
+            workspace.add(name, canvas)
+        elif opcode == OP_CHECKPOINT:
+            canvas = _replay_checkpoint(reader, workspace, instrumentation)
+        else:
+            raise ValueError("Invalid command log opcode: {}".format(opcode))
+
+
+def _replay_action(canvas, opcode, varint):
+    if opcode == OP_LINE:
+        canvas.draw_line(Line(Point(varint(), varint()), Point(varint(), varint())))
+    elif opcode == OP_RECTANGLE:
+        canvas.draw_rectangle(Rectangle(Point(varint(), varint()),
+                                        Point(varint(), varint())))
+    elif opcode == OP_FILLED_RECTANGLE:
+        canvas.draw_filled_rectangle(Rectangle(Point(varint(), varint()),
+                                               Point(varint(), varint())))
+    elif opcode == OP_FILL:
+        canvas.bucket_fill(Point(varint(), varint()), chr(varint()))
+    elif opcode == OP_DELETE:
+        canvas.delete(Point(varint(), varint()))
+
+
+def _recorded_actions(reader, current_name):
+    """
+    Reads the records of a log without executing them, and returns a function
+    telling whether an action, given by its index among the draws, fills and
+    deletions of the log, has to be recorded in the undo history of its canvas:
+    whether a later undo record reverts it or it follows the last checkpoint
+    """
+    #pylint: disable=too-many-branches
+    # name -> (the actions that can be undone, the ones that can be redone)
+    histories = {}
+    reverted_actions = set()
+    last_checkpoint_action = 0
+    action = 0
+    varint = reader.varint
+    while True:
+        opcode = reader.opcode()
+        if opcode is None or opcode == OP_END:
+            break
+        if opcode in _ACTION_ARGUMENT_COUNTS:
+            for _ in range(_ACTION_ARGUMENT_COUNTS[opcode]):
+                varint()
+            done, undone = histories.setdefault(current_name, ([], []))
+            done.append(action)
+            undone.clear()
+            action += 1
+        elif opcode in (OP_UNDO, OP_REDO):
+            done, undone = histories.setdefault(current_name, ([], []))
+            if opcode == OP_UNDO and done:
+                reverted_actions.add(done[-1])
+                undone.append(done.pop())
+            elif opcode == OP_REDO and undone:
+                done.append(undone.pop())
+        elif opcode in (OP_CREATE, OP_NEW):
+            if opcode == OP_NEW:
+                current_name = reader.text()
+            current_name = current_name or DEFAULT_NAME
+            _skip_size(varint)
+            histories[current_name] = ([], [])
+        elif opcode == OP_SWITCH:
+            current_name = reader.text()
+        elif opcode == OP_CANVAS:
+            current_name = reader.text()
+            _skip_size(varint)
+            reader.read(varint())
+            histories[current_name] = ([], [])
+        elif opcode == OP_CHECKPOINT:
+            is_start = reader.record_count == 1
+            count, name = varint(), reader.text()
+            for _ in range(count):
+                if reader.opcode() != OP_CANVAS:
+                    raise ValueError("Invalid command log checkpoint")
+                canvas_name = reader.text()
+                _skip_size(varint)
+                reader.read(varint())
+                if is_start:
+                    histories[canvas_name] = ([], [])
+            if is_start and name:
+                current_name = name
+            last_checkpoint_action = action
+        else:
+            raise ValueError("Invalid command log opcode: {}".format(opcode))
+    return lambda index: index >= last_checkpoint_action or index in reverted_actions
+
+
+def _skip_size(varint):
+    # reads the width and height of a record
+    varint()
+    varint()
+
+
+def _replay_checkpoint(reader, workspace, instrumentation):
+    # loads the canvases of a checkpoint if it is the first record replayed,
+    # and skips them otherwise since the workspace already holds them
+    is_start = reader.record_count == 1
+    count, current_name = reader.varint(), reader.text()
+    for _ in range(count):
+        if reader.opcode() != OP_CANVAS:
+            raise ValueError("Invalid command log checkpoint")
+        name = reader.text()
+        width, height = reader.varint(), reader.varint()
+        dump = reader.read(reader.varint())
+        if is_start:
+            workspace.add(name, Canvas.load_dump(io.BytesIO(dump), width, height,
+                                                 instrumentation=instrumentation))
+    if is_start and current_name:
+        workspace.switch(current_name)
+    return workspace.current
+
+
+def _last_checkpoint(file):
+    # returns the offset of the last checkpoint of a closed log, 0 if there is
+    # none or if it cannot be found
+    try:
+        position = file.tell()
+        file.seek(-_END.size, io.SEEK_END)
+        end = file.read(_END.size)
+        file.seek(position)
+    except (AttributeError, OSError):
+        return 0
+    opcode, offset, magic = _END.unpack(end)
+    if opcode != OP_END or magic != LOG_MAGIC:
+        return 0
+    return offset
+
+
+class _LogReader(object):
+    """
+    Reads the records of a log from a file in chunks of LOG_BUFFER_SIZE bytes
+    """
+    def __init__(self, file):
+        self.record_count = 0
+        self._file = file
+        self._buffer = b''
+        self._position = 0
+        self._start = file.tell() if file.seekable() else 0
+
+    def seek(self, offset):
+        """
+        Moves to an offset from the start of the log, from which the records
+        are counted again
+        """
+        self._file.seek(self._start + offset)
+        self._buffer = b''
+        self._position = 0
+        self.record_count = 0
+
+    def opcode(self):
+        """
+        Returns the opcode of the next record, None at the end of the file
+        """
+        if self._position >= len(self._buffer) and not self._fill(1):
+            return None
+        self.record_count += 1
+        self._position += 1
+        return self._buffer[self._position - 1]
+
+    def varint(self):
+        """
+        Returns the next varint
+        """
+        buffer, position = self._buffer, self._position
+        if position >= len(buffer):
+            if not self._fill(1):
+                raise ValueError("Truncated command log")
+            buffer, position = self._buffer, self._position
+        byte = buffer[position]
+        if byte < 0x80:
+            self._position = position + 1
+            return byte
+        value, shift = 0, 0
+        while True:
+            if position >= len(buffer):
+                self._position = position
+                if not self._fill(1):
+                    raise ValueError("Truncated command log")
+                buffer, position = self._buffer, self._position
+            byte = buffer[position]
+            position += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                self._position = position
+                return value
+            shift += 7
+
+    def text(self):
+        """
+        Returns the next name
+        """
+        return self.read(self.varint()).decode('utf-8')
+
+    def read(self, size):
+        """
+        Returns the next `size` bytes, fewer at the end of the file
+        """
+        if len(self._buffer) - self._position < size:
+            self._fill(size)
+        data = self._buffer[self._position:self._position + size]
+        self._position += len(data)
+        if len(data) < size and self.record_count:
+            raise ValueError("Truncated command log")
+        return data
+
+    def _fill(self, size):
+        # reads more of the file so that at least `size` bytes are buffered
+        # after the position, returns whether they are
+        chunks = [self._buffer[self._position:]]
+        length = len(chunks[0])
+        while length < size:
+            chunk = self._file.read(max(LOG_BUFFER_SIZE, size - length))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            length += len(chunk)
+        self._buffer = b''.join(chunks)
+        self._position = 0
+        return length >= size
+
+
+def _corners(operation):
+    if type(operation) is DrawLine:
+        first, second = operation.line.from_point, operation.line.to_point
+    else:
+        first, second = operation.rectangle.top_left_point, operation.rectangle.bottom_right_point
+    return first.x, first.y, second.x, second.y
+
+
+def _text(name):
+    return name.encode('utf-8')
+
+
+def _append_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append(value & 0x7f | 0x80)
+        value >>= 7
+    buffer.append(value)
@@ -1,13 +1,31 @@
 """
 This module define the canvas application commands
+
+The commands changing the canvases pass the operation they executed, as
+defined in pipeline.py, to an optional log function once they succeeded, so
+that it can be written to a command log (see commandlog.py).
 """
 
 from canvas import (
     Canvas,
+    OutOfCanvasBoundError,
     Point,
     Line,
     Rectangle
 )
+from pipeline import (
+    BucketFill,
+    CreateCanvas,
+    Delete,
+    DrawFilledRectangle,
+    DrawLine,
+    DrawRectangle,
+    NewCanvas,
+    OpenCanvas,
+    Redo,
+    SwitchCanvas,
+    Undo
+)
 
 class ExitCommand(object):
     #pylint: disable=too-few-public-methods
@@ -29,9 +47,11 @@ class CreateCanvasCommand(object):
 
     Args:
         callback: a function that will receive the newly created canvas instance
+        log_fn: a function that will receive the executed operation
     """
-    def __init__(self, callback):
+    def __init__(self, callback, log_fn=None):
         self._callback = callback
+        self._log_fn = log_fn or _ignore
 
     def execute(self, *args):
         """
@@ -42,11 +62,141 @@ class CreateCanvasCommand(object):
         """
         if len(args) < 2:
             raise ValueError("2 arguments expected (width, heigth)")
-        width, heigth = args[0], args[1]
+        canvas = _new_canvas(args[0], args[1])
+        self._callback(canvas)
+        self._log_fn(CreateCanvas(None, canvas.width, canvas.height))
+
+
+class NewCanvasCommand(object):
+    #pylint: disable=too-few-public-methods
+    """
+    Command to create a new named canvas in the workspace
+
+    Args:
+        callback: a function that will receive the name and the newly created
+            canvas instance
+        log_fn: a function that will receive the executed operation
+    """
+    def __init__(self, callback, log_fn=None):
+        self._callback = callback
+        self._log_fn = log_fn or _ignore
+
+    def execute(self, *args):
+        """
+        Create a new canvas instance and make it the current one
+
+        Args:
+            name: the name of the canvas, replacing the canvas of that name if any
+            width, height of the canvas
+        """
+        if len(args) < 3:
+            raise ValueError("3 arguments expected (name, width, heigth)")
+        name = args[0]
+        canvas = _new_canvas(args[1], args[2])
+        self._callback(name, canvas)
+        self._log_fn(NewCanvas(None, name, canvas.width, canvas.height))
+
+
+class SwitchCanvasCommand(object):
+    #pylint: disable=too-few-public-methods
+    """
+    Command to make another canvas of the workspace the current one
+
+    Args:
+        get_workspace_fn: a function that returns the workspace
+        log_fn: a function that will receive the executed operation
+    """
+    def __init__(self, get_workspace_fn, log_fn=None):
+        self.get_workspace_fn = get_workspace_fn
+        self._log_fn = log_fn or _ignore
+
+    def execute(self, *args):
+        """
+        Make a canvas the current one
+
+        Args:
+            name: the name of the canvas
+        """
+        if len(args) < 1:
+            raise ValueError("1 argument expected (name)")
+        self.get_workspace_fn().switch(args[0])
+        self._log_fn(SwitchCanvas(None, args[0]))
+
+
+class ListCanvasesCommand(object):
+    #pylint: disable=too-few-public-methods
+    """
+    Command to list the canvases of the workspace
+
+    Args:
+        get_workspace_fn: a function that returns the workspace
+    """
+    def __init__(self, get_workspace_fn):
+        self.get_workspace_fn = get_workspace_fn
+
+    def execute(self, *_):
+        """
+        Returns the list of the canvases, to be printed instead of the canvas
+        """
+        return self.get_workspace_fn().describe()
+
+
+class OpenCanvasCommand(object):
+    #pylint: disable=too-few-public-methods
+    """
+    Command to open a canvas saved to a file
+
+    Args:
+        callback: a function that will receive the opened canvas instance
+        log_fn: a function that will receive the executed operation
+    """
+    def __init__(self, callback, log_fn=None):
+        self._callback = callback
+        self._log_fn = log_fn or _ignore
+
+    def execute(self, *args):
+        """
+        Open a canvas saved to a file
+
+        Args:
+            path: the path of the file, which may contain spaces
+        """
+        if len(args) < 1:
+            raise ValueError("1 argument expected (path)")
+        path = ' '.join(str(arg) for arg in args)
         try:
-            self._callback(Canvas(width, heigth))
-        except (TypeError, ValueError) as ex:
-            raise TypeError("Width and heigth must be convertible to integers") from ex
+            canvas = Canvas.load(path)
+        except OSError as ex:
+            raise ValueError("Cannot open the canvas: " + str(ex)) from ex
+        self._callback(canvas)
+        self._log_fn(OpenCanvas(None, path, canvas.width, canvas.height))
+
+
+class SaveCanvasCommand(object):
+    #pylint: disable=too-few-public-methods
+    """
+    Command to save the canvas to a file
+
+    Args:
+        get_canvas_fn: a function that returns the canvas instance to save
+    """
+    def __init__(self, get_canvas_fn):
+        self.get_canvas_fn = get_canvas_fn
+
+    def execute(self, *args):
+        """
+        Save the canvas to a file
+
+        Args:
+            path: the path of the file, which may contain spaces
+        """
+        if len(args) < 1:
+            raise ValueError("1 argument expected (path)")
+        path = ' '.join(str(arg) for arg in args)
+        try:
+            self.get_canvas_fn().save(path)
+        except OSError as ex:
+            raise ValueError("Cannot save the canvas: " + str(ex)) from ex
 
 
 class DrawLineCommand(object):
@@ -56,9 +206,11 @@ class DrawLineCommand(object):
 
     Args:
         get_canvas_fn: a function that returns the canvas instance to draw on
+        log_fn: a function that will receive the executed operation
     """
-    def __init__(self, get_canvas_fn):
+    def __init__(self, get_canvas_fn, log_fn=None):
         self.get_canvas_fn = get_canvas_fn
+        self._log_fn = log_fn or _ignore
 
     def execute(self, *args):
         #pylint: disable=invalid-name
@@ -67,13 +219,15 @@ class DrawLineCommand(object):
 
         Args:
             x1, y1, x2, y2:
-            the int coordinates of (x1, y1) and (x2, y2) between which the line will be drawn
+            the int coordinates of (x1, y1) and (x2, y2) between which the line will be drawn,
+            the line may have any slope
         """
         if len(args) < 4:
             raise ValueError("4 arguments expected (x1, y1, x2, y2)")
         x1, y1, x2, y2 = args[0], args[1], args[2], args[3]
         line = Line(Point(x1, y1), Point(x2, y2))
         self.get_canvas_fn().draw_line(line)
+        self._log_fn(DrawLine(None, line))
 
 
 class DrawRectangleCommand(object):
@@ -83,9 +237,11 @@ class DrawRectangleCommand(object):
 
     Args:
         get_canvas_fn: a function that returns the canvas instance to draw on
+        log_fn: a function that will receive the executed operation
     """
-    def __init__(self, get_canvas_fn):
+    def __init__(self, get_canvas_fn, log_fn=None):
         self.get_canvas_fn = get_canvas_fn
+        self._log_fn = log_fn or _ignore
 
     def execute(self, *args):
         #pylint: disable=invalid-name
@@ -102,6 +258,38 @@ class DrawRectangleCommand(object):
         x1, y1, x2, y2 = args[0], args[1], args[2], args[3]
         rectangle = Rectangle(Point(x1, y1), Point(x2, y2))
         self.get_canvas_fn().draw_rectangle(rectangle)
+        self._log_fn(DrawRectangle(None, rectangle))
+
+
+class DrawFilledRectangleCommand(object):
+    #pylint: disable=too-few-public-methods
+    """
+    Command to draw a filled rectangle on the canvas
+
+    Args:
+        get_canvas_fn: a function that returns the canvas instance to draw on
+        log_fn: a function that will receive the executed operation
+    """
+    def __init__(self, get_canvas_fn, log_fn=None):
+        self.get_canvas_fn = get_canvas_fn
+        self._log_fn = log_fn or _ignore
+
+    def execute(self, *args):
+        #pylint: disable=invalid-name
+        """
+        Draw a filled rectangle on the canvas
+
+        Args:
+            x1, y1, x2, y2:
+            the int coordinates of (x1, y1), the top-left corner of the rectangle
+            and (x2, y2), the bottom-right corner of the rectangle
+        """
+        if len(args) < 4:
+            raise ValueError("4 arguments expected (x1, y1, x2, y2)")
+        x1, y1, x2, y2 = args[0], args[1], args[2], args[3]
+        rectangle = Rectangle(Point(x1, y1), Point(x2, y2))
+        self.get_canvas_fn().draw_filled_rectangle(rectangle)
+        self._log_fn(DrawFilledRectangle(None, rectangle))
 
 
 class BucketFillCommand(object):
@@ -111,9 +299,11 @@ class BucketFillCommand(object):
 
     Args:
         get_canvas_fn: a function that returns the canvas instance to draw on
+        log_fn: a function that will receive the executed operation
     """
-    def __init__(self, get_canvas_fn):
+    def __init__(self, get_canvas_fn, log_fn=None):
         self.get_canvas_fn = get_canvas_fn
+        self._log_fn = log_fn or _ignore
 
     def execute(self, *args):
         #pylint: disable=invalid-name
@@ -124,10 +314,11 @@ class BucketFillCommand(object):
             x, y: the int coordinates of the point from which to paint the connected shape or zone
             colour: the colour to paint with
         """
-        if len(args) < 2:
+        if len(args) < 3:
             raise ValueError("3 arguments expected (x, y, colour)")
-        x, y, colour = args[0], args[1], args[2]
-        self.get_canvas_fn().bucket_fill(Point(x, y), colour)
+        point, colour = Point(args[0], args[1]), args[2]
+        self.get_canvas_fn().bucket_fill(point, colour)
+        self._log_fn(BucketFill(None, point, colour))
 
 
 class DeleteCommand(object):
@@ -137,9 +328,11 @@ class DeleteCommand(object):
 
     Args:
         get_canvas_fn: a function that returns the canvas instance to draw on
+        log_fn: a function that will receive the executed operation
     """
-    def __init__(self, get_canvas_fn):
+    def __init__(self, get_canvas_fn, log_fn=None):
         self.get_canvas_fn = get_canvas_fn
+        self._log_fn = log_fn or _ignore
 
     def execute(self, *args):
         #pylint: disable=invalid-name
@@ -151,8 +344,9 @@ class DeleteCommand(object):
         """
         if len(args) < 2:
             raise ValueError("2 arguments expected (x, y)")
-        x, y = args[0], args[1]
-        self.get_canvas_fn().delete(Point(x, y))
+        point = Point(args[0], args[1])
+        self.get_canvas_fn().delete(point)
+        self._log_fn(Delete(None, point))
 
 
 class UndoCommand(object):
@@ -162,12 +356,156 @@ class UndoCommand(object):
 
     Args:
         get_canvas_fn: a function that returns the canvas instance to draw on
+        log_fn: a function that will receive the executed operation
     """
-    def __init__(self, get_canvas_fn):
+    def __init__(self, get_canvas_fn, log_fn=None):
         self.get_canvas_fn = get_canvas_fn
+        self._log_fn = log_fn or _ignore
 
     def execute(self, *_):
         """
         Undo the last action
         """
         self.get_canvas_fn().undo()
+        self._log_fn(Undo(None))
+
+
+class RedoCommand(object):
+    #pylint: disable=too-few-public-methods
+    """
+    Command to redo the last undone action
+
+    Args:
+        get_canvas_fn: a function that returns the canvas instance to draw on
+        log_fn: a function that will receive the executed operation
+    """
+    def __init__(self, get_canvas_fn, log_fn=None):
+        self.get_canvas_fn = get_canvas_fn
+        self._log_fn = log_fn or _ignore
+
+    def execute(self, *_):
+        """
+        Redo the last undone action
+        """
+        self.get_canvas_fn().redo()
+        self._log_fn(Redo(None))
+
+
+class PrintCommand(object):
+    #pylint: disable=too-few-public-methods
+    """
+    Command to print the canvas: it does nothing by itself since the
+    application prints the canvas after the commands that require it
+    """
+    @staticmethod
+    def execute(*_):
+        """
+        Do nothing
+        """
+
+
+class StatsCommand(object):
+    #pylint: disable=too-few-public-methods
+    """
+    Command to print the cost of the commands executed so far
+
+    Args:
+        get_instrumentation_fn: a function that returns the instrumentation
+            recording the commands, None if it is disabled
+    """
+    def __init__(self, get_instrumentation_fn):
+        self.get_instrumentation_fn = get_instrumentation_fn
+
+    def execute(self, *_):
+        """
+        Returns the totals per command, to be printed instead of the canvas
+        """
+        instrumentation = self.get_instrumentation_fn()
+        if instrumentation is None:
+            raise ValueError("Instrumentation is disabled (see --instrument)")
+        return instrumentation.summary()
+
+
+def create_commands_dictionary(get_canvas_fn, assign_canvas_fn,
+                               get_instrumentation_fn=lambda: None, get_workspace_fn=None,
+                               log_fn=None):
+    #pylint: disable=too-many-arguments
+    """
+    Returns the commands of the application by name
+
+    Args:
+        get_canvas_fn: a function that returns the current canvas
+        assign_canvas_fn: a function that will receive the created or opened
+            canvas, and the name of the canvas created by the N command
+        get_instrumentation_fn: a function that returns the instrumentation
+            printed by the stats command, None if it is disabled
+        get_workspace_fn: a function that returns the workspace of the named
+            canvases, None to not provide the workspace commands (N, W and A)
+        log_fn: a function that will receive the operations executed by the
+            commands changing the canvases, None to not log them
+    """
+    commands = {
+        'C': CreateCanvasCommand(assign_canvas_fn, log_fn),
+        'O': OpenCanvasCommand(assign_canvas_fn, log_fn),
+        'S': SaveCanvasCommand(get_canvas_fn),
+        'L': DrawLineCommand(get_canvas_fn, log_fn),
+        'R': DrawRectangleCommand(get_canvas_fn, log_fn),
+        'F': DrawFilledRectangleCommand(get_canvas_fn, log_fn),
+        'B': BucketFillCommand(get_canvas_fn, log_fn),
+        'D': DeleteCommand(get_canvas_fn, log_fn),
+        'U': UndoCommand(get_canvas_fn, log_fn),
+        'Y': RedoCommand(get_canvas_fn, log_fn),
+        'P': PrintCommand(),
+        'T': StatsCommand(get_instrumentation_fn),
+        'Q': ExitCommand()
+    }
+    if get_workspace_fn is not None:
+        commands['N'] = NewCanvasCommand(lambda name, canvas: assign_canvas_fn(canvas, name),
+                                         log_fn)
+        commands['W'] = SwitchCanvasCommand(get_workspace_fn, log_fn)
+        commands['A'] = ListCanvasesCommand(get_workspace_fn)
+    return commands
+
+
+def _new_canvas(width, heigth):
+    # returns a canvas of the size given as arguments of a command, checked as
+    # the script compiler does
+    try:
+        canvas = Canvas(width, heigth)
+    except (TypeError, ValueError) as ex:
+        raise TypeError("Width and heigth must be convertible to integers") from ex
+    if canvas.width <= 0 or canvas.height <= 0:
+        raise ValueError("Width and heigth must be positive")
+    return canvas
+
+
+def _ignore(_):
+    pass
+
+
+def execute_command_line(commands, user_input):
+    """
+    Executes a command line
+
+    Args:
+        commands: the dictionary of the available commands
+        user_input: the command line, the command name followed by its
+            arguments separated by spaces
+
+    Returns:
+        the error message if the command failed and the text the command output
+        instead of the canvas, each of them or None
+    """
+    input_items = user_input.split(' ')
+    cmd_name = input_items[0]
+    cmd_args = input_items[1:]
+    try:
+        cmd = commands[cmd_name]
+        output = cmd.execute(*cmd_args)
+    except KeyError:
+        return "Unknown command", None
+    except (ValueError, TypeError) as ex:
+        return str(ex), None
+    except OutOfCanvasBoundError:
+        return "Out of canvas bounds", None
+    return None, output
@@ -0,0 +1,88 @@
+"""
+This module defines the index of the connected components of a canvas
+
+A bucket fill paints the component of cells of the same content type connected
+to a point, found with a flood fill. Since a fill only changes the colour of the
+cells, the component it painted is unchanged afterwards: the index remembers the
+runs of cells of the components filled so far, so that filling or deleting one
+of them again only writes its runs rather than flood filling it from scratch.
+
+The index is only valid for the storage version it was built at: any other
+write to the storage may have changed the content types of the cells and makes
+it stale, in which case it is cleared and the fill falls back to a flood fill.
+"""
+
+from bisect import bisect_right
+
+
+class ComponentIndex(object):
+    """
+    Remembers the connected components of a canvas storage that have been filled
+
+    Args:
+        grid: the storage holding the cells
+    """
+    def __init__(self, grid):
+        self._grid = grid
+        self._version = None
+        # y -> the (start, stop, runs of the component) of the known runs of the
+        # row, sorted by start
+        self._rows = {}
+
+    def find(self, x, y):
+        #pylint: disable=invalid-name
+        """
+        Returns the runs of the known component holding a cell, as a list of
+        (y, start, stop) tuples, or None if the component is unknown or the
+        index is stale
+        """
+        if self._version != self._grid.version:
+            self.clear()
+            return None
+        row = self._rows.get(y)
+        if row is None:
+            return None
+        index = bisect_right(row, (x, float('inf'))) - 1
+        if index >= 0 and x < row[index][1]:
+            return row[index][2]
+        return None
+
+    def add(self, runs):
+        """
+        Remembers a component of the storage as it currently is
+
+        Args:
+            runs: the (y, start, stop) runs of cells of the component
+        """
+        if self._version != self._grid.version:
+            self.clear()
+        rows = self._rows
+        touched_rows = set()
+        for y, start, stop in runs:
+            rows.setdefault(y, []).append((start, stop, runs))
+            touched_rows.add(y)
+        for y in touched_rows:
+            rows[y].sort(key=_run_start)
+        self._version = self._grid.version
+
+    def validate(self):
+        """
+        Declares that the content types of the cells have not changed since the
+        components were added, although the storage has been written to
+        """
+        if self._version is not None:
+            self._version = self._grid.version
+
+    def clear(self):
+        """
+        Forgets every component
+        """
+        self._rows = {}
+        self._version = None
+
+    def __len__(self):
+        return len({id(runs) for row in self._rows.values() for _, _, runs in row})
+
+
+def _run_start(run):
+    return run[0]
@@ -0,0 +1,123 @@
+"""
+This module defines the diff output mode of a canvas
+
+Rather than the whole canvas after each command, the diff mode outputs the rows
+that changed since the previous output, using the rows whose text the renderer
+found changed (see CanvasRenderer.take_changed_rows), with a full keyframe from
+time to time. The output is made of blocks, each starting with a header line:
+
+- "K w h": a keyframe, followed by the h + 2 lines of the rendered canvas of
+  width w and height h;
+- "R n": the n changed rows follow, each as "y cells", the cells being the text
+  of row y without its frame;
+- "C n": the changed cells of n rows follow, each row as "y x runs": the cells
+  from column x are the run-length encoded `runs`, a sequence of "count*c" runs
+  of `count` cells of colour c, up to the last changed cell of the row.
+"""
+
+from itertools import groupby
+
+ROWS = 'rows'
+CELLS = 'cells'
+DEFAULT_KEYFRAME_EVERY = 100
+
+
+class DiffEncoder(object):
+    """
+    Encodes the successive states of a canvas as keyframes and diffs
+
+    A keyframe is output for the first state of each canvas, every
+    `keyframe_every` diffs, and instead of a diff that would be larger.
+
+    Args:
+        mode: ROWS to output the whole changed rows, CELLS to output their
+            changed cells run-length encoded
+        keyframe_every: the number of diffs between 2 keyframes
+    """
+    def __init__(self, mode=ROWS, keyframe_every=DEFAULT_KEYFRAME_EVERY):
+        if mode not in (ROWS, CELLS):
+            raise ValueError("Unknown diff mode: " + str(mode))
+        self.mode = mode
+        self.keyframe_every = keyframe_every
+        self._canvas = None
+        self._diff_count = 0
+
+    def encode(self, canvas):
+        """
+        Returns the keyframe or the diff of the current state of a canvas, as
+        text without a final line terminator
+        """
+        changed_rows = canvas.take_changed_rows()
+        if canvas is self._canvas and self._diff_count < self.keyframe_every:
+            if self.mode == ROWS:
+                lines = ["{} {}".format(y, cells) for y, _, cells in changed_rows]
+            else:
+                lines = [_encode_changed_cells(y, previous_cells, cells)
+                         for y, previous_cells, cells in changed_rows]
+            header = "{} {}".format('R' if self.mode == ROWS else 'C', len(lines))
+            # a keyframe has height + 3 lines of width + 2 characters
+            if sum(len(line) + 1 for line in lines) < (canvas.height + 3) * (canvas.width + 3):
+                self._diff_count += 1
+                return '\n'.join([header] + lines)
+        self._canvas = canvas
+        self._diff_count = 0
+        return "K {} {}\n{}".format(canvas.width, canvas.height, str(canvas))
+
+
+def _encode_changed_cells(y, previous_cells, cells):
+    #pylint: disable=invalid-name
+    start, stop = 0, len(cells)
+    if previous_cells is not None:
+        while start < stop and previous_cells[start] == cells[start]:
+            start += 1
+        while start < stop and previous_cells[stop - 1] == cells[stop - 1]:
+            stop -= 1
+    runs = ''.join("{}*{}".format(sum(1 for _ in group), colour)
+                   for colour, group in groupby(cells[start:stop]))
+    return "{} {} {}".format(y, start, runs)
+
+
+def decode(text, rows=None):
+    """
+    Applies keyframes and diffs to the rows of a canvas
+
+    Args:
+        text: the output of one or more DiffEncoder.encode() calls, joined by
+            line terminators
+        rows: the list of the cells of each row before the text, as strings
+
+    Returns:
+        the list of the cells of each row after the text
+    """
+    rows = list(rows or [])
+    lines = iter(text.split('\n'))
+    for header in lines:
+        kind, *arguments = header.split(' ')
+        if kind == 'K':
+            height = int(arguments[1])
+            frame = [next(lines) for _ in range(height + 2)]
+            rows = [line[1:-1] for line in frame[1:-1]]
+        elif kind == 'R':
+            for _ in range(int(arguments[0])):
+                y, cells = next(lines).split(' ', 1)
+                rows[int(y)] = cells
+        elif kind == 'C':
+            for _ in range(int(arguments[0])):
+                y, x, runs = next(lines).split(' ', 2)
+                y, x = int(y), int(x)
+                cells = _decode_runs(runs)
+                rows[y] = rows[y][:x] + cells + rows[y][x + len(cells):]
+        else:
+            raise ValueError("Invalid diff block header: " + header)
+    return rows
+
+
+def _decode_runs(runs):
+    cells = []
+    position = 0
+    while position < len(runs):
+        separator = runs.index('*', position)
+        count = int(runs[position:separator])
+        cells.append(runs[separator + 1] * count)
+        position = separator + 2
+    return ''.join(cells)
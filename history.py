@@ -0,0 +1,467 @@
+"""
+This module defines the undo history of a canvas
+
+Rather than a copy of the whole canvas, each history entry holds the changes an
+action made to the canvas storage (see storage.py), so that its cost is
+proportional to the number of cells the action modified.
+
+Only the latest entries are kept as change tuples: older ones are packed in a
+binary buffer compressed with zlib and, when the history uses more memory than
+its budget, the oldest ones are either spilled to a temporary file or forgotten.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import copy
+import struct
+import tempfile
+import zlib
+
+from storage import ROW, Runs
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_HOT_ENTRIES = 4
+
+# approximate memory used by a change tuple or an entry besides their byte strings
+_CHANGE_OVERHEAD = 120
+_ENTRY_OVERHEAD = 100
+
+# kind, fixed coordinate, start, number of cells (or of runs), whether the new
+# content is uniform, whether the old content is runs
+_CHANGE_HEADER = struct.Struct('<BIII??')
+_RUN = struct.Struct('<IBB')
+
+
+class UndoJournal(object):
+    """
+    Records the changes of each action made on a canvas storage so they can be
+    undone and redone
+
+    The `hot_entries` latest entries are kept as is and older ones are compressed.
+    When the entries use more than `max_bytes` of memory, the oldest ones are
+    spilled to a temporary file if `spill` is set, or forgotten otherwise (the
+    latest entry is always kept). The oldest entries are also forgotten when
+    there are more than `max_depth` of them.
+
+    Args:
+        max_depth: the maximum number of actions that can be undone, None for no limit
+        max_bytes: the memory budget of the journal, None for no limit
+        spill: whether to move the oldest entries to a temporary file rather than
+            forgetting them when the memory budget is exceeded
+        hot_entries: the number of latest entries that are not compressed
+    """
+    def __init__(self, max_depth=None, max_bytes=DEFAULT_MAX_BYTES, spill=False,
+                 hot_entries=DEFAULT_HOT_ENTRIES):
+        self.max_depth = max_depth
+        self.max_bytes = max_bytes
+        self.hot_entries = hot_entries
+        self.nbytes = 0
+        self._entries = deque()
+        self._redo_entries = []
+        self._spill_file = _SpillFile() if spill else None
+        self._spilled_count = 0
+        # the number of cells written by the latest recorded, undone or redone entry
+        self.last_cell_count = 0
+        # the number of cells written by all of them, or by the callers of add()
+        self.written_cell_count = 0
+        # whether the entries are recorded, see record()
+        self.enabled = True
+
+    @contextmanager
+    def record(self, grid):
+        """
+        Context manager recording as a single entry all the writes made to the
+        storage inside the `with` block. Recording an entry forgets the undone
+        entries that could be redone.
+
+        While `enabled` is False, the writes are not recorded and every entry
+        is forgotten instead, since the ones before the writes could no longer
+        be undone: the block then receives None rather than the changes.
+
+        Args:
+            grid: the storage being modified
+        """
+        if not self.enabled:
+            if self._entries or self._redo_entries:
+                self.clear()
+            self.last_cell_count = 0
+            yield None
+            return
+        changes = []
+        grid.recorder = changes
+        try:
+            yield changes
+        finally:
+            grid.recorder = None
+            self.add(changes)
+            self.written_cell_count += self.last_cell_count
+
+    def add(self, changes):
+        """
+        Adds an entry holding changes recorded by the caller, which forgets the
+        undone entries that could be redone. The caller counts the cells it wrote
+        in written_cell_count.
+
+        Args:
+            changes: the list of the changes recorded by the storage
+        """
+        if not self.enabled:
+            self.clear()
+            return
+        self.last_cell_count = _cell_count(changes)
+        for entry in self._redo_entries:
+            self.nbytes -= entry.nbytes
+        self._redo_entries = []
+        self._push(_HistoryEntry(changes))
+
+    def undo(self, grid):
+        """
+        Reverts the changes of the latest entry
+
+        Args:
+            grid: the storage the entry has been recorded on
+
+        Returns:
+            False if there was nothing to undo, True otherwise
+        """
+        if not self._entries:
+            self.last_cell_count = 0
+            return False
+        entry = self._entries.pop()
+        if entry.is_spilled:
+            entry.load(self._spill_file)
+            self._spilled_count -= 1
+        else:
+            self.nbytes -= entry.nbytes
+        changes = entry.get_changes()
+        self.last_cell_count = _cell_count(changes)
+        self.written_cell_count += self.last_cell_count
+        for kind, fixed, start, old_types, old_colours, _, _ in reversed(changes):
+            _write(grid, kind, fixed, start, old_types, old_colours)
+        self._redo_entries.append(entry)
+        self.nbytes += entry.nbytes
+        self._enforce_budget()
+        return True
+
+    def redo(self, grid):
+        """
+        Applies again the changes of the latest undone entry
+
+        Args:
+            grid: the storage the entry has been recorded on
+
+        Returns:
+            False if there was nothing to redo, True otherwise
+        """
+        if not self._redo_entries:
+            self.last_cell_count = 0
+            return False
+        entry = self._redo_entries.pop()
+        self.nbytes -= entry.nbytes
+        changes = entry.get_changes()
+        self.last_cell_count = _cell_count(changes)
+        self.written_cell_count += self.last_cell_count
+        for kind, fixed, start, old_types, _, new_types, new_colours in changes:
+            if not isinstance(new_types, bytes):
+                new_types = bytes([new_types]) * len(old_types)
+                new_colours = bytes([new_colours]) * len(old_types)
+            _write(grid, kind, fixed, start, new_types, new_colours)
+        self._push(entry)
+        return True
+
+    def clear(self):
+        """
+        Forgets every entry
+        """
+        self._entries.clear()
+        self._redo_entries = []
+        self.nbytes = 0
+        self._spilled_count = 0
+        self.last_cell_count = 0
+        if self._spill_file is not None:
+            self._spill_file.clear()
+
+    def copy(self):
+        """
+        Returns a journal holding the same entries, whose changes are shared
+        rather than copied: only the spilled entries are read back from the
+        spill file, and spilled again by the copy if it exceeds its budget
+        """
+        journal = UndoJournal(self.max_depth, self.max_bytes, self._spill_file is not None,
+                              self.hot_entries)
+        journal._entries.extend(entry.copy(self._spill_file) for entry in self._entries)
+        journal._redo_entries = [entry.copy(self._spill_file) for entry in self._redo_entries]
+        journal.nbytes = sum(entry.nbytes for entry in journal._entries)
+        journal.nbytes += sum(entry.nbytes for entry in journal._redo_entries)
+        journal.last_cell_count = self.last_cell_count
+        journal.written_cell_count = self.written_cell_count
+        journal._enforce_budget()
+        return journal
+
+    @property
+    def spilled_bytes(self):
+        """
+        The number of bytes used in the temporary file by the spilled entries
+        """
+        return self._spill_file.size if self._spill_file is not None else 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _push(self, entry):
+        self._entries.append(entry)
+        self.nbytes += entry.nbytes
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        # entries are only ever added at the end of the stacks, so at most one
+        # entry per stack has just become too old to stay uncompressed
+        for entries in (self._entries, self._redo_entries):
+            if len(entries) > self.hot_entries:
+                entry = entries[-self.hot_entries - 1]
+                if entry.is_hot:
+                    self.nbytes -= entry.nbytes
+                    entry.compress()
+                    self.nbytes += entry.nbytes
+
+        while self.max_depth is not None and len(self._entries) > self.max_depth:
+            self._forget_oldest_entry()
+        # the spilled entries are always the oldest ones
+        while (self.max_bytes is not None and self.nbytes > self.max_bytes and
+               self._spilled_count < len(self._entries) - 1):
+            if self._spill_file is not None:
+                entry = self._entries[self._spilled_count]
+                self.nbytes -= entry.nbytes
+                entry.spill(self._spill_file)
+                self._spilled_count += 1
+            else:
+                self._forget_oldest_entry()
+
+    def _forget_oldest_entry(self):
+        entry = self._entries.popleft()
+        if entry.is_spilled:
+            self._spill_file.forget(entry)
+            self._spilled_count -= 1
+        else:
+            self.nbytes -= entry.nbytes
+
+
+class _HistoryEntry(object):
+    """
+    The changes made by a single action, held either as change tuples, as a
+    compressed packed buffer, or as the location of that buffer in a spill file
+    """
+    def __init__(self, changes):
+        self._changes = changes
+        self._packed = None
+        self.spill_offset = None
+        self.spill_length = None
+        self.nbytes = _changes_nbytes(changes)
+
+    @property
+    def is_hot(self):
+        #pylint: disable=missing-docstring
+        return self._changes is not None
+
+    @property
+    def is_spilled(self):
+        #pylint: disable=missing-docstring
+        return self.spill_offset is not None
+
+    def get_changes(self):
+        """
+        Returns the change tuples of the entry
+        """
+        if self._changes is not None:
+            return self._changes
+        return _unpack(zlib.decompress(self._packed))
+
+    def copy(self, spill_file):
+        """
+        Returns an entry holding the same changes in memory, the spilled ones
+        being read back from the spill file
+        """
+        entry = copy.copy(self)
+        if self.is_spilled:
+            entry._packed = spill_file.read(self.spill_offset, self.spill_length)
+            entry.spill_offset = entry.spill_length = None
+            entry.nbytes = _ENTRY_OVERHEAD + len(entry._packed)
+        return entry
+
+    def compress(self):
+        """
+        Replaces the change tuples with a compressed packed buffer
+        """
+        self._packed = zlib.compress(_pack(self._changes), 1)
+        self._changes = None
+        self.nbytes = _ENTRY_OVERHEAD + len(self._packed)
+
+    def spill(self, spill_file):
+        """
+        Moves the compressed packed buffer to a spill file
+        """
+        if self.is_hot:
+            self.compress()
+        self.spill_offset = spill_file.append(self._packed)
+        self.spill_length = len(self._packed)
+        self._packed = None
+
+    def load(self, spill_file):
+        """
+        Moves the compressed packed buffer back from the spill file to memory;
+        the entry must be the latest one spilled to that file
+        """
+        self._packed = spill_file.pop(self.spill_offset, self.spill_length)
+        self.spill_offset = self.spill_length = None
+
+
+class _SpillFile(object):
+    """
+    A temporary file holding the packed buffers of the oldest history entries, in
+    order. Space is reclaimed when the latest buffer is loaded back, and the file
+    is compacted when most of it is used by forgotten buffers.
+
+    Buffer offsets are never changed by a compaction: the offset of the first
+    byte of the file is kept in `_shift` instead.
+    """
+    def __init__(self):
+        self._file = None
+        self._shift = 0
+        self._start = 0
+        self._end = 0
+
+    @property
+    def size(self):
+        #pylint: disable=missing-docstring
+        return self._end - self._start
+
+    def append(self, data):
+        """
+        Writes a buffer at the end of the file and returns its offset
+        """
+        if self._file is None:
+            self._file = tempfile.TemporaryFile()
+        offset = self._end
+        self._file.seek(offset - self._shift)
+        self._file.write(data)
+        self._end += len(data)
+        return offset
+
+    def read(self, offset, length):
+        """
+        Reads back a buffer of the file
+        """
+        self._file.seek(offset - self._shift)
+        return self._file.read(length)
+
+    def pop(self, offset, length):
+        """
+        Reads back the last buffer of the file and removes it
+        """
+        data = self.read(offset, length)
+        self._end = offset
+        if self._end <= self._start:
+            self.clear()
+        else:
+            self._file.truncate(offset - self._shift)
+        return data
+
+    def forget(self, entry):
+        """
+        Discards the first buffer of the file, which belongs to the given entry
+        """
+        self._start = entry.spill_offset + entry.spill_length
+        if self._start >= self._end:
+            self.clear()
+        elif self._start - self._shift > self.size:
+            self._compact()
+
+    def clear(self):
+        """
+        Discards every buffer
+        """
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._shift = self._start = self._end = 0
+
+    def _compact(self):
+        self._file.seek(self._start - self._shift)
+        data = self._file.read(self.size)
+        self._file.seek(0)
+        self._file.write(data)
+        self._file.truncate(len(data))
+        self._shift = self._start
+
+
+def _write(grid, kind, fixed, start, types, colours):
+    if colours is None:
+        grid.write_runs(fixed, start, types.runs)
+    elif kind == ROW:
+        grid.write_span(fixed, start, types, colours)
+    else:
+        grid.write_column(fixed, start, types, colours)
+
+
+def _cell_count(changes):
+    return sum(len(change[3]) for change in changes)
+
+
+def _changes_nbytes(changes):
+    nbytes = _ENTRY_OVERHEAD
+    for _, _, _, old_types, old_colours, new_types, new_colours in changes:
+        if old_colours is None:
+            nbytes += _CHANGE_OVERHEAD + old_types.nbytes
+        else:
+            nbytes += _CHANGE_OVERHEAD + len(old_types) + len(old_colours)
+        if isinstance(new_types, bytes):
+            nbytes += len(new_types) + len(new_colours)
+    return nbytes
+
+
+def _pack(changes):
+    chunks = []
+    for kind, fixed, start, old_types, old_colours, new_types, new_colours in changes:
+        uniform = not isinstance(new_types, bytes)
+        if old_colours is None:
+            chunks.append(_CHANGE_HEADER.pack(kind, fixed, start, len(old_types.runs),
+                                              uniform, True))
+            chunks.extend(_RUN.pack(*run) for run in old_types.runs)
+        else:
+            chunks.append(_CHANGE_HEADER.pack(kind, fixed, start, len(old_types),
+                                              uniform, False))
+            chunks.append(old_types)
+            chunks.append(old_colours)
+        if uniform:
+            chunks.append(bytes([new_types, new_colours]))
+        else:
+            chunks.append(new_types)
+            chunks.append(new_colours)
+    return b''.join(chunks)
+
+
+def _unpack(buffer):
+    changes = []
+    position = 0
+    while position < len(buffer):
+        kind, fixed, start, count, uniform, runs = _CHANGE_HEADER.unpack_from(buffer, position)
+        position += _CHANGE_HEADER.size
+        if runs:
+            old_types = Runs([_RUN.unpack_from(buffer, position + index * _RUN.size)
+                              for index in range(count)])
+            old_colours = None
+            position += count * _RUN.size
+            count = len(old_types)
+        else:
+            old_types = buffer[position:position + count]
+            old_colours = buffer[position + count:position + 2 * count]
+            position += 2 * count
+        if uniform:
+            new_types, new_colours = buffer[position], buffer[position + 1]
+            position += 2
+        else:
+            new_types = buffer[position:position + count]
+            new_colours = buffer[position + count:position + 2 * count]
+            position += 2 * count
+        changes.append((kind, fixed, start, old_types, old_colours, new_types, new_colours))
+    return changes
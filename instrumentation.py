@@ -0,0 +1,133 @@
+"""
+This module defines the opt-in instrumentation of the canvas commands
+
+When instrumentation is enabled, a record is made for each executed command,
+holding its wall time, the number of cells its canvas actions wrote, the memory
+used by the undo history after it and the time spent rendering the canvas. The
+records are summed up per command for the stats command (T), and can be dumped
+periodically to a JSON-lines file, one record per line.
+
+The canvas reports its actions to its `instrumentation` attribute (see
+Canvas), which is None when instrumentation is disabled: the only cost left is
+then that test.
+"""
+
+from contextlib import contextmanager
+import functools
+import json
+import time
+
+DEFAULT_DUMP_EVERY = 100
+
+
+class Instrumentation(object):
+    """
+    Records the cost of the executed commands
+
+    Args:
+        dump: an optional text stream the records are written to as JSON lines
+        dump_every: the number of records written to the dump at once
+    """
+    def __init__(self, dump=None, dump_every=DEFAULT_DUMP_EVERY):
+        self.dump = dump
+        self.dump_every = dump_every
+        self.totals = {}
+        self._pending_records = []
+        self._record = None
+
+    @contextmanager
+    def measure(self, command):
+        """
+        Context manager recording the cost of the command executed inside the
+        `with` block
+
+        Args:
+            command: the name of the command
+        """
+        record = {'command': command, 'wall_time': 0.0, 'cells': 0,
+                  'undo_bytes': None, 'render_time': 0.0}
+        outer_record, self._record = self._record, record
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['wall_time'] = time.perf_counter() - start
+            self._record = outer_record
+            self._add(record)
+
+    def call(self, canvas, method, *args, **kwargs):
+        """
+        Calls a public method of a canvas and adds its cost to the record of the
+        command being executed, or to a record of its own if there is none
+
+        Args:
+            canvas: the canvas whose method is called
+            method: the unbound method to call
+            *args, **kwargs: the arguments of the call
+        """
+        if self._record is None:
+            with self.measure(method.__name__):
+                return self.call(canvas, method, *args, **kwargs)
+        start = time.perf_counter()
+        cell_count = canvas.written_cell_count
+        result = method(canvas, *args, **kwargs)
+        # a lazy canvas writes the cells of its drawings when it is rendered
+        self._record['cells'] += canvas.written_cell_count - cell_count
+        if method.__name__ in ('__str__', 'render_to', 'take_changed_rows'):
+            self._record['render_time'] += time.perf_counter() - start
+        else:
+            self._record['undo_bytes'] = canvas.history_nbytes
+        return result
+
+    def summary(self):
+        """
+        Returns the totals per command as a text table
+        """
+        lines = ["{:<14} {:>8} {:>12} {:>12} {:>14} {:>12}".format(
+            "command", "count", "wall time", "cells", "undo bytes", "render")]
+        for command, total in sorted(self.totals.items()):
+            lines.append("{:<14} {:>8} {:>10.4f} s {:>12} {:>14} {:>10.4f} s".format(
+                command, total['count'], total['wall_time'], total['cells'],
+                '-' if total['undo_bytes'] is None else total['undo_bytes'],
+                total['render_time']))
+        return '\n'.join(lines)
+
+    def flush(self):
+        """
+        Writes the pending records to the dump
+        """
+        if self.dump is not None and self._pending_records:
+            self.dump.write(''.join(json.dumps(record, sort_keys=True) + '\n'
+                                    for record in self._pending_records))
+            self.dump.flush()
+        self._pending_records = []
+
+    def _add(self, record):
+        total = self.totals.setdefault(record['command'], {
+            'count': 0, 'wall_time': 0.0, 'cells': 0, 'undo_bytes': None,
+            'render_time': 0.0})
+        total['count'] += 1
+        total['wall_time'] += record['wall_time']
+        total['cells'] += record['cells']
+        total['render_time'] += record['render_time']
+        if record['undo_bytes'] is not None:
+            # the latest size of the history rather than a sum
+            total['undo_bytes'] = record['undo_bytes']
+        if self.dump is not None:
+            self._pending_records.append(record)
+            if len(self._pending_records) >= self.dump_every:
+                self.flush()
+
+
+def instrumented(method):
+    """
+    Decorator of the Canvas public methods reporting their calls to the
+    instrumentation of the canvas, if it has one
+    """
+    @functools.wraps(method)
+    def call(canvas, *args, **kwargs):
+        #pylint: disable=missing-docstring
+        if canvas.instrumentation is None:
+            return method(canvas, *args, **kwargs)
+        return canvas.instrumentation.call(canvas, method, *args, **kwargs)
+    return call
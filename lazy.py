@@ -0,0 +1,158 @@
+"""
+This module defines the pending log of a lazy canvas
+
+A lazy canvas does not write its drawings to its storage when asked to: it
+appends them to a pending log, and only applies them when its cells are read.
+The draws are split by square tiles of TILE_SIZE cells, so that reading a
+region of the canvas only applies them to the tiles intersecting it, and the
+other tiles are applied later, in the same order, when they are read in turn.
+
+A fill depends on the cells of its whole connected component, which may span
+any number of tiles: it is applied to the whole canvas, once every tile is up to
+date with the operations before it, so that its result is the eager one.
+
+Each operation is added to the undo history once it has been applied to all of
+its tiles, in the order of the log, with the changes of all its parts. The cells
+are counted in the written_cell_count of the history as the parts are applied.
+"""
+
+from collections import deque
+
+from storage import TILE_SIZE
+
+
+class PendingLog(object):
+    """
+    The operations of a lazy canvas that have not been applied to all of their
+    tiles yet
+
+    Args:
+        journal: the UndoJournal the applied operations are added to
+        fill_fn: a function applying a fill to the whole storage, receiving the
+            point and the colour of the fill and whether it is a deletion
+    """
+    def __init__(self, journal, fill_fn):
+        self._journal = journal
+        self._fill_fn = fill_fn
+        self._operations = deque()
+
+    def append_draw(self, boxes, type_code, colour_code):
+        """
+        Appends a draw to the log
+
+        Args:
+            boxes: the (left, top, right, bottom) boxes of the cells to set,
+                the right and bottom bounds being excluded
+            type_code, colour_code: the content to set to the cells
+        """
+        self._operations.append(_PendingDraw(boxes, type_code, colour_code))
+
+    def append_fill(self, point, colour, is_deletion=False):
+        """
+        Appends a fill or a deletion from a point to the log
+        """
+        self._operations.append(_PendingFill(point, colour, is_deletion))
+
+    def flush(self, grid, region=None):
+        """
+        Applies the pending operations to the tiles intersecting a region
+
+        Args:
+            grid: the storage to apply the operations to
+            region: the (left, top, right, bottom) box of cells whose content is
+                needed, None for the whole storage
+        """
+        operations = self._operations
+        last_fill = -1
+        for index, operation in enumerate(operations):
+            if isinstance(operation, _PendingFill):
+                last_fill = index
+        tiles = None if region is None else {tile for tile, _ in _split_box(region)}
+        for index, operation in enumerate(operations):
+            if operation.is_applied:
+                continue
+            change_count = len(operation.changes)
+            grid.recorder = operation.changes
+            try:
+                if isinstance(operation, _PendingFill):
+                    self._fill_fn(operation.point, operation.colour, operation.is_deletion)
+                    operation.is_applied = True
+                else:
+                    operation.apply(grid, None if index < last_fill else tiles)
+            finally:
+                grid.recorder = None
+                self._journal.written_cell_count += sum(
+                    len(change[3]) for change in operation.changes[change_count:])
+        while operations and operations[0].is_applied:
+            self._journal.add(operations.popleft().changes)
+
+    def __len__(self):
+        return len(self._operations)
+
+
+class _PendingDraw(object):
+    """
+    A draw setting boxes of cells to the same content, split by tile
+    """
+    def __init__(self, boxes, type_code, colour_code):
+        self.type_code = type_code
+        self.colour_code = colour_code
+        self.changes = []
+        # tile -> the parts of the boxes in the tile, for the tiles not applied yet
+        self._tiles = {}
+        for box in boxes:
+            for tile, part in _split_box(box):
+                self._tiles.setdefault(tile, []).append(part)
+
+    @property
+    def is_applied(self):
+        #pylint: disable=missing-docstring
+        return not self._tiles
+
+    def apply(self, grid, tiles=None):
+        """
+        Writes the parts of the draw in some tiles to a storage
+
+        Args:
+            grid: the storage to write to
+            tiles: the set of the (x, y) indexes of the tiles to write, None
+                for all of them
+        """
+        if tiles is None:
+            tiles = list(self._tiles)
+        elif len(tiles) > len(self._tiles):
+            tiles = [tile for tile in self._tiles if tile in tiles]
+        else:
+            tiles = [tile for tile in tiles if tile in self._tiles]
+        for tile in tiles:
+            for left, top, right, bottom in self._tiles.pop(tile):
+                if bottom - top == 1 or right - left > 1:
+                    for y in range(top, bottom):
+                        grid.fill_span(y, left, right, self.type_code, self.colour_code)
+                else:
+                    grid.fill_column(left, top, bottom, self.type_code, self.colour_code)
+
+
+class _PendingFill(object):
+    #pylint: disable=too-few-public-methods
+    """
+    A fill or a deletion from a point, applied to the whole storage at once
+    """
+    def __init__(self, point, colour, is_deletion):
+        self.point = point
+        self.colour = colour
+        self.is_deletion = is_deletion
+        self.is_applied = False
+        self.changes = []
+
+
+def _split_box(box):
+    # yields the (tile, part of the box in the tile) pairs of the tiles a box
+    # of cells intersects
+    left, top, right, bottom = box
+    for tile_y in range(top // TILE_SIZE, (bottom - 1) // TILE_SIZE + 1):
+        part_top = max(top, tile_y * TILE_SIZE)
+        part_bottom = min(bottom, (tile_y + 1) * TILE_SIZE)
+        for tile_x in range(left // TILE_SIZE, (right - 1) // TILE_SIZE + 1):
+            yield ((tile_x, tile_y), (max(left, tile_x * TILE_SIZE), part_top,
+                                      min(right, (tile_x + 1) * TILE_SIZE), part_bottom))
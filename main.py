@@ -2,57 +2,305 @@
 
 """
 Canvas application launcher
+
+Without arguments, commands are read interactively and the canvas is printed
+after each successful command. With --script, commands are read from a file
+(or from the standard input with '-'): the whole script is compiled and its
+errors are reported before any command runs (see pipeline.py), and the canvas is
+only rendered at the end, every N commands or with the P command, depending on
+--render. With --check, the script is only compiled, and with --optimize the
+operations that do not change its output are not executed.
+
+With --instrument or --stats-file, the cost of each command is recorded (see
+instrumentation.py): the T command prints its totals per command, and the
+records are written to the --stats-file as JSON lines.
+
+With --output rows or --output cells, only the changes of the canvas are output
+after the first full frame, rather than the whole canvas (see diff.py). With
+--viewport, only a region of the canvas is output.
+
+The canvases are held in a workspace of named canvases (see workspace.py): the
+N, W and A commands create, switch to and list them, and the least recently used
+ones are moved to disk when they use more memory than --workspace-budget.
+
+With --log, the commands changing the canvases are written to a binary command
+log as they execute, and --replay executes such a log again before the script or
+the interactive session, from its last checkpoint (see commandlog.py).
 """
 
-from commands import (
-    ExitCommand,
-    CreateCanvasCommand,
-    DrawLineCommand,
-    DrawRectangleCommand,
-    BucketFillCommand,
-    DeleteCommand,
-    UndoCommand
+import argparse
+import sys
+
+from canvas import Point, Rectangle
+from commandlog import DEFAULT_CHECKPOINT_EVERY, CommandLogWriter, replay
+from commands import create_commands_dictionary, execute_command_line
+from diff import CELLS, DEFAULT_KEYFRAME_EVERY, ROWS, DiffEncoder
+from instrumentation import DEFAULT_DUMP_EVERY, Instrumentation
+from pipeline import (
+    COMMAND_NAMES,
+    OpenCanvas,
+    Exit,
+    ListCanvases,
+    Print,
+    ScriptExecutor,
+    Stats,
+    compile_script,
+    optimize
 )
+from workspace import DEFAULT_MAX_BYTES, DEFAULT_NAME, Workspace
+
+OUTPUT_BUFFER_SIZE = 1 << 16
+FRAMES = 'frames'
+INSTRUMENTATION_DISABLED = "Instrumentation is disabled (see --instrument)"
+MEGABYTE = 1024 * 1024
 
-canvas = None
+workspace = Workspace()
+instrumentation = None
+# the DiffEncoder of the output, None to output full frames
+encoder = None
+# the Rectangle of the cells of the canvas to output, None for the whole canvas
+viewport = None
+# the CommandLogWriter of the executed commands, None to not log them
+command_log = None
 
-def main():
+def main(argv=None):
     """
     Canvas application entry point
     """
-    commands = _create_commands_dictionary()
+    global instrumentation, encoder, viewport, command_log
+    args = _parse_arguments(argv)
+    if args.viewport is not None:
+        viewport = Rectangle(Point(args.viewport[0], args.viewport[1]),
+                             Point(args.viewport[2], args.viewport[3]))
+    workspace.max_bytes = args.workspace_budget * MEGABYTE
+    if args.output != FRAMES:
+        encoder = DiffEncoder(args.output, args.keyframe_every)
+    stats_file = open(args.stats_file, 'a') if args.stats_file else None
+    if args.instrument or stats_file is not None:
+        instrumentation = Instrumentation(stats_file, args.stats_every)
+    if args.replay is not None:
+        try:
+            with open(args.replay, 'rb') as log_file:
+                replay(log_file, workspace, instrumentation=instrumentation)
+        except (OSError, ValueError) as ex:
+            sys.exit("Cannot replay the command log: " + str(ex))
+    log_file = open(args.log, 'wb') if args.log else None
+    if log_file is not None:
+        command_log = CommandLogWriter(log_file, workspace, args.checkpoint_every or None)
+
+    try:
+        if args.script is None:
+            _run_interactive(_create_commands_dictionary())
+        elif args.script == '-':
+            _run_script_to_stdout(sys.stdin, args)
+        else:
+            with open(args.script) as script:
+                _run_script_to_stdout(script, args)
+    finally:
+        if command_log is not None:
+            command_log.close()
+            log_file.close()
+        workspace.close()
+        if instrumentation is not None:
+            instrumentation.flush()
+        if stats_file is not None:
+            stats_file.close()
 
+
+def _run_interactive(commands):
     while True:
         user_input = input()
-        input_items = user_input.split(' ')
-        cmd_name = input_items[0]
-        cmd_args = input_items[1:]
-        try:
-            cmd = commands[cmd_name]
-            cmd.execute(*cmd_args)
-        except KeyError:
-            print("Unknown command")
-        except (ValueError, TypeError) as ex:
-            print(str(ex))
+        if instrumentation is None:
+            _interact(commands, user_input)
         else:
-            print(str(canvas))
+            with instrumentation.measure(user_input.split(' ')[0]):
+                _interact(commands, user_input)
+
+
+def _interact(commands, user_input):
+    error, output = execute_command_line(commands, user_input)
+    if error is not None:
+        print(error)
+    elif output is not None:
+        print(output)
+    else:
+        _render(sys.stdout, workspace.current)
+
+
+def _run_script_to_stdout(script, args):
+    with open(sys.stdout.fileno(), 'w', buffering=OUTPUT_BUFFER_SIZE,
+              encoding=sys.stdout.encoding, closefd=False) as output:
+        sys.stdout.flush()
+        succeeded = run_script(script, output, args.render, args.check, args.optimize,
+                               instrumentation)
+    if args.check and not succeeded:
+        sys.exit(1)
+
+
+def run_script(script, output, render='final', check=False, optimized=False,
+               instrumentation_to_use=None):
+    """
+    Compiles the commands of a script, reports the invalid ones, then executes
+    the valid ones without rendering the canvas after each one
+
+    Args:
+        script: an iterable of command lines
+        output: the text stream the errors and rendered canvases are written to
+        render: 'final' to render the canvas once all the commands have been
+            executed, 'never' to not render it, or a number N to render it every
+            N valid commands. The canvas is also rendered by the P command.
+        check: whether to only compile the script, without executing it
+        optimized: whether to skip the operations that do not change the output
+            of the script, which is reported on the standard error. The canvas
+            must not be rendered every N commands.
+        instrumentation_to_use: the Instrumentation recording the cost of the
+            commands, None to not record it
+
+    Returns:
+        True if every command was valid and has been executed, False otherwise
+    """
+    canvas = workspace.current
+    size = (canvas.width, canvas.height) if canvas is not None else None
+    operations, errors = compile_script(script, size, workspace.sizes(),
+                                        workspace.current_name)
+    for line_number, error in errors:
+        output.write("line {}: {}\n".format(line_number, error))
+    if check:
+        return not errors
+    if optimized:
+        operations, eliminated_count = optimize(operations)
+        print("{} operations eliminated".format(eliminated_count), file=sys.stderr)
+
+    every = 0 if render in ('final', 'never') else int(render)
+    executor = ScriptExecutor(instrumentation=instrumentation_to_use, workspace=workspace,
+                              command_log=command_log)
+    succeeded = not errors
+    for executed_count, operation in enumerate(operations, 1):
+        if isinstance(operation, Exit):
+            break
+        render_now = every and executed_count % every == 0
+        if instrumentation_to_use is None:
+            error = _run_operation(executor, operation, output, render_now, None)
+        else:
+            with instrumentation_to_use.measure(COMMAND_NAMES[type(operation)]):
+                error = _run_operation(executor, operation, output, render_now,
+                                       instrumentation_to_use)
+        if error is not None:
+            output.write("line {}: {}\n".format(operation.line_number, error))
+            succeeded = False
+            # the next operations were compiled for the size of the canvas to open
+            if isinstance(operation, OpenCanvas):
+                break
+    if render == 'final':
+        _render(output, workspace.current)
+    return succeeded
+
+
+def _run_operation(executor, operation, output, render_now, instrumentation_to_use):
+    error = executor.execute(operation)
+    if error is not None:
+        return error
+    if isinstance(operation, Stats):
+        if instrumentation_to_use is None:
+            return INSTRUMENTATION_DISABLED
+        output.write(instrumentation_to_use.summary())
+        output.write('\n')
+    elif isinstance(operation, ListCanvases):
+        output.write(executor.workspace.describe())
+        output.write('\n')
+    elif isinstance(operation, Print) or render_now:
+        _render(output, executor.canvas)
+    return None
+
+
+def _render(output, canvas_to_render):
+    if canvas_to_render is None:
+        return
+    if encoder is None:
+        canvas_to_render.render_to(output, viewport)
+    else:
+        output.write(encoder.encode(canvas_to_render))
+    output.write('\n')
+
+
+def _parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Console drawing program")
+    parser.add_argument('--script', metavar='FILE',
+                        help="execute the commands of FILE ('-' for the standard input)")
+    parser.add_argument('--render', default='final', type=_render_policy,
+                        help="with --script, when to render the canvas: "
+                             "'final' (default), 'never' or every N commands")
+    parser.add_argument('--check', action='store_true',
+                        help="with --script, only report the invalid commands")
+    parser.add_argument('--optimize', action='store_true',
+                        help="with --script, skip the commands that do not change "
+                             "the output, such as draws that are later drawn over")
+    parser.add_argument('--output', choices=(FRAMES, ROWS, CELLS), default=FRAMES,
+                        help="output the whole canvas (default), or after a first "
+                             "keyframe only its changed rows or run-length encoded cells")
+    parser.add_argument('--keyframe-every', metavar='N', type=int,
+                        default=DEFAULT_KEYFRAME_EVERY,
+                        help="with --output rows or cells, the number of diffs "
+                             "between 2 full keyframes")
+    parser.add_argument('--viewport', metavar=('X1', 'Y1', 'X2', 'Y2'), type=int, nargs=4,
+                        help="only output the cells of the canvas between the corners "
+                             "(X1, Y1) and (X2, Y2)")
+    parser.add_argument('--instrument', action='store_true',
+                        help="record the cost of each command, printed by the T command")
+    parser.add_argument('--stats-file', metavar='FILE',
+                        help="record the cost of each command and append the records "
+                             "to FILE as JSON lines")
+    parser.add_argument('--stats-every', metavar='N', type=int, default=DEFAULT_DUMP_EVERY,
+                        help="the number of records appended to the --stats-file at once")
+    parser.add_argument('--workspace-budget', metavar='MB', type=int,
+                        default=DEFAULT_MAX_BYTES // MEGABYTE,
+                        help="the memory the canvases of the workspace may use before "
+                             "the least recently used ones are moved to disk")
+    parser.add_argument('--log', metavar='FILE',
+                        help="write the commands changing the canvases to FILE as a "
+                             "binary command log")
+    parser.add_argument('--checkpoint-every', metavar='N', type=int,
+                        default=DEFAULT_CHECKPOINT_EVERY,
+                        help="with --log, the number of logged commands between 2 "
+                             "checkpoints holding the canvases, 0 for none")
+    parser.add_argument('--replay', metavar='FILE',
+                        help="replay the binary command log FILE before the script or "
+                             "the interactive session")
+    args = parser.parse_args(argv)
+    if args.optimize and args.render not in ('final', 'never'):
+        parser.error("--optimize cannot be used with --render N")
+    if args.viewport is not None and args.output != FRAMES:
+        parser.error("--viewport cannot be used with --output rows or cells")
+    return args
+
+
+def _render_policy(value):
+    if value in ('final', 'never') or (value.isdigit() and int(value) > 0):
+        return value
+    raise argparse.ArgumentTypeError("expected 'final', 'never' or a positive number")
 
 
 def _create_commands_dictionary():
-    def assign_canvas_fn(new_canvas):
+    def assign_canvas_fn(new_canvas, name=None):
         #pylint: disable=missing-docstring
-        global canvas
-        canvas = new_canvas
-
-    return {
-        'C': CreateCanvasCommand(assign_canvas_fn),
-        'L': DrawLineCommand(lambda: canvas),
-        'R': DrawRectangleCommand(lambda: canvas),
-        'B': BucketFillCommand(lambda: canvas),
-        'D': DeleteCommand(lambda: canvas),
-        'U': UndoCommand(lambda: canvas),
-        'Q': ExitCommand()
-    }
+        new_canvas.instrumentation = instrumentation
+        workspace.add(name or workspace.current_name or DEFAULT_NAME, new_canvas)
+
+    return create_commands_dictionary(_get_canvas, assign_canvas_fn,
+                                      lambda: instrumentation, lambda: workspace,
+                                      _log_operation)
+
+
+def _log_operation(operation):
+    if command_log is not None:
+        command_log.write(operation)
+
+
+def _get_canvas():
+    canvas = workspace.current
+    if canvas is None:
+        raise ValueError("No canvas, create one first")
+    return canvas
 
 
 if __name__ == "__main__":
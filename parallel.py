@@ -0,0 +1,297 @@
+"""
+This module defines the parallel execution mode of a canvas
+
+The cells are stored in a shared memory block (multiprocessing.shared_memory),
+so that the processes of a pool can read and write them without pickling them.
+The canvas is split in bands of consecutive rows, one task per band:
+
+- rendering: each task copies the colours of its rows into a shared output
+  buffer that already holds the frame borders, and only the bands holding
+  modified rows are rendered again;
+- bucket fill: each task labels the connected runs of cells of its band, the
+  labels of the runs touching the band boundaries are merged across bands, and
+  each task then paints the runs connected to the filled point.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import weakref
+
+from storage import DenseGrid, ROW
+
+# the shared memory blocks attached by the current worker process, by name
+_attached_blocks = {}
+
+
+class ParallelEngine(object):
+    """
+    Holds the cells of a canvas in shared memory and renders and fills them with
+    a pool of processes
+
+    Args:
+        width, height: the size of the canvas
+        type_code, colour_code: the initial content of every cell
+        workers: the number of processes of the pool
+        bands: the number of bands the canvas is split in, 4 per worker by default
+    """
+    def __init__(self, width, height, type_code, colour_code, workers, bands=None):
+        self.width = width
+        self.height = height
+        self.workers = workers
+        size = width * height
+        self._line_size = width + 3
+        self._cells = shared_memory.SharedMemory(create=True, size=max(1, 2 * size))
+        self._frame = shared_memory.SharedMemory(
+            create=True, size=max(1, height * self._line_size))
+        planes = (self._cells.buf[:size], self._cells.buf[size:2 * size])
+        planes[0][:] = bytes([type_code]) * size
+        planes[1][:] = bytes([colour_code]) * size
+        self.grid = DenseGrid(width, height, types=planes[0], colours=planes[1])
+        self._frame.buf[:height * self._line_size] = (
+            b'|' + b' ' * width + b'|\n') * height
+        self._pool = ProcessPoolExecutor(max_workers=workers)
+        band_count = max(1, min(height, bands or 4 * workers))
+        limits = [height * index // band_count for index in range(band_count + 1)]
+        self._bands = list(zip(limits, limits[1:]))
+        self._stale_bands = set(range(len(self._bands)))
+        self._text = None
+        self._border = ' ' + '-' * width + ' '
+        # the rows modified since the previous take_changed_rows() call
+        self._changed_rows = None
+        self._finalizer = weakref.finalize(
+            self, _release, self._pool, planes, self._cells, self._frame)
+
+    def close(self):
+        """
+        Stops the processes and releases the shared memory
+        """
+        self._finalizer()
+
+    def render(self):
+        """
+        Returns the text representation of the canvas
+        """
+        dirty_rows, self.grid.dirty_rows = self.grid.dirty_rows, set()
+        for y in dirty_rows:
+            self._stale_bands.add(self._band_index(y))
+        if self._changed_rows is not None:
+            self._changed_rows.update(dirty_rows)
+        if self._stale_bands:
+            futures = [self._pool.submit(_render_band, self._cells.name, self._frame.name,
+                                         self.width, self.height, start, stop)
+                       for start, stop in (self._bands[index] for index in self._stale_bands)]
+            for future in futures:
+                future.result()
+            self._stale_bands.clear()
+            self._text = None
+        if self._text is None:
+            frame = bytes(self._frame.buf[:self.height * self._line_size]).decode('latin-1')
+            self._text = self._border + '\n' + frame + self._border
+        return self._text
+
+    def take_changed_rows(self):
+        """
+        Returns the rows modified since the previous call, as a list of
+        (y, None, cells) tuples sorted by y, where the cells are the text of the
+        row without its frame: the previous text of the rows is not kept. The
+        first call returns every row.
+        """
+        if self._changed_rows is None:
+            self._changed_rows = set()
+            self.render()
+            rows = range(self.height)
+        else:
+            self.render()
+            rows = sorted(self._changed_rows)
+            self._changed_rows = set()
+        frame = self._frame.buf
+        return [(y, None, bytes(frame[y * self._line_size + 1:y * self._line_size + 1 + self.width])
+                 .decode('latin-1')) for y in rows]
+
+    def bucket_fill(self, x, y, new_type, new_colour):
+        """
+        Paints the cells connected to (x, y) that have the same content type
+
+        Args:
+            x, y: the coordinates of the point to fill from
+            new_type: the content type code to set to the painted cells
+            new_colour: the colour code to set to the painted cells
+        """
+        type_to_fill, _ = self.grid.get(x, y)
+        arguments = (self._cells.name, self.width, self.height, type_to_fill)
+        boundaries = [future.result() for future in [
+            self._pool.submit(_label_band_boundaries, *(arguments + band + (x, y)))
+            for band in self._bands]]
+
+        # merge the labels of the runs touching across each band boundary
+        parents = {}
+        for index, (_, last_row_runs, _) in enumerate(boundaries[:-1]):
+            for label, next_label in _overlapping_runs(last_row_runs, boundaries[index + 1][0]):
+                _union(parents, (index, label), (index + 1, next_label))
+        seed_band = self._band_index(y)
+        seed_label = boundaries[seed_band][2]
+        seed_root = _find(parents, (seed_band, seed_label))
+        labels_to_fill = [set() for _ in self._bands]
+        labels_to_fill[seed_band].add(seed_label)
+        for band_index, label in list(parents):
+            if _find(parents, (band_index, label)) == seed_root:
+                labels_to_fill[band_index].add(label)
+
+        futures = [self._pool.submit(_fill_band, *(arguments + band + (
+            labels, new_type, new_colour)))
+                   for band, labels in zip(self._bands, labels_to_fill) if labels]
+        recorder = self.grid.recorder
+        for future in futures:
+            for row, start, old_types, old_colours in future.result():
+                self.grid.dirty_rows.add(row)
+                if recorder is not None:
+                    recorder.append((ROW, row, start, old_types, old_colours,
+                                     new_type, new_colour))
+
+    def _band_index(self, y):
+        band_count = len(self._bands)
+        index = y * band_count // self.height
+        while self._bands[index][0] > y:
+            index -= 1
+        while self._bands[index][1] <= y:
+            index += 1
+        return index
+
+
+def _release(pool, planes, *blocks):
+    pool.shutdown()
+    # the shared memory can only be closed once its views are released
+    for plane in planes:
+        plane.release()
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def _attach(name):
+    block = _attached_blocks.get(name)
+    if block is None:
+        block = shared_memory.SharedMemory(name=name)
+        _attached_blocks[name] = block
+    return block.buf
+
+
+def _render_band(cells_name, frame_name, width, height, start, stop):
+    colours = _attach(cells_name)[width * height:2 * width * height]
+    frame = _attach(frame_name)
+    line_size = width + 3
+    for y in range(start, stop):
+        offset = y * line_size + 1
+        frame[offset:offset + width] = colours[y * width:(y + 1) * width]
+
+
+def _label_runs(cells_name, width, height, type_to_fill, start, stop):
+    """
+    Labels the runs of cells of type `type_to_fill` of the rows [start, stop[,
+    two runs having the same label if they are connected inside the band
+
+    Returns:
+        the list of the runs of each row, as (start, stop, label) tuples
+        and the union-find parents of the labels
+    """
+    types = _attach(cells_name)[:width * height]
+    mask = bytes(int(code == type_to_fill) for code in range(256))
+    parents = []
+    rows = []
+    previous_runs = []
+    for y in range(start, stop):
+        row = bytes(types[y * width:(y + 1) * width]).translate(mask)
+        runs = []
+        run_start = row.find(1)
+        while run_start != -1:
+            run_stop = row.find(0, run_start)
+            if run_stop == -1:
+                run_stop = width
+            label = len(parents)
+            parents.append(label)
+            runs.append((run_start, run_stop, label))
+            run_start = row.find(1, run_stop)
+        # runs of consecutive rows are connected when they overlap
+        for label, previous_label in _overlapping_runs(runs, previous_runs):
+            _union_labels(parents, label, previous_label)
+        rows.append(runs)
+        previous_runs = runs
+    return rows, parents
+
+
+def _label_band_boundaries(cells_name, width, height, type_to_fill, start, stop, x, y):
+    """
+    Returns the labelled runs of the first and last rows of a band, and the
+    label of the run holding (x, y) if it is in the band
+    """
+    rows, parents = _label_runs(cells_name, width, height, type_to_fill, start, stop)
+    seed_label = None
+    if start <= y < stop:
+        for run_start, run_stop, label in rows[y - start]:
+            if run_start <= x < run_stop:
+                seed_label = _find_label(parents, label)
+    return ([(run_start, run_stop, _find_label(parents, label))
+             for run_start, run_stop, label in rows[0]],
+            [(run_start, run_stop, _find_label(parents, label))
+             for run_start, run_stop, label in rows[-1]],
+            seed_label)
+
+
+def _overlapping_runs(runs, other_runs):
+    """
+    Generates the (label, other label) pairs of the overlapping runs of 2 lists
+    of (start, stop, label) runs sorted by start
+    """
+    index = 0
+    for start, stop, label in runs:
+        while index < len(other_runs) and other_runs[index][1] <= start:
+            index += 1
+        overlapping = index
+        while overlapping < len(other_runs) and other_runs[overlapping][0] < stop:
+            yield label, other_runs[overlapping][2]
+            overlapping += 1
+
+
+def _fill_band(cells_name, width, height, type_to_fill, start, stop, labels,
+               new_type, new_colour):
+    rows, parents = _label_runs(cells_name, width, height, type_to_fill, start, stop)
+    cells = _attach(cells_name)
+    types, colours = cells[:width * height], cells[width * height:2 * width * height]
+    changes = []
+    for y, runs in zip(range(start, stop), rows):
+        for run_start, run_stop, label in runs:
+            if _find_label(parents, label) in labels:
+                cells_to_fill = slice(y * width + run_start, y * width + run_stop)
+                changes.append((y, run_start, bytes(types[cells_to_fill]),
+                                bytes(colours[cells_to_fill])))
+                types[cells_to_fill] = bytes([new_type]) * (run_stop - run_start)
+                colours[cells_to_fill] = bytes([new_colour]) * (run_stop - run_start)
+    return changes
+
+
+def _find_label(parents, label):
+    while parents[label] != label:
+        parents[label] = parents[parents[label]]
+        label = parents[label]
+    return label
+
+
+def _union_labels(parents, label, other_label):
+    root, other_root = _find_label(parents, label), _find_label(parents, other_label)
+    if root != other_root:
+        parents[max(root, other_root)] = min(root, other_root)
+
+
+def _find(parents, key):
+    root = key
+    while parents.setdefault(root, root) != root:
+        root = parents[root]
+    while key != root:
+        parents[key], key = root, parents[key]
+    return root
+
+
+def _union(parents, key, other_key):
+    root, other_root = _find(parents, key), _find(parents, other_key)
+    if root != other_root:
+        parents[other_root] = root
@@ -0,0 +1,472 @@
+"""
+This module compiles the command lines of a script into typed operations and
+executes them on a canvas
+
+A script is compiled in a single pass before any drawing starts: the number and
+the integer conversion of the arguments, the colours and the coordinates are all
+checked against the size the canvas will have when each command runs, so that
+the executor only runs valid operations, with the shapes they draw already built.
+
+The size of the canvas is followed through the script: it is set by the C
+commands and by the O commands, whose file header is read at compile time (or
+whose size is the one of the canvas saved to the same path earlier in the script).
+The size of each named canvas of the workspace is followed the same way, through
+the N commands creating them and the W commands switching to them.
+
+The operations can then be optimized (see optimize()) by removing the ones that
+cannot change the final canvas nor the files and frames the script outputs.
+"""
+
+from collections import deque, namedtuple
+
+from canvas import Canvas, Line, Point, Rectangle, colour_code
+from storage import read_file_size
+from workspace import DEFAULT_NAME, Workspace
+
+CreateCanvas = namedtuple('CreateCanvas', ['line_number', 'width', 'height'])
+NewCanvas = namedtuple('NewCanvas', ['line_number', 'name', 'width', 'height'])
+SwitchCanvas = namedtuple('SwitchCanvas', ['line_number', 'name'])
+ListCanvases = namedtuple('ListCanvases', ['line_number'])
+OpenCanvas = namedtuple('OpenCanvas', ['line_number', 'path', 'width', 'height'])
+SaveCanvas = namedtuple('SaveCanvas', ['line_number', 'path'])
+DrawLine = namedtuple('DrawLine', ['line_number', 'line'])
+DrawRectangle = namedtuple('DrawRectangle', ['line_number', 'rectangle'])
+DrawFilledRectangle = namedtuple('DrawFilledRectangle', ['line_number', 'rectangle'])
+BucketFill = namedtuple('BucketFill', ['line_number', 'point', 'colour'])
+Delete = namedtuple('Delete', ['line_number', 'point'])
+Undo = namedtuple('Undo', ['line_number'])
+Redo = namedtuple('Redo', ['line_number'])
+Print = namedtuple('Print', ['line_number'])
+Stats = namedtuple('Stats', ['line_number'])
+Exit = namedtuple('Exit', ['line_number'])
+
+# the command letter of each operation type
+COMMAND_NAMES = {
+    CreateCanvas: 'C',
+    NewCanvas: 'N',
+    SwitchCanvas: 'W',
+    ListCanvases: 'A',
+    OpenCanvas: 'O',
+    SaveCanvas: 'S',
+    DrawLine: 'L',
+    DrawRectangle: 'R',
+    DrawFilledRectangle: 'F',
+    BucketFill: 'B',
+    Delete: 'D',
+    Undo: 'U',
+    Redo: 'Y',
+    Print: 'P',
+    Stats: 'T',
+    Exit: 'Q'
+}
+
+# the number of the nearest filled rectangles a draw is checked to be covered by
+_COVERING_RECTANGLES = 64
+
+
+class CompileError(Exception):
+    #pylint: disable=missing-docstring
+    pass
+
+
+class ScriptCompiler(object):
+    """
+    Compiles command lines into operations, following the size of the canvas
+
+    Args:
+        size: the (width, height) of the canvas before the first command, None
+            if there is no canvas yet
+        canvas_sizes: the (width, height) of the canvases of the workspace
+            before the first command, by name
+        canvas_name: the name of the current canvas before the first command
+    """
+    def __init__(self, size=None, canvas_sizes=None, canvas_name=None):
+        self.size = size
+        self.canvas_name = canvas_name
+        self._canvas_sizes = dict(canvas_sizes or {})
+        self._saved_sizes = {}
+        self._compilers = {
+            'C': self._compile_create,
+            'N': self._compile_new,
+            'W': self._compile_switch,
+            'A': lambda line_number, _: ListCanvases(line_number),
+            'O': self._compile_open,
+            'S': self._compile_save,
+            'L': self._compile_draw_line,
+            'R': self._compile_draw_rectangle,
+            'F': self._compile_draw_filled_rectangle,
+            'B': self._compile_bucket_fill,
+            'D': self._compile_delete,
+            'U': self._compile_undo,
+            'Y': self._compile_redo,
+            'P': lambda line_number, _: Print(line_number),
+            'T': lambda line_number, _: Stats(line_number),
+            'Q': lambda line_number, _: Exit(line_number)
+        }
+
+    def compile(self, line_number, user_input):
+        """
+        Returns the operation of a command line
+
+        Args:
+            line_number: the number of the line in the script
+            user_input: the command line, without its line terminator
+
+        Raises:
+            CompileError: with the message to report when the command is invalid
+        """
+        input_items = user_input.split(' ')
+        compiler = self._compilers.get(input_items[0])
+        if compiler is None:
+            raise CompileError("Unknown command")
+        return compiler(line_number, input_items[1:])
+
+    def _compile_create(self, line_number, args):
+        if len(args) < 2:
+            raise CompileError("2 arguments expected (width, heigth)")
+        width, height = _size(args[0], args[1])
+        self._set_size((width, height))
+        return CreateCanvas(line_number, width, height)
+
+    def _compile_new(self, line_number, args):
+        if len(args) < 3:
+            raise CompileError("3 arguments expected (name, width, heigth)")
+        width, height = _size(args[1], args[2])
+        self.canvas_name = args[0]
+        self._set_size((width, height))
+        return NewCanvas(line_number, args[0], width, height)
+
+    def _compile_switch(self, line_number, args):
+        if len(args) < 1:
+            raise CompileError("1 argument expected (name)")
+        size = self._canvas_sizes.get(args[0])
+        if size is None:
+            raise CompileError("No canvas named " + args[0])
+        self.canvas_name, self.size = args[0], size
+        return SwitchCanvas(line_number, args[0])
+
+    def _compile_open(self, line_number, args):
+        path = _path(args)
+        size = self._saved_sizes.get(path)
+        if size is None:
+            try:
+                size = read_file_size(path)
+            except OSError as ex:
+                raise CompileError("Cannot open the canvas: " + str(ex)) from None
+            except ValueError as ex:
+                raise CompileError(str(ex)) from None
+        self._set_size(size)
+        return OpenCanvas(line_number, path, size[0], size[1])
+
+    def _compile_save(self, line_number, args):
+        path = _path(args)
+        self._saved_sizes[path] = self._canvas_size()
+        return SaveCanvas(line_number, path)
+
+    def _compile_draw_line(self, line_number, args):
+        from_point, to_point = self._corners(args)
+        return DrawLine(line_number, Line(from_point, to_point))
+
+    def _compile_draw_rectangle(self, line_number, args):
+        return DrawRectangle(line_number, Rectangle(*self._corners(args)))
+
+    def _compile_draw_filled_rectangle(self, line_number, args):
+        return DrawFilledRectangle(line_number, Rectangle(*self._corners(args)))
+
+    def _compile_bucket_fill(self, line_number, args):
+        if len(args) < 3:
+            raise CompileError("3 arguments expected (x, y, colour)")
+        point = self._point(args[0], args[1])
+        try:
+            colour_code(args[2])
+        except ValueError as ex:
+            raise CompileError(str(ex)) from None
+        return BucketFill(line_number, point, args[2])
+
+    def _compile_delete(self, line_number, args):
+        if len(args) < 2:
+            raise CompileError("2 arguments expected (x, y)")
+        return Delete(line_number, self._point(args[0], args[1]))
+
+    def _compile_undo(self, line_number, _):
+        self._canvas_size()
+        return Undo(line_number)
+
+    def _compile_redo(self, line_number, _):
+        self._canvas_size()
+        return Redo(line_number)
+
+    def _corners(self, args):
+        #pylint: disable=invalid-name
+        if len(args) < 4:
+            raise CompileError("4 arguments expected (x1, y1, x2, y2)")
+        width, height = self._canvas_size()
+        try:
+            x1, y1, x2, y2 = int(args[0]), int(args[1]), int(args[2]), int(args[3])
+        except ValueError:
+            raise CompileError("Coordinates must be convertible to integers") from None
+        if not (0 <= x1 < width and 0 <= x2 < width and 0 <= y1 < height and 0 <= y2 < height):
+            raise CompileError("Out of canvas bounds")
+        return Point(x1, y1), Point(x2, y2)
+
+    def _point(self, x, y):
+        #pylint: disable=invalid-name
+        width, height = self._canvas_size()
+        try:
+            x, y = int(x), int(y)
+        except ValueError:
+            raise CompileError("Coordinates must be convertible to integers") from None
+        if not (0 <= x < width and 0 <= y < height):
+            raise CompileError("Out of canvas bounds")
+        return Point(x, y)
+
+    def _set_size(self, size):
+        self.size = size
+        if self.canvas_name is None:
+            self.canvas_name = DEFAULT_NAME
+        self._canvas_sizes[self.canvas_name] = size
+
+    def _canvas_size(self):
+        if self.size is None:
+            raise CompileError("No canvas, create one first")
+        return self.size
+
+
+class ScriptExecutor(object):
+    """
+    Executes compiled operations on the current canvas of a workspace
+
+    Args:
+        canvas: the canvas before the first operation, None if there is none
+            yet, added to a new workspace when none is given
+        instrumentation: the Instrumentation of the canvases the executor
+            creates or opens, None to not instrument them
+        workspace: the workspace holding the canvases
+        command_log: the CommandLogWriter the executed operations are written
+            to (see commandlog.py), None to not log them
+    """
+    def __init__(self, canvas=None, instrumentation=None, workspace=None, command_log=None):
+        if workspace is None:
+            workspace = Workspace()
+            if canvas is not None:
+                workspace.add(DEFAULT_NAME, canvas)
+        self.workspace = workspace
+        self.instrumentation = instrumentation
+        self.command_log = command_log
+        self._handlers = {
+            CreateCanvas: self._create,
+            NewCanvas: self._new,
+            SwitchCanvas: lambda operation: self.workspace.switch(operation.name),
+            ListCanvases: lambda _: None,
+            OpenCanvas: self._open,
+            SaveCanvas: self._save,
+            DrawLine: lambda operation: self.canvas.draw_line(operation.line),
+            DrawRectangle: lambda operation: self.canvas.draw_rectangle(operation.rectangle),
+            DrawFilledRectangle:
+                lambda operation: self.canvas.draw_filled_rectangle(operation.rectangle),
+            BucketFill:
+                lambda operation: self.canvas.bucket_fill(operation.point, operation.colour),
+            Delete: lambda operation: self.canvas.delete(operation.point),
+            Undo: lambda _: self.canvas.undo(),
+            Redo: lambda _: self.canvas.redo(),
+            Print: lambda _: None,
+            Stats: lambda _: None,
+            Exit: lambda _: None
+        }
+
+    def execute(self, operation):
+        """
+        Executes an operation
+
+        Only the file operations can fail, since the others have been validated
+        when compiled: their errors are returned rather than raised.
+
+        Returns:
+            the error message if the operation failed, None otherwise
+        """
+        error = self._handlers[type(operation)](operation)
+        if error is None and self.command_log is not None:
+            self.command_log.write(operation)
+        return error
+
+    @property
+    def canvas(self):
+        """
+        The current canvas, None if there is none yet
+        """
+        return self.workspace.current
+
+    def _assign(self, canvas, name=None):
+        self.workspace.add(name or self.workspace.current_name or DEFAULT_NAME, canvas)
+
+    def _create(self, operation):
+        self._assign(Canvas(operation.width, operation.height,
+                            instrumentation=self.instrumentation))
+
+    def _new(self, operation):
+        self._assign(Canvas(operation.width, operation.height,
+                            instrumentation=self.instrumentation), operation.name)
+
+    def _open(self, operation):
+        try:
+            canvas = Canvas.load(operation.path, instrumentation=self.instrumentation)
+        except OSError as ex:
+            return "Cannot open the canvas: " + str(ex)
+        except ValueError as ex:
+            return str(ex)
+        if (canvas.width, canvas.height) != (operation.width, operation.height):
+            return "The canvas file has changed since the script was compiled"
+        self._assign(canvas)
+        return None
+
+    def _save(self, operation):
+        try:
+            self.canvas.save(operation.path)
+        except OSError as ex:
+            return "Cannot save the canvas: " + str(ex)
+        return None
+
+
+def compile_script(script, size=None, canvas_sizes=None, canvas_name=None):
+    """
+    Compiles the command lines of a script, skipping the blank ones and
+    stopping after the first Q command
+
+    Args:
+        script: an iterable of command lines
+        size: the (width, height) of the canvas before the script, None if
+            there is no canvas yet
+        canvas_sizes: the (width, height) of the canvases of the workspace
+            before the script, by name
+        canvas_name: the name of the current canvas before the script
+
+    Returns:
+        the list of the operations of the valid lines, and the list of the
+        (line number, error message) tuples of the invalid ones
+    """
+    compiler = ScriptCompiler(size, canvas_sizes, canvas_name)
+    operations = []
+    errors = []
+    for line_number, line in enumerate(script, 1):
+        user_input = line.rstrip('\r\n')
+        if user_input == '':
+            continue
+        try:
+            operation = compiler.compile(line_number, user_input)
+        except CompileError as ex:
+            errors.append((line_number, str(ex)))
+            continue
+        operations.append(operation)
+        if isinstance(operation, Exit):
+            break
+    return operations, errors
+
+
+def optimize(operations):
+    """
+    Returns the operations of a script without the ones that do not change the
+    final canvas, the saved files nor the printed frames:
+
+    - the operations followed by a C command before any S, P, T or workspace
+      command, since the canvas they draw on is replaced before it is saved,
+      printed, has its cost reported or is switched from;
+    - after the last U or Y command (the undo history of the operations before
+      it must be kept), the lines and rectangles entirely drawn over by a
+      later one before any fill, save, print or stats, and the fills immediately
+      followed by a fill or a delete from the same point, which paints the same
+      component since a fill does not change the content type of the cells.
+
+    The canvas must not be rendered every N commands, since the eliminated
+    operations would no longer be counted.
+
+    Args:
+        operations: the operations returned by compile_script()
+
+    Returns:
+        the list of the remaining operations, and the number of eliminated ones
+    """
+    kept = [True] * len(operations)
+    segment_start = 0
+    for index, operation in enumerate(operations):
+        if isinstance(operation, (SaveCanvas, Print, Stats, NewCanvas, SwitchCanvas,
+                                  ListCanvases)):
+            segment_start = index + 1
+        elif isinstance(operation, CreateCanvas):
+            for dead_index in range(segment_start, index):
+                kept[dead_index] = False
+            segment_start = index + 1
+
+    history_end = 0
+    for index, operation in enumerate(operations):
+        if kept[index] and isinstance(operation, (Undo, Redo)):
+            history_end = index + 1
+
+    # the draws of the current run are visited backwards, so that `later_draws`
+    # holds the keys of the lines and rectangles drawn after the visited one
+    later_draws = set()
+    later_rectangles = deque(maxlen=_COVERING_RECTANGLES)
+    next_operation = None
+    for index in range(len(operations) - 1, history_end - 1, -1):
+        operation = operations[index]
+        if not kept[index]:
+            continue
+        if isinstance(operation, (DrawLine, DrawRectangle, DrawFilledRectangle)):
+            key, box = _draw_key(operation), _bounding_box(operation)
+            if key in later_draws or any(_contains(rectangle, box)
+                                         for rectangle in later_rectangles):
+                kept[index] = False
+                continue
+            later_draws.add(key)
+            if isinstance(operation, DrawFilledRectangle):
+                later_rectangles.appendleft(box)
+        else:
+            later_draws.clear()
+            later_rectangles.clear()
+            if (isinstance(operation, BucketFill) and
+                    isinstance(next_operation, (BucketFill, Delete)) and
+                    next_operation.point == operation.point):
+                kept[index] = False
+                continue
+        next_operation = operation
+
+    remaining = [operation for index, operation in enumerate(operations) if kept[index]]
+    return remaining, len(operations) - len(remaining)
+
+
+def _draw_key(operation):
+    if isinstance(operation, DrawLine):
+        return DrawLine, operation.line.from_point, operation.line.to_point
+    if isinstance(operation, DrawRectangle):
+        return (DrawRectangle, operation.rectangle.top_left_point,
+                operation.rectangle.bottom_right_point)
+    return DrawFilledRectangle, _bounding_box(operation)
+
+
+def _bounding_box(operation):
+    if isinstance(operation, DrawLine):
+        first, second = operation.line.from_point, operation.line.to_point
+    else:
+        first, second = operation.rectangle.top_left_point, operation.rectangle.bottom_right_point
+    return (min(first.x, second.x), min(first.y, second.y),
+            max(first.x, second.x), max(first.y, second.y))
+
+
+def _contains(box, other_box):
+    return (box[0] <= other_box[0] and box[1] <= other_box[1] and
+            other_box[2] <= box[2] and other_box[3] <= box[3])
+
+
+def _size(width, height):
+    try:
+        width, height = int(width), int(height)
+    except ValueError:
+        raise CompileError("Width and heigth must be convertible to integers") from None
+    if width <= 0 or height <= 0:
+        raise CompileError("Width and heigth must be positive")
+    return width, height
+
+
+def _path(args):
+    if len(args) < 1:
+        raise CompileError("1 argument expected (path)")
+    return ' '.join(args)
@@ -0,0 +1,67 @@
+"""
+This module defines how a canvas is rendered as text
+"""
+
+
+class CanvasRenderer(object):
+    """
+    Renders the cells of a canvas storage as a framed block of text
+
+    The rendered rows are cached and only the rows listed in the `dirty_rows`
+    of the storage are rendered again. Once take_changed_rows() has been
+    called, the rows whose text changed are also kept track of, with their
+    previous text, until the next call.
+
+    Args:
+        grid: the storage holding the cells to render
+    """
+    def __init__(self, grid):
+        self._grid = grid
+        self._rows = [None] * grid.height
+        self._border = ' ' + '-' * grid.width + ' '
+        self._text = None
+        # y -> the text of the row at the previous take_changed_rows() call
+        self._changed_rows = None
+        grid.dirty_rows.update(range(grid.height))
+
+    def render(self):
+        """
+        Returns the text representation of the canvas
+        """
+        self.refresh()
+        if self._text is None:
+            self._text = '\n'.join([self._border] + self._rows + [self._border])
+        return self._text
+
+    def refresh(self):
+        """
+        Renders again the rows modified since the last refresh
+        """
+        grid, rows = self._grid, self._rows
+        dirty_rows, grid.dirty_rows = grid.dirty_rows, set()
+        if dirty_rows:
+            self._text = None
+        changed_rows = self._changed_rows
+        for y in dirty_rows:
+            row = '|' + grid.row_colours(y).decode('latin-1') + '|'
+            if changed_rows is not None and row != rows[y]:
+                changed_rows.setdefault(y, rows[y])
+            rows[y] = row
+
+    def take_changed_rows(self):
+        """
+        Returns the rows whose text changed since the previous call, as a list of
+        (y, previous cells, cells) tuples sorted by y, where the cells are the
+        text of the row without its frame. The first call returns every row,
+        with None as previous cells.
+        """
+        if self._changed_rows is None:
+            self.refresh()
+            self._changed_rows = {}
+            return [(y, None, row[1:-1]) for y, row in enumerate(self._rows)]
+        self.refresh()
+        changed_rows, self._changed_rows = self._changed_rows, {}
+        # a row may have changed back to its previous text since then
+        return [(y, previous_row[1:-1], self._rows[y][1:-1])
+                for y, previous_row in sorted(changed_rows.items())
+                if previous_row != self._rows[y]]
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+"""
+Canvas drawing server
+
+Serves many drawing sessions from one process with asyncio, over TCP or a Unix
+socket: each connection is a session with its own canvas, driven by the command
+language of the application (see commands.py), one command per line.
+
+Each command line gets one response, made of a header line possibly followed
+by text lines:
+
+- "FRAME n": the n lines of the canvas rendered after the command;
+- "DIFF n": with --output rows or cells, the n lines of the keyframe or of the
+  diff of the canvas after the command (see diff.py);
+- "TEXT n": the n lines output by the command instead of the canvas (T);
+- "ERROR message": the command failed;
+- "BYE": the session is over (Q), the connection is then closed.
+
+The text is encoded in latin-1, like the colours of the canvas. The commands
+that change or render the canvas, whose cost grows with its size, run in a
+thread pool together with the rendering of their frame, so that a large
+session does not stall the other ones: only the commands that neither change
+nor render it run on the event loop.
+
+    python server.py [--host 127.0.0.1] [--port 8765] [--unix PATH] [--workers N]
+                     [--instrument] [--output frames|rows|cells] [--keyframe-every N]
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from commands import create_commands_dictionary, execute_command_line
+from diff import CELLS, DEFAULT_KEYFRAME_EVERY, ROWS, DiffEncoder
+from instrumentation import Instrumentation
+
+DEFAULT_PORT = 8765
+FRAMES = 'frames'
+ENCODING = 'latin-1'
+
+# the commands executed on the event loop rather than in the thread pool
+INLINE_COMMANDS = frozenset('TQ')
+
+
+class Session(object):
+    """
+    A drawing session: a canvas and the commands that draw on it
+
+    Args:
+        instrumentation: the Instrumentation of the canvas and of the stats
+            command, None to disable them
+        encoder: the DiffEncoder of the canvas states sent back, None to send
+            full frames
+    """
+    def __init__(self, instrumentation=None, encoder=None):
+        self.canvas = None
+        self.instrumentation = instrumentation
+        self.encoder = encoder
+        self.is_over = False
+        self._commands = create_commands_dictionary(
+            self._get_canvas, self._assign_canvas, lambda: self.instrumentation)
+
+    def execute(self, user_input):
+        """
+        Executes a command line and returns the response to send, as bytes
+        """
+        if self.instrumentation is None:
+            return self._execute(user_input)
+        with self.instrumentation.measure(user_input.split(' ')[0]):
+            return self._execute(user_input)
+
+    def _execute(self, user_input):
+        try:
+            error, output = execute_command_line(self._commands, user_input)
+        except SystemExit:
+            self.is_over = True
+            return b'BYE\n'
+        if error is not None:
+            return 'ERROR {}\n'.format(error).encode(ENCODING, 'replace')
+        if output is not None:
+            return _response('TEXT', output)
+        if self.canvas is None:
+            return _response('FRAME', '')
+        if self.encoder is not None:
+            return _response('DIFF', self.encoder.encode(self.canvas))
+        return _response('FRAME', str(self.canvas))
+
+    def close(self):
+        """
+        Releases the canvas of the session
+        """
+        if self.canvas is not None:
+            self.canvas.close()
+            self.canvas = None
+
+    def _get_canvas(self):
+        if self.canvas is None:
+            raise ValueError("No canvas, create one first")
+        return self.canvas
+
+    def _assign_canvas(self, canvas):
+        self.close()
+        canvas.instrumentation = self.instrumentation
+        self.canvas = canvas
+
+
+class CanvasServer(object):
+    """
+    Serves a drawing session per connection
+
+    Args:
+        workers: the number of threads executing the commands that change or
+            render the canvases
+        instrumentation_fn: a function returning the Instrumentation of a new
+            session, None to not instrument the sessions
+        encoder_fn: a function returning the DiffEncoder of a new session, None
+            to send full frames
+    """
+    def __init__(self, workers=None, instrumentation_fn=None, encoder_fn=None):
+        self.session_count = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._instrumentation_fn = instrumentation_fn
+        self._encoder_fn = encoder_fn
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT, path=None):
+        """
+        Starts listening and returns the asyncio server
+
+        Args:
+            host, port: the TCP address to listen on, port 0 for any free port
+            path: the path of a Unix socket to listen on instead
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self._serve_session, path=path)
+        return await asyncio.start_server(self._serve_session, host, port)
+
+    def close(self):
+        """
+        Stops the threads of the pool once their commands are done
+        """
+        self._executor.shutdown()
+
+    async def _serve_session(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        instrumentation = self._instrumentation_fn() if self._instrumentation_fn else None
+        session = Session(instrumentation, self._encoder_fn() if self._encoder_fn else None)
+        self.session_count += 1
+        try:
+            while not session.is_over:
+                line = await reader.readline()
+                if not line:
+                    break
+                user_input = line.decode(ENCODING).rstrip('\r\n')
+                if user_input == '':
+                    continue
+                if user_input[0] in INLINE_COMMANDS:
+                    response = session.execute(user_input)
+                else:
+                    response = await loop.run_in_executor(
+                        self._executor, session.execute, user_input)
+                writer.write(response)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.session_count -= 1
+            session.close()
+            writer.close()
+
+
+def _response(kind, text):
+    lines = text.split('\n') if text else []
+    return '{} {}\n{}'.format(kind, len(lines), ''.join(
+        line + '\n' for line in lines)).encode(ENCODING, 'replace')
+
+
+async def _serve_forever(args):
+    encoder_fn = None
+    if args.output != FRAMES:
+        encoder_fn = lambda: DiffEncoder(args.output, args.keyframe_every)
+    server = CanvasServer(args.workers, Instrumentation if args.instrument else None,
+                          encoder_fn)
+    listener = await server.start(args.host, args.port, args.unix)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+def main(argv=None):
+    """
+    Canvas server entry point
+    """
+    parser = argparse.ArgumentParser(description="Canvas drawing server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', metavar='PATH', help="listen on a Unix socket instead")
+    parser.add_argument('--workers', type=int,
+                        help="the number of threads executing the commands that "
+                             "change or render the canvases")
+    parser.add_argument('--instrument', action='store_true',
+                        help="record the cost of the commands of each session, "
+                             "printed by the T command")
+    parser.add_argument('--output', choices=(FRAMES, ROWS, CELLS), default=FRAMES,
+                        help="send the whole canvas (default), or after a first "
+                             "keyframe only its changed rows or run-length encoded cells")
+    parser.add_argument('--keyframe-every', metavar='N', type=int,
+                        default=DEFAULT_KEYFRAME_EVERY,
+                        help="with --output rows or cells, the number of diffs "
+                             "between 2 full keyframes")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve_forever(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
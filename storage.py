@@ -0,0 +1,1117 @@
+"""
+This module defines the storage engines holding the cells of a canvas
+
+A cell is stored as 2 bytes: a content type code and a colour code (the latin-1
+code of the colour character). DenseGrid lays all the cells out row by row so
+that a row can be read or written with a single slice operation, TiledGrid
+only allocates the tiles of the canvas that have been drawn on, and RunGrid
+holds each row as runs of identical cells. They all expose the same methods.
+
+Every write adds the indexes of the rows it modified to the `dirty_rows` set of
+the storage, which renderers use to only render again the modified rows, and
+increments its `version`, so that the indexes built from the cells can tell
+when they may be stale.
+
+While a storage has a `recorder` list, every write appends a change to it, so
+that the write can later be reverted or replayed. A change is a tuple:
+
+    (ROW, y, start, old_types, old_colours, new_types, new_colours)
+    (COLUMN, x, start, old_types, old_colours, new_types, new_colours)
+
+where the old contents are bytes and the new contents are either bytes or, for
+uniform writes, a single code. RunGrid records the old contents of a row stored
+as runs as a Runs instance instead, the old colours being None.
+
+Copying a storage is copy-on-write: the copy shares the cell buffers (planes,
+tiles or rows) of the original, and only the rows or tiles one of the storages
+sharing them writes to are duplicated, so that a copy costs no more than the
+bookkeeping of the buffers.
+"""
+
+import itertools
+import mmap
+import os
+import re
+import struct
+import tempfile
+import weakref
+import zlib
+
+ROW = 0
+COLUMN = 1
+
+# canvas files hold this header followed by the types plane and the colours plane
+FILE_MAGIC = b'PYCANVAS'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<8sHII')
+# cell dumps hold the same header followed by zlib-compressed spans of cells
+DUMP_MAGIC = b'PYCANVAZ'
+# y, start and number of cells of a span of a cell dump, followed by its types
+# and colours
+_SPAN_HEADER = struct.Struct('<III')
+_DUMP_CHUNK_SIZE = 1 << 16
+
+TILE_SIZE = 64
+
+MAX_ROW_RUNS = 64
+# approximate memory used by a run of a RunGrid row
+_RUN_NBYTES = 72
+_RUN_PATTERN = re.compile(b'(.)\\1*', re.DOTALL)
+
+
+class DenseGrid(object):
+    """
+    Stores every cell of a canvas in 2 flat planes (content types and colours)
+
+    The planes of a copied grid are shared with its copies and are no longer
+    written to: the rows written by each grid are duplicated into private rows,
+    which override the planes, until the grid is the last one sharing them.
+
+    Args:
+        width, height: the size of the grid
+        type_code, colour_code: the initial content of every cell
+        types, colours: optional pre-existing planes (any writable buffer of
+            width * height bytes) to use instead of allocating new ones
+    """
+    def __init__(self, width, height, type_code=0, colour_code=0, types=None, colours=None):
+        self.width = width
+        self.height = height
+        self.recorder = None
+        self.dirty_rows = set()
+        self.version = 0
+        size = width * height
+        if types is None:
+            types = bytearray([type_code]) * size
+        if colours is None:
+            colours = bytearray([colour_code]) * size
+        if len(types) != size or len(colours) != size:
+            raise ValueError("Planes must contain exactly width * height cells")
+        self._types = types
+        self._colours = colours
+        # y -> the private (types, colours) bytearrays of a row, while the
+        # planes are shared with copies of the grid, None otherwise
+        self._rows = None
+        # the indexes of the private rows that may be shared with copies too
+        self._shared_rows = set()
+        self._sharing = None
+        self._sharing_member = None
+
+    def get(self, x, y):
+        """
+        Returns the (type code, colour code) of a cell
+        """
+        if self._rows is not None:
+            row = self._rows.get(y)
+            if row is not None:
+                return row[0][x], row[1][x]
+        index = y * self.width + x
+        return self._types[index], self._colours[index]
+
+    def set(self, x, y, type_code, colour_code):
+        """
+        Sets the content of a single cell
+        """
+        if self.recorder is not None:
+            self._record(ROW, y, x, x + 1, type_code, colour_code)
+        if self._own_planes():
+            index = y * self.width + x
+            self._types[index] = type_code
+            self._colours[index] = colour_code
+        else:
+            row = self._own_row(y)
+            row[0][x] = type_code
+            row[1][x] = colour_code
+        self.dirty_rows.add(y)
+        self.version += 1
+
+    def row_types(self, y, start=0, stop=None):
+        """
+        Returns the content type codes of the cells [start, stop[ of a row, as bytes
+        """
+        return self._read_row(0, y, start, stop)
+
+    def row_colours(self, y, start=0, stop=None):
+        """
+        Returns the colour codes of the cells [start, stop[ of a row, as bytes
+        """
+        return self._read_row(1, y, start, stop)
+
+    def fill_span(self, y, start, stop, type_code, colour_code):
+        """
+        Sets the content of the cells [start, stop[ of a row
+        """
+        self._write(ROW, y, start, stop, bytes([type_code]) * (stop - start),
+                    bytes([colour_code]) * (stop - start), type_code, colour_code)
+
+    def fill_column(self, x, start, stop, type_code, colour_code):
+        """
+        Sets the content of the cells [start, stop[ of a column
+        """
+        self._write(COLUMN, x, start, stop, bytes([type_code]) * (stop - start),
+                    bytes([colour_code]) * (stop - start), type_code, colour_code)
+
+    def write_span(self, y, start, types, colours):
+        """
+        Sets the content type and colour codes of consecutive cells of a row
+        """
+        self._write(ROW, y, start, start + len(types), types, colours)
+
+    def write_column(self, x, start, types, colours):
+        """
+        Sets the content type and colour codes of consecutive cells of a column
+        """
+        self._write(COLUMN, x, start, start + len(types), types, colours)
+
+    def _row_slice(self, y, start, stop):
+        if stop is None:
+            stop = self.width
+        offset = y * self.width
+        return slice(offset + start, offset + stop)
+
+    def _column_slice(self, x, start, stop):
+        return slice(start * self.width + x, stop * self.width + x, self.width)
+
+    def _read_row(self, plane, y, start, stop):
+        if self._rows is not None:
+            row = self._rows.get(y)
+            if row is not None:
+                return bytes(row[plane][start:stop])
+        planes = self._types if plane == 0 else self._colours
+        return bytes(planes[self._row_slice(y, start, stop)])
+
+    def _read(self, kind, fixed, start, stop):
+        # returns the (types, colours) of the cells [start, stop[ of a row or a
+        # column, as bytes
+        if kind == ROW:
+            return self.row_types(fixed, start, stop), self.row_colours(fixed, start, stop)
+        if self._rows is None:
+            cells = self._column_slice(fixed, start, stop)
+            return bytes(self._types[cells]), bytes(self._colours[cells])
+        cells = [self.get(fixed, y) for y in range(start, stop)]
+        return bytes(cell[0] for cell in cells), bytes(cell[1] for cell in cells)
+
+    def _write(self, kind, fixed, start, stop, types, colours, type_code=None, colour_code=None):
+        # writes types and colours to the cells [start, stop[ of a row or a
+        # column, recording them as uniform codes for the fills
+        if self.recorder is not None:
+            if type_code is None:
+                type_code, colour_code = bytes(types), bytes(colours)
+            self._record(kind, fixed, start, stop, type_code, colour_code)
+        if self._own_planes():
+            if kind == ROW:
+                cells = self._row_slice(fixed, start, stop)
+            else:
+                cells = self._column_slice(fixed, start, stop)
+            self._types[cells] = types
+            self._colours[cells] = colours
+        elif kind == ROW:
+            row = self._own_row(fixed)
+            row[0][start:stop] = types
+            row[1][start:stop] = colours
+        else:
+            for index, y in enumerate(range(start, stop)):
+                row = self._own_row(y)
+                row[0][fixed] = types[index]
+                row[1][fixed] = colours[index]
+        self.version += 1
+        if kind == ROW:
+            self.dirty_rows.add(fixed)
+        else:
+            self.dirty_rows.update(range(start, stop))
+
+    def _own_planes(self):
+        # returns whether the planes can be written to, writing the private rows
+        # back to them first once the copies sharing them are gone
+        if self._rows is None:
+            return True
+        if self._sharing.count > 1:
+            return False
+        for y, (types, colours) in self._rows.items():
+            cells = self._row_slice(y, 0, None)
+            self._types[cells] = types
+            self._colours[cells] = colours
+        self._rows = None
+        self._shared_rows = set()
+        _leave_sharing(self)
+        return True
+
+    def _own_row(self, y):
+        # returns the private row to write to while the planes are shared,
+        # duplicated first from the planes, or from a private row copies of the
+        # grid may still share
+        row = self._rows.get(y)
+        if row is None or y in self._shared_rows:
+            self._shared_rows.discard(y)
+            if row is None:
+                cells = self._row_slice(y, 0, None)
+                row = (bytearray(self._types[cells]), bytearray(self._colours[cells]))
+            else:
+                row = (bytearray(row[0]), bytearray(row[1]))
+            self._rows[y] = row
+        return row
+
+    def _record(self, kind, fixed, start, stop, new_types, new_colours):
+        old_types, old_colours = self._read(kind, fixed, start, stop)
+        self.recorder.append((kind, fixed, start, old_types, old_colours,
+                              new_types, new_colours))
+
+    def content_spans(self):
+        """
+        Yields the (y, start, types, colours) spans of the cells the grid may
+        have changed from their initial content: here every row
+        """
+        return _row_spans(self)
+
+    def save(self, path):
+        """
+        Writes the grid to a canvas file
+
+        Args:
+            path: the path of the file to write
+        """
+        if self._rows is None:
+            _write_file(path, self, DenseGrid._write_planes)
+        else:
+            _write_file(path, self)
+
+    def _write_planes(self, file):
+        file.write(self._types)
+        file.write(self._colours)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns a grid read from a canvas file
+
+        The file is memory-mapped: its pages are only read when the cells they
+        hold are accessed, and the grid modifications are not written to the file.
+
+        Args:
+            path: the path of the file to read
+        """
+        with open(path, 'rb') as file:
+            width, height = _read_header(file)
+            size = width * height
+            if size == 0:
+                return cls(width, height)
+            cells = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY))
+        types = cells[FILE_HEADER.size:FILE_HEADER.size + size]
+        colours = cells[FILE_HEADER.size + size:]
+        return cls(width, height, types=types, colours=colours)
+
+    def copy(self):
+        """
+        Returns an independent copy of the grid, sharing its planes and private
+        rows: each grid then only duplicates the rows it writes to. The planes
+        of a loaded or shared memory grid are copied at once, since they can be
+        modified behind the grid.
+        """
+        if not isinstance(self._types, bytearray):
+            return DenseGrid(self.width, self.height,
+                             types=bytearray(self._types), colours=bytearray(self._colours))
+        grid = DenseGrid(self.width, self.height, types=self._types, colours=self._colours)
+        if self._rows is None:
+            self._rows = {}
+        grid._rows = dict(self._rows)
+        self._shared_rows = set(self._rows)
+        grid._shared_rows = set(self._rows)
+        _share(self, grid)
+        return grid
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes used to store the cells, counting the shared planes
+        """
+        private_nbytes = 2 * self.width * len(self._rows) if self._rows is not None else 0
+        return len(self._types) + len(self._colours) + private_nbytes
+
+    def __eq__(self, other):
+        if (not isinstance(other, DenseGrid) or self._rows is not None or
+                other._rows is not None):
+            return _have_same_cells(self, other)
+        return (self.width == other.width and self.height == other.height and
+                bytes(self._types) == bytes(other._types) and
+                bytes(self._colours) == bytes(other._colours))
+
+
+class TiledGrid(object):
+    """
+    Stores the cells of a canvas in square tiles that are only allocated when
+    some of their cells are first set to a content other than the initial one,
+    so that the memory used by a mostly blank canvas is proportional to its
+    drawn content rather than to its area
+
+    Each tile holds a types plane and a colours plane of TILE_SIZE * TILE_SIZE
+    cells, laid out row by row.
+
+    Args:
+        width, height: the size of the grid
+        type_code, colour_code: the initial content of every cell
+    """
+    def __init__(self, width, height, type_code=0, colour_code=0):
+        self.width = width
+        self.height = height
+        self.recorder = None
+        self.dirty_rows = set()
+        self.version = 0
+        self._type_code = type_code
+        self._colour_code = colour_code
+        self._blank_types = bytes([type_code]) * TILE_SIZE
+        self._blank_colours = bytes([colour_code]) * TILE_SIZE
+        self._tiles = {}
+        # the keys of the tiles that may be shared with copies of the grid
+        self._shared_tiles = set()
+        self._sharing = None
+        self._sharing_member = None
+
+    def get(self, x, y):
+        """
+        Returns the (type code, colour code) of a cell
+        """
+        tile = self._tiles.get((x // TILE_SIZE, y // TILE_SIZE))
+        if tile is None:
+            return self._type_code, self._colour_code
+        index = (y % TILE_SIZE) * TILE_SIZE + x % TILE_SIZE
+        return tile[0][index], tile[1][index]
+
+    def set(self, x, y, type_code, colour_code):
+        """
+        Sets the content of a single cell
+        """
+        self.fill_span(y, x, x + 1, type_code, colour_code)
+
+    def row_types(self, y, start=0, stop=None):
+        """
+        Returns the content type codes of the cells [start, stop[ of a row, as bytes
+        """
+        return self._read_row(0, self._blank_types, y, start, stop)
+
+    def row_colours(self, y, start=0, stop=None):
+        """
+        Returns the colour codes of the cells [start, stop[ of a row, as bytes
+        """
+        return self._read_row(1, self._blank_colours, y, start, stop)
+
+    def fill_span(self, y, start, stop, type_code, colour_code):
+        """
+        Sets the content of the cells [start, stop[ of a row
+        """
+        count = stop - start
+        if self.recorder is not None:
+            self.recorder.append((ROW, y, start, self.row_types(y, start, stop),
+                                  self.row_colours(y, start, stop), type_code, colour_code))
+        self._write_row(y, start, bytes([type_code]) * count, bytes([colour_code]) * count)
+
+    def fill_column(self, x, start, stop, type_code, colour_code):
+        """
+        Sets the content of the cells [start, stop[ of a column
+        """
+        count = stop - start
+        if self.recorder is not None:
+            old_types, old_colours = self._read_column(x, start, stop)
+            self.recorder.append((COLUMN, x, start, old_types, old_colours,
+                                  type_code, colour_code))
+        self._write_column(x, start, bytes([type_code]) * count, bytes([colour_code]) * count)
+
+    def write_span(self, y, start, types, colours):
+        """
+        Sets the content type and colour codes of consecutive cells of a row
+        """
+        types, colours = bytes(types), bytes(colours)
+        if self.recorder is not None:
+            stop = start + len(types)
+            self.recorder.append((ROW, y, start, self.row_types(y, start, stop),
+                                  self.row_colours(y, start, stop), types, colours))
+        self._write_row(y, start, types, colours)
+
+    def write_column(self, x, start, types, colours):
+        """
+        Sets the content type and colour codes of consecutive cells of a column
+        """
+        types, colours = bytes(types), bytes(colours)
+        if self.recorder is not None:
+            old_types, old_colours = self._read_column(x, start, start + len(types))
+            self.recorder.append((COLUMN, x, start, old_types, old_colours, types, colours))
+        self._write_column(x, start, types, colours)
+
+    def _read_row(self, plane, blank, y, start, stop):
+        if stop is None:
+            stop = self.width
+        tile_y, offset = divmod(y, TILE_SIZE)
+        offset *= TILE_SIZE
+        chunks = []
+        for tile_x, tile_start, tile_stop in _split(start, stop):
+            tile = self._tiles.get((tile_x, tile_y))
+            if tile is None:
+                chunks.append(blank[:tile_stop - tile_start])
+            else:
+                chunks.append(tile[plane][offset + tile_start:offset + tile_stop])
+        return b''.join(chunks)
+
+    def _read_column(self, x, start, stop):
+        tile_x, offset = divmod(x, TILE_SIZE)
+        types, colours = [], []
+        for tile_y, tile_start, tile_stop in _split(start, stop):
+            tile = self._tiles.get((tile_x, tile_y))
+            if tile is None:
+                types.append(self._blank_types[:tile_stop - tile_start])
+                colours.append(self._blank_colours[:tile_stop - tile_start])
+            else:
+                cells = slice(tile_start * TILE_SIZE + offset, tile_stop * TILE_SIZE + offset,
+                              TILE_SIZE)
+                types.append(bytes(tile[0][cells]))
+                colours.append(bytes(tile[1][cells]))
+        return b''.join(types), b''.join(colours)
+
+    def _write_row(self, y, start, types, colours):
+        tile_y, offset = divmod(y, TILE_SIZE)
+        offset *= TILE_SIZE
+        position = 0
+        for tile_x, tile_start, tile_stop in _split(start, start + len(types)):
+            count = tile_stop - tile_start
+            tile = self._get_tile(tile_x, tile_y, types, colours, position, count)
+            if tile is not None:
+                tile[0][offset + tile_start:offset + tile_stop] = types[position:position + count]
+                tile[1][offset + tile_start:offset + tile_stop] = colours[position:position + count]
+            position += count
+        self.dirty_rows.add(y)
+        self.version += 1
+
+    def _write_column(self, x, start, types, colours):
+        tile_x, offset = divmod(x, TILE_SIZE)
+        position = 0
+        for tile_y, tile_start, tile_stop in _split(start, start + len(types)):
+            count = tile_stop - tile_start
+            tile = self._get_tile(tile_x, tile_y, types, colours, position, count)
+            if tile is not None:
+                cells = slice(tile_start * TILE_SIZE + offset, tile_stop * TILE_SIZE + offset,
+                              TILE_SIZE)
+                tile[0][cells] = types[position:position + count]
+                tile[1][cells] = colours[position:position + count]
+            position += count
+        self.dirty_rows.update(range(start, start + len(types)))
+        self.version += 1
+
+    def _get_tile(self, tile_x, tile_y, types, colours, position, count):
+        # returns the tile to write types[position:position + count] to, or None
+        # when the tile is not allocated yet and the content to write is blank
+        key = (tile_x, tile_y)
+        tile = self._tiles.get(key)
+        if key in self._shared_tiles:
+            self._shared_tiles.discard(key)
+            if self._sharing.count > 1:
+                tile = (bytearray(tile[0]), bytearray(tile[1]))
+                self._tiles[key] = tile
+        if tile is None:
+            if (types[position:position + count] == self._blank_types[:count] and
+                    colours[position:position + count] == self._blank_colours[:count]):
+                return None
+            tile = (bytearray([self._type_code]) * (TILE_SIZE * TILE_SIZE),
+                    bytearray([self._colour_code]) * (TILE_SIZE * TILE_SIZE))
+            self._tiles[key] = tile
+        return tile
+
+    def content_spans(self):
+        """
+        Yields the (y, start, types, colours) spans of the cells the grid may
+        have changed from their initial content: the rows of its allocated tiles
+        """
+        for (tile_x, tile_y), (types, colours) in sorted(self._tiles.items()):
+            start = tile_x * TILE_SIZE
+            count = min(TILE_SIZE, self.width - start)
+            for row in range(min(TILE_SIZE, self.height - tile_y * TILE_SIZE)):
+                offset = row * TILE_SIZE
+                yield (tile_y * TILE_SIZE + row, start, bytes(types[offset:offset + count]),
+                       bytes(colours[offset:offset + count]))
+
+    def save(self, path):
+        """
+        Writes the grid to a canvas file, in the same format as DenseGrid.save
+
+        Args:
+            path: the path of the file to write
+        """
+        _write_file(path, self)
+
+    def copy(self):
+        """
+        Returns an independent copy of the grid, sharing its tiles until either
+        grid writes to them
+        """
+        grid = TiledGrid(self.width, self.height, self._type_code, self._colour_code)
+        grid._tiles = dict(self._tiles)
+        self._shared_tiles = set(self._tiles)
+        grid._shared_tiles = set(self._tiles)
+        _share(self, grid)
+        return grid
+
+    @property
+    def tile_count(self):
+        """
+        The number of allocated tiles
+        """
+        return len(self._tiles)
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes used to store the cells
+        """
+        return 2 * TILE_SIZE * TILE_SIZE * len(self._tiles)
+
+    def __eq__(self, other):
+        return _have_same_cells(self, other)
+
+
+class RunGrid(object):
+    """
+    Stores each row of a canvas as a list of runs of identical cells, so that
+    rows made of a few long runs (blank space, edges, filled areas) take little
+    memory and are written by splicing a few runs
+
+    A run is a (length, type code, colour code) tuple. A row fragmented in more
+    than `max_runs` runs is stored as dense planes instead, like in DenseGrid,
+    until it is filled uniformly again. The changes recorded for the undo
+    history hold the old runs of the rows stored as runs (see Runs), and are
+    undone with write_runs.
+
+    Args:
+        width, height: the size of the grid
+        type_code, colour_code: the initial content of every cell
+        max_runs: the number of runs above which a row is stored dense
+    """
+    def __init__(self, width, height, type_code=0, colour_code=0, max_runs=MAX_ROW_RUNS):
+        self.width = width
+        self.height = height
+        self.recorder = None
+        self.dirty_rows = set()
+        self.version = 0
+        self.max_runs = max_runs
+        # each row is either a list of runs, which are never modified in place
+        # so that rows can share them, or a (types, colours) pair of bytearrays
+        blank_row = [(width, type_code, colour_code)] if width else []
+        self._rows = [blank_row] * height
+        # the indexes of the dense rows that may be shared with copies of the grid
+        self._shared_rows = set()
+        self._sharing = None
+        self._sharing_member = None
+
+    def get(self, x, y):
+        """
+        Returns the (type code, colour code) of a cell
+        """
+        row = self._rows[y]
+        if not isinstance(row, list):
+            return row[0][x], row[1][x]
+        position = 0
+        for length, type_code, colour_code in row:
+            position += length
+            if x < position:
+                return type_code, colour_code
+        raise IndexError("cell index out of range")
+
+    def set(self, x, y, type_code, colour_code):
+        """
+        Sets the content of a single cell
+        """
+        self.fill_span(y, x, x + 1, type_code, colour_code)
+
+    def row_types(self, y, start=0, stop=None):
+        """
+        Returns the content type codes of the cells [start, stop[ of a row, as bytes
+        """
+        return self._read_row(y, start, self.width if stop is None else stop)[0]
+
+    def row_colours(self, y, start=0, stop=None):
+        """
+        Returns the colour codes of the cells [start, stop[ of a row, as bytes
+        """
+        return self._read_row(y, start, self.width if stop is None else stop)[1]
+
+    def row_runs(self, y):
+        """
+        Returns the runs of a row, as a list of (length, type code, colour code)
+        tuples, computed from the planes of a dense row
+        """
+        row = self._rows[y]
+        if isinstance(row, list):
+            return list(row)
+        return _encode_runs(bytes(row[0]), bytes(row[1]))
+
+    def fill_span(self, y, start, stop, type_code, colour_code):
+        """
+        Sets the content of the cells [start, stop[ of a row
+        """
+        if start >= stop:
+            return
+        if self.recorder is not None:
+            old_types, old_colours = self._read_old_row(y, start, stop)
+            self.recorder.append((ROW, y, start, old_types, old_colours,
+                                  type_code, colour_code))
+        self._fill_row(y, start, stop, type_code, colour_code)
+        self.dirty_rows.add(y)
+        self.version += 1
+
+    def fill_column(self, x, start, stop, type_code, colour_code):
+        """
+        Sets the content of the cells [start, stop[ of a column
+        """
+        if start >= stop:
+            return
+        if self.recorder is not None:
+            old_types, old_colours = self._read_column(x, start, stop)
+            self.recorder.append((COLUMN, x, start, old_types, old_colours,
+                                  type_code, colour_code))
+        for y in range(start, stop):
+            self._fill_row(y, x, x + 1, type_code, colour_code)
+        self.dirty_rows.update(range(start, stop))
+        self.version += 1
+
+    def write_span(self, y, start, types, colours):
+        """
+        Sets the content type and colour codes of consecutive cells of a row
+        """
+        types, colours = bytes(types), bytes(colours)
+        stop = start + len(types)
+        if self.recorder is not None:
+            old_types, old_colours = self._read_old_row(y, start, stop)
+            self.recorder.append((ROW, y, start, old_types, old_colours, types, colours))
+        row = self._rows[y]
+        if isinstance(row, list):
+            runs = _encode_runs(types, colours, self.max_runs)
+            if runs is not None:
+                self._set_runs(y, _splice(row, start, stop, runs))
+            else:
+                row = self._make_dense(y)
+        if not isinstance(row, list):
+            row = self._own_dense_row(y)
+            row[0][start:stop] = types
+            row[1][start:stop] = colours
+        self.dirty_rows.add(y)
+        self.version += 1
+
+    def write_runs(self, y, start, runs):
+        """
+        Sets the content of consecutive cells of a row from a list of
+        (length, type code, colour code) runs
+        """
+        stop = start + sum(run[0] for run in runs)
+        if start >= stop:
+            return
+        if self.recorder is not None:
+            old_types, old_colours = self._read_old_row(y, start, stop)
+            types, colours = Runs(runs).planes()
+            self.recorder.append((ROW, y, start, old_types, old_colours, types, colours))
+        row = self._rows[y]
+        if isinstance(row, list) or (start == 0 and stop == self.width):
+            self._set_runs(y, _splice(row if isinstance(row, list) else [], start, stop, runs))
+        else:
+            row = self._own_dense_row(y)
+            row[0][start:stop], row[1][start:stop] = Runs(runs).planes()
+        self.dirty_rows.add(y)
+        self.version += 1
+
+    def write_column(self, x, start, types, colours):
+        """
+        Sets the content type and colour codes of consecutive cells of a column
+        """
+        types, colours = bytes(types), bytes(colours)
+        stop = start + len(types)
+        if self.recorder is not None:
+            old_types, old_colours = self._read_column(x, start, stop)
+            self.recorder.append((COLUMN, x, start, old_types, old_colours, types, colours))
+        for index, y in enumerate(range(start, stop)):
+            self._fill_row(y, x, x + 1, types[index], colours[index])
+        self.dirty_rows.update(range(start, stop))
+        self.version += 1
+
+    def _read_row(self, y, start, stop):
+        row = self._rows[y]
+        if not isinstance(row, list):
+            return bytes(row[0][start:stop]), bytes(row[1][start:stop])
+        types, colours = [], []
+        position = 0
+        for length, type_code, colour_code in row:
+            run_start, position = position, position + length
+            if position <= start:
+                continue
+            count = min(position, stop) - max(run_start, start)
+            if count <= 0:
+                break
+            types.append(bytes([type_code]) * count)
+            colours.append(bytes([colour_code]) * count)
+        return b''.join(types), b''.join(colours)
+
+    def _read_old_row(self, y, start, stop):
+        # returns the old types and colours of the cells [start, stop[ of a row
+        # recorded for the undo history: their runs if the row is stored as runs
+        row = self._rows[y]
+        if isinstance(row, list):
+            return Runs(_cut(row, start, stop)), None
+        return self._read_row(y, start, stop)
+
+    def _read_column(self, x, start, stop):
+        cells = [self.get(x, y) for y in range(start, stop)]
+        return bytes(cell[0] for cell in cells), bytes(cell[1] for cell in cells)
+
+    def _fill_row(self, y, start, stop, type_code, colour_code):
+        row = self._rows[y]
+        if isinstance(row, list) or (start == 0 and stop == self.width):
+            if not isinstance(row, list):
+                row = []
+            self._set_runs(y, _splice(row, start, stop, [(stop - start, type_code, colour_code)]))
+        else:
+            row = self._own_dense_row(y)
+            row[0][start:stop] = bytes([type_code]) * (stop - start)
+            row[1][start:stop] = bytes([colour_code]) * (stop - start)
+
+    def _set_runs(self, y, runs):
+        self._rows[y] = runs
+        if len(runs) > self.max_runs:
+            self._make_dense(y)
+
+    def _make_dense(self, y):
+        types, colours = self._read_row(y, 0, self.width)
+        row = (bytearray(types), bytearray(colours))
+        self._rows[y] = row
+        self._shared_rows.discard(y)
+        return row
+
+    def _own_dense_row(self, y):
+        # returns a dense row to write to, duplicated first if copies of the
+        # grid may still share it
+        row = self._rows[y]
+        if y in self._shared_rows:
+            self._shared_rows.discard(y)
+            if self._sharing.count > 1:
+                row = (bytearray(row[0]), bytearray(row[1]))
+                self._rows[y] = row
+        return row
+
+    @property
+    def run_count(self):
+        """
+        The number of runs of the rows stored as runs
+        """
+        return sum(len(row) for row in self._rows if isinstance(row, list))
+
+    @property
+    def dense_row_count(self):
+        """
+        The number of rows stored as dense planes
+        """
+        return sum(1 for row in self._rows if not isinstance(row, list))
+
+    def content_spans(self):
+        """
+        Yields the (y, start, types, colours) spans of the cells the grid may
+        have changed from their initial content: here every row
+        """
+        return _row_spans(self)
+
+    def save(self, path):
+        """
+        Writes the grid to a canvas file, in the same format as DenseGrid.save
+
+        Args:
+            path: the path of the file to write
+        """
+        _write_file(path, self)
+
+    def copy(self):
+        """
+        Returns an independent copy of the grid, sharing its rows until either
+        grid writes to them
+        """
+        grid = RunGrid(self.width, self.height, max_runs=self.max_runs)
+        grid._rows = list(self._rows)
+        self._shared_rows = {y for y, row in enumerate(self._rows) if not isinstance(row, list)}
+        grid._shared_rows = set(self._shared_rows)
+        _share(self, grid)
+        return grid
+
+    @property
+    def nbytes(self):
+        """
+        The approximate number of bytes used to store the cells
+        """
+        return _RUN_NBYTES * self.run_count + 2 * self.width * self.dense_row_count
+
+    def __eq__(self, other):
+        return _have_same_cells(self, other)
+
+
+class Runs(object):
+    """
+    The cells of a span of a RunGrid row as (length, type code, colour code)
+    runs, which the grid records in its changes in place of their types bytes
+
+    Args:
+        runs: the list of runs
+    """
+    def __init__(self, runs):
+        self.runs = runs
+        self._length = sum(run[0] for run in runs)
+
+    def planes(self):
+        """
+        Returns the (types, colours) bytes of the cells
+        """
+        types = b''.join(bytes([type_code]) * length for length, type_code, _ in self.runs)
+        colours = b''.join(bytes([colour_code]) * length for length, _, colour_code in self.runs)
+        return types, colours
+
+    @property
+    def nbytes(self):
+        """
+        The approximate number of bytes used to store the runs
+        """
+        return _RUN_NBYTES * len(self.runs)
+
+    def __len__(self):
+        return self._length
+
+    def __eq__(self, other):
+        return isinstance(other, Runs) and self.runs == other.runs
+
+
+def read_file_size(path):
+    """
+    Returns the (width, height) of the canvas saved in a canvas file
+
+    Args:
+        path: the path of the file to read
+    """
+    with open(path, 'rb') as file:
+        return _read_header(file)
+
+
+def dump_cells(grid, file):
+    """
+    Writes the cells of a grid to a binary file in a compressed form, only
+    holding the spans of cells the grid may have changed from their initial
+    content (see content_spans()), so that it takes little space for mostly
+    blank canvases whatever their storage
+
+    Args:
+        grid: the grid to write
+        file: a binary file open for writing
+    """
+    file.write(FILE_HEADER.pack(DUMP_MAGIC, FILE_VERSION, grid.width, grid.height))
+    compressor = zlib.compressobj(1)
+    for y, start, types, colours in grid.content_spans():
+        file.write(compressor.compress(_SPAN_HEADER.pack(y, start, len(types))))
+        file.write(compressor.compress(types))
+        file.write(compressor.compress(colours))
+    file.write(compressor.flush())
+
+
+def load_cells(file, grid):
+    """
+    Reads back cells written by dump_cells() into a new grid of the same size
+
+    Args:
+        file: a binary file open for reading
+        grid: the grid to write the cells to, whose content must be the
+            initial content of the dumped grid. The spans whose content is
+            already the read one are not written.
+    """
+    header = file.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size:
+        raise ValueError("Not a cell dump")
+    magic, version, width, height = FILE_HEADER.unpack(header)
+    if magic != DUMP_MAGIC or version != FILE_VERSION:
+        raise ValueError("Not a cell dump")
+    if (width, height) != (grid.width, grid.height):
+        raise ValueError("The cell dump size does not match the grid size")
+    decompressor = zlib.decompressobj()
+    pending = bytearray()
+    while not decompressor.eof:
+        chunk = file.read(_DUMP_CHUNK_SIZE)
+        if not chunk:
+            raise ValueError("Truncated cell dump")
+        pending += decompressor.decompress(chunk)
+        offset = 0
+        while len(pending) - offset >= _SPAN_HEADER.size:
+            y, start, count = _SPAN_HEADER.unpack_from(pending, offset)
+            end = offset + _SPAN_HEADER.size + 2 * count
+            if len(pending) < end:
+                break
+            types = bytes(pending[end - 2 * count:end - count])
+            colours = bytes(pending[end - count:end])
+            if (types != grid.row_types(y, start, start + count) or
+                    colours != grid.row_colours(y, start, start + count)):
+                grid.write_span(y, start, types, colours)
+            offset = end
+        del pending[:offset]
+    if pending:
+        raise ValueError("Truncated cell dump")
+
+
+def _read_header(file):
+    header = file.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size:
+        raise ValueError("Not a canvas file")
+    magic, version, width, height = FILE_HEADER.unpack(header)
+    if magic != FILE_MAGIC or version != FILE_VERSION:
+        raise ValueError("Not a canvas file")
+    if os.fstat(file.fileno()).st_size != FILE_HEADER.size + 2 * width * height:
+        raise ValueError("Truncated canvas file")
+    return width, height
+
+
+def _split(start, stop):
+    """
+    Splits the range [start, stop[ along the tile boundaries and generates
+    (tile index, start in tile, stop in tile) tuples
+    """
+    while start < stop:
+        tile, tile_start = divmod(start, TILE_SIZE)
+        tile_stop = min(TILE_SIZE, tile_start + stop - start)
+        yield tile, tile_start, tile_stop
+        start += tile_stop - tile_start
+
+
+def _splice(runs, start, stop, new_runs):
+    """
+    Returns the runs of a row whose cells [start, stop[ are replaced by new runs,
+    merging the runs of identical cells at both ends
+    """
+    before, after = [], []
+    position = 0
+    for run in runs:
+        length = run[0]
+        run_start, position = position, position + length
+        if run_start < start:
+            before.append((min(position, start) - run_start, run[1], run[2]))
+        if position > stop:
+            after.append((position - max(run_start, stop), run[1], run[2]))
+    spliced = before
+    for run in itertools.chain(new_runs, after):
+        if spliced and spliced[-1][1:] == run[1:]:
+            spliced[-1] = (spliced[-1][0] + run[0], run[1], run[2])
+        else:
+            spliced.append(run)
+    return spliced
+
+
+def _cut(runs, start, stop):
+    """
+    Returns the runs of the cells [start, stop[ of a row
+    """
+    cut = []
+    position = 0
+    for length, type_code, colour_code in runs:
+        run_start, position = position, position + length
+        if position <= start:
+            continue
+        if run_start >= stop:
+            break
+        cut.append((min(position, stop) - max(run_start, start), type_code, colour_code))
+    return cut
+
+
+def _encode_runs(types, colours, max_runs=None):
+    """
+    Returns the runs of identical cells of planes, or None if there are more
+    than max_runs of them
+    """
+    boundaries = {match.end() for match in _RUN_PATTERN.finditer(types)}
+    if max_runs is not None and len(boundaries) > max_runs:
+        return None
+    boundaries.update(match.end() for match in _RUN_PATTERN.finditer(colours))
+    if max_runs is not None and len(boundaries) > max_runs:
+        return None
+    runs = []
+    position = 0
+    for boundary in sorted(boundaries):
+        runs.append((boundary - position, types[position], colours[position]))
+        position = boundary
+    return runs
+
+
+class _Sharing(object):
+    """
+    Counts the live grids that may share cell buffers, since they have been
+    copied from one another: a buffer needs to be duplicated before it is
+    written to only while there are several of them
+    """
+    def __init__(self):
+        self.count = 0
+
+    def join(self, grid):
+        """
+        Adds a grid to the count until it is garbage collected, and returns the
+        finalizer removing it, which can also be called to remove it earlier
+        """
+        self.count += 1
+        return weakref.finalize(grid, self._leave)
+
+    def _leave(self):
+        self.count -= 1
+
+
+def _share(grid, copy):
+    # makes a copy of a grid share its buffers
+    if grid._sharing is None:
+        grid._sharing = _Sharing()
+        grid._sharing_member = grid._sharing.join(grid)
+    copy._sharing = grid._sharing
+    copy._sharing_member = grid._sharing.join(copy)
+
+
+def _leave_sharing(grid):
+    grid._sharing_member()
+    grid._sharing = grid._sharing_member = None
+
+
+def _have_same_cells(grid, other):
+    if not hasattr(other, 'row_types'):
+        return NotImplemented
+    if (grid.width, grid.height) != (other.width, other.height):
+        return False
+    return all(grid.row_types(y) == other.row_types(y) and
+               grid.row_colours(y) == other.row_colours(y)
+               for y in range(grid.height))
+
+
+def _row_spans(grid):
+    """
+    Generates the content_spans() of a grid holding every row: one span per row
+    """
+    for y in range(grid.height):
+        yield y, 0, grid.row_types(y), grid.row_colours(y)
+
+
+def _write_row_planes(grid, file):
+    """
+    Writes the types plane and the colours plane of a grid to a canvas file,
+    row by row
+    """
+    for read_row in (grid.row_types, grid.row_colours):
+        for y in range(grid.height):
+            file.write(read_row(y))
+
+
+def _write_file(path, grid, write_planes=_write_row_planes):
+    """
+    Writes a canvas file next to its destination and then moves it over the
+    destination, so that a grid loaded from the destination keeps its content
+
+    Args:
+        path: the path of the file to write
+        grid: the grid to write
+        write_planes: a function writing the planes of the grid to the file,
+            receiving the grid and the file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, grid.width, grid.height))
+            write_planes(grid, file)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
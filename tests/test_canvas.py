@@ -1,4 +1,7 @@
 from copy import deepcopy
+import io
+
+import canvas as canvas_module
 from canvas import (
     Canvas,
     CanvasCellContentType,
@@ -7,6 +10,8 @@ from canvas import (
     Line,
     Rectangle
 )
+from instrumentation import Instrumentation
+from storage import COLUMN, ROW
 
 import pytest
 
@@ -28,6 +33,87 @@ def test_canvas_initialize():
             assert canvas.cells[i][j] == (CanvasCellContentType.Empty, ' ')
 
 
+def test_canvas_initialize_non_square():
+    canvas = Canvas(7, 3)
+    assert len(canvas.cells) == 7
+    assert canvas.cells[6][2] == (CanvasCellContentType.Empty, ' ')
+    with pytest.raises(IndexError):
+        canvas.cells[2][6]
+
+
+def test_canvas_cells_assignment():
+    canvas = Canvas(5, 5)
+    canvas.cells[1][2] = (CanvasCellContentType.Line, 'z')
+    assert canvas.cells[1][2] == (CanvasCellContentType.Line, 'z')
+
+
+def test_canvas_sparse_storage_is_used_for_large_canvases():
+    canvas = Canvas(50000, 50000)
+    assert canvas._grid.nbytes == 0
+    canvas.draw_line(Line(Point(10, 10), Point(10, 20)))
+    assert canvas.cells[10][15] == (CanvasCellContentType.Line, 'x')
+    assert canvas._grid.nbytes < 10000
+
+
+def test_canvas_sparse_storage_behaves_as_dense_storage():
+    canvases = [Canvas(150, 140, sparse=False), Canvas(150, 140, sparse=True)]
+    for canvas in canvases:
+        canvas.draw_rectangle(Rectangle(Point(10, 10), Point(140, 100)))
+        canvas.draw_line(Line(Point(0, 139), Point(149, 0)))
+        canvas.bucket_fill(Point(70, 20), 'o')
+        canvas.bucket_fill(Point(0, 0), 'b')
+        canvas.delete(Point(10, 10))
+        canvas.undo()
+        canvas.undo()
+        canvas.redo()
+    assert canvases[0].cells == canvases[1].cells
+    assert str(canvases[0]) == str(canvases[1])
+
+
+
+def test_canvas_run_length_storage_behaves_as_dense_storage():
+    canvases = [Canvas(150, 140), Canvas(150, 140, run_length=True)]
+    for canvas in canvases:
+        canvas.draw_rectangle(Rectangle(Point(10, 10), Point(140, 100)))
+        canvas.draw_line(Line(Point(0, 139), Point(149, 0)))
+        canvas.bucket_fill(Point(70, 20), 'o')
+        canvas.bucket_fill(Point(0, 0), 'b')
+        canvas.delete(Point(10, 10))
+        canvas.undo()
+        canvas.undo()
+        canvas.redo()
+    assert canvases[0].cells == canvases[1].cells
+    assert str(canvases[0]) == str(canvases[1])
+
+
+def test_canvas_run_length_storage_holds_long_runs_compactly():
+    canvas = Canvas(1000, 1000, run_length=True)
+    canvas.draw_filled_rectangle(Rectangle(Point(100, 100), Point(899, 899)))
+    canvas.bucket_fill(Point(0, 0), 'o')
+    assert canvas._grid.dense_row_count == 0
+    assert canvas._grid.nbytes < Canvas(1000, 1000)._grid.nbytes // 10
+
+
+@pytest.mark.parametrize('storage', [{}, {'sparse': True}, {'run_length': True}])
+def test_canvas_clone_is_independent(storage):
+    canvas = Canvas(100, 80, **storage)
+    canvas.draw_rectangle(Rectangle(Point(10, 10), Point(90, 70)))
+    canvas.bucket_fill(Point(50, 50), 'o')
+    text = str(canvas)
+    clone = canvas.clone()
+    assert str(clone) == text
+    clone.bucket_fill(Point(0, 0), 'b')
+    clone.draw_line(Line(Point(0, 0), Point(99, 79)))
+    assert str(canvas) == text
+    canvas.undo()
+    assert canvas.cells[50][50] == (CanvasCellContentType.Empty, ' ')
+    assert clone.cells[50][50] == (CanvasCellContentType.Empty, 'o')
+    clone.undo()
+    clone.undo()
+    clone.undo()
+    assert str(clone) == str(canvas)
+    assert deepcopy(canvas).cells == canvas.cells
+
 def test_canvas_draw_point():
     width, height = 50, 50
     canvas = Canvas(width, height)
@@ -57,6 +143,31 @@ def test_canvas_draw_line_vertical():
         assert canvas.cells[point.x][point.y] == (CanvasCellContentType.Line, 'x')
 
 
+def test_canvas_draw_sloped_line():
+    expected_canvas_str = (" ------ " "\n"
+                           "|xx    |" "\n"
+                           "|  xx  |" "\n"
+                           "|    xx|" "\n"
+                           " ------ ")
+    canvas = Canvas(6, 3)
+    canvas.draw_line(Line(Point(0, 0), Point(5, 2)))
+    assert str(canvas) == expected_canvas_str
+    canvas.undo()
+    assert canvas.cells == Canvas(6, 3).cells
+
+
+def test_canvas_draw_line_with_reversed_points():
+    canvas = Canvas(10, 10)
+    canvas.draw_line(Line(Point(8, 2), Point(1, 2)))
+    canvas.draw_line(Line(Point(5, 9), Point(5, 4)))
+    for x in range(10):
+        expected_type = CanvasCellContentType.Line if 1 <= x <= 8 else CanvasCellContentType.Empty
+        assert canvas.cells[x][2][0] == expected_type
+    for y in range(10):
+        expected_type = CanvasCellContentType.Line if y == 2 or y >= 4 else CanvasCellContentType.Empty
+        assert canvas.cells[5][y][0] == expected_type
+
+
 def test_canvas_draw_line_fails_when_a_point_is_out_of_bounds():
     canvas = Canvas(50, 50)
     from_point1 = Point(3, 3)
@@ -98,6 +209,25 @@ def test_canvas_draw_rectangle_fails_when_a_point_is_out_of_bounds():
         canvas.draw_rectangle(rectangle2)
 
 
+def test_canvas_draw_filled_rectangle():
+    expected_canvas_str = (" ----- " "\n"
+                           "|     |" "\n"
+                           "| xxx |" "\n"
+                           "| xxx |" "\n"
+                           " ----- ")
+    canvas = Canvas(5, 3)
+    canvas.draw_filled_rectangle(Rectangle(Point(1, 1), Point(3, 2)))
+    assert str(canvas) == expected_canvas_str
+    canvas.undo()
+    assert canvas.cells == Canvas(5, 3).cells
+
+
+def test_canvas_draw_filled_rectangle_fails_when_a_point_is_out_of_bounds():
+    canvas = Canvas(50, 50)
+    with pytest.raises(OutOfCanvasBoundError):
+        canvas.draw_filled_rectangle(Rectangle(Point(3, 3), Point(10, 100)))
+
+
 def test_canvas_bucket_fill_shape():
     width, height = 10, 10
     canvas = Canvas(width, height)
@@ -132,6 +262,33 @@ def test_canvas_bucket_fill_area():
         assert canvas.cells[point.x][point.y] == (CanvasCellContentType.Line, 'x')
 
 
+def test_canvas_bucket_fill_around_obstacles():
+    # the top left zone has to be reached by going down the right side, along
+    # the bottom and back up the left side of the rectangle
+    expected_canvas_str = (" ------- " "\n"
+                           "|oooxooo|" "\n"
+                           "|oxxxxxo|" "\n"
+                           "|ox   xo|" "\n"
+                           "|oxxxxxo|" "\n"
+                           "|ooooooo|" "\n"
+                           " ------- ")
+    canvas = Canvas(7, 5)
+    canvas.draw_rectangle(Rectangle(Point(1, 1), Point(5, 3)))
+    canvas.draw_line(Line(Point(3, 0), Point(3, 1)))
+    canvas.bucket_fill(Point(6, 0), 'o')
+    assert str(canvas) == expected_canvas_str
+
+
+def test_canvas_bucket_fill_does_not_cross_diagonals():
+    canvas = Canvas(3, 3)
+    canvas.draw_line(Line(Point(0, 1), Point(1, 1)))
+    canvas.draw_line(Line(Point(1, 0), Point(1, 1)))
+    canvas.bucket_fill(Point(0, 0), 'o')
+    assert canvas.cells[0][0] == (CanvasCellContentType.Empty, 'o')
+    for x, y in [(2, 0), (2, 1), (0, 2), (1, 2), (2, 2)]:
+        assert canvas.cells[x][y] == (CanvasCellContentType.Empty, ' ')
+
+
 def test_canvas_bucket_fill_fails_when_target_out_of_bounds():
     canvas = Canvas(50, 50)
     target = Point(100, 25)
@@ -139,6 +296,14 @@ def test_canvas_bucket_fill_fails_when_target_out_of_bounds():
         canvas.bucket_fill(target, 'o')
 
 
+def test_canvas_bucket_fill_fails_with_incorrect_colour():
+    canvas = Canvas(10, 10)
+    with pytest.raises(ValueError):
+        canvas.bucket_fill(Point(0, 0), 'oo')
+    with pytest.raises(ValueError):
+        canvas.bucket_fill(Point(0, 0), '\u20ac')
+
+
 def test_canvas_delete_shape():
     canvas = Canvas(10, 10)
     line = Line(Point(0, 1), Point(9, 1))
@@ -209,6 +374,64 @@ def test_canvas_undo_delete():
     assert canvas.cells == expected_cells_after_undo
 
 
+def test_canvas_undo_several_actions():
+    canvas = Canvas(10, 10)
+    expected_cells_after_undo = deepcopy(canvas.cells)
+    canvas.draw_line(Line(Point(0, 2), Point(9, 2)))
+    canvas.draw_rectangle(Rectangle(Point(1, 1), Point(3, 3)))
+    canvas.bucket_fill(Point(0, 0), 'o')
+    canvas.delete(Point(3, 3))
+    for _ in range(4):
+        canvas.undo()
+    assert canvas.cells == expected_cells_after_undo
+    canvas.undo()
+    assert canvas.cells == expected_cells_after_undo
+
+
+def test_canvas_undo_is_limited_by_history_depth():
+    canvas = Canvas(10, 10, history_depth=1)
+    canvas.draw_line(Line(Point(0, 2), Point(9, 2)))
+    expected_cells_after_undo = deepcopy(canvas.cells)
+    canvas.draw_line(Line(Point(0, 5), Point(9, 5)))
+    canvas.undo()
+    canvas.undo()
+    assert canvas.cells == expected_cells_after_undo
+
+
+def test_canvas_redo():
+    canvas = Canvas(10, 10)
+    canvas.draw_line(Line(Point(0, 2), Point(9, 2)))
+    canvas.bucket_fill(Point(0, 0), 'o')
+    expected_cells_after_redo = deepcopy(canvas.cells)
+    canvas.undo()
+    canvas.undo()
+    canvas.redo()
+    canvas.redo()
+    assert canvas.cells == expected_cells_after_redo
+    canvas.redo()
+    assert canvas.cells == expected_cells_after_redo
+
+
+def test_canvas_save_and_load(tmp_path):
+    path = str(tmp_path / 'saved.canvas')
+    canvas = Canvas(8, 4)
+    canvas.draw_rectangle(Rectangle(Point(1, 1), Point(6, 3)))
+    canvas.bucket_fill(Point(0, 0), 'o')
+    canvas.save(path)
+    loaded_canvas = Canvas.load(path)
+    assert loaded_canvas.width == 8 and loaded_canvas.height == 4
+    assert loaded_canvas.cells == canvas.cells
+    assert str(loaded_canvas) == str(canvas)
+    loaded_canvas.delete(Point(1, 1))
+    loaded_canvas.undo()
+    assert loaded_canvas.cells == canvas.cells
+
+
+def test_canvas_creation_fails_with_storage_of_another_size():
+    with pytest.raises(ValueError):
+        Canvas(5, 5, grid=Canvas(5, 6)._grid)
+
+
 def test_canvas_str():
     expected_canvas_str = (" ----- " "\n"
                            "|     |" "\n"
@@ -223,6 +446,63 @@ def test_canvas_str():
     canvas.bucket_fill(Point(2, 2), 'o')
     assert str(canvas) == expected_canvas_str
 
+def test_canvas_str_after_undo_and_redo():
+    canvas = Canvas(5, 3)
+    canvas.draw_line(Line(Point(0, 1), Point(4, 1)))
+    str(canvas)
+    canvas.undo()
+    assert str(canvas).splitlines()[2] == "|     |"
+    canvas.redo()
+    assert str(canvas).splitlines()[2] == "|xxxxx|"
+
+
+def test_canvas_str_non_square():
+    expected_canvas_str = (" ------- " "\n"
+                           "|   x   |" "\n"
+                           "|   x   |" "\n"
+                           " ------- ")
+    canvas = Canvas(7, 2)
+    canvas.draw_line(Line(Point(3, 0), Point(3, 1)))
+    assert str(canvas) == expected_canvas_str
+
+
+@pytest.mark.parametrize('storage', [{}, {'sparse': True}, {'run_length': True}])
+def test_canvas_render_to_writes_str(storage, monkeypatch):
+    monkeypatch.setattr(canvas_module, 'RENDER_CHUNK_SIZE', 20)
+    canvas = Canvas(7, 9, **storage)
+    canvas.draw_line(Line(Point(0, 8), Point(6, 0)))
+    canvas.bucket_fill(Point(0, 0), 'o')
+    output = io.StringIO()
+    canvas.render_to(output)
+    assert output.getvalue() == str(canvas)
+
+
+def test_canvas_render_to_crops_region():
+    canvas = Canvas(7, 4)
+    canvas.draw_line(Line(Point(0, 0), Point(6, 3)))
+    output = io.StringIO()
+    canvas.render_to(output, Rectangle(Point(5, 3), Point(1, 1)))
+    assert output.getvalue() == (" ----- " "\n"
+                                 "|xx   |" "\n"
+                                 "|  xx |" "\n"
+                                 "|    x|" "\n"
+                                 " ----- ")
+    output = io.StringIO()
+    canvas.render_to(output, Rectangle(Point(5, 3), Point(100, 100)))
+    assert output.getvalue() == " -- \n|xx|\n -- "
+
+
+@pytest.mark.parametrize('instrumented', [False, True])
+def test_canvas_render_to_accepts_region_keyword(instrumented):
+    instrumentation = Instrumentation() if instrumented else None
+    canvas = Canvas(7, 4, instrumentation=instrumentation)
+    canvas.draw_line(Line(Point(0, 0), Point(6, 3)))
+    output = io.StringIO()
+    canvas.render_to(output, region=Rectangle(Point(1, 1), Point(2, 2)))
+    assert output.getvalue() == " -- \n|xx|\n|  |\n -- "
+    if instrumented:
+        assert instrumentation.totals['render_to']['render_time'] > 0
+
 ######## Test Point ########
 
 def test_point_initialize():
@@ -238,6 +518,29 @@ def test_point_creation_fails_whith_incorrect_params():
         Point(1, ValueError())
 
 
+def test_point_is_immutable():
+    point = Point(1, 2)
+    with pytest.raises(AttributeError):
+        point.x = 3
+    with pytest.raises(AttributeError):
+        point.z = 3
+
+
+def test_point_hash_does_not_collide():
+    assert hash(Point(101, 0)) != hash(Point(0, 97))
+    points = {Point(x, y) for x in range(200) for y in range(200)}
+    assert len({hash(point) for point in points}) == len(points)
+
+
+def test_point_ordering():
+    assert Point(1, 5) < Point(2, 0) < Point(2, 1)
+    assert sorted([Point(3, 1), Point(1, 2), Point(1, 1)]) == [Point(1, 1), Point(1, 2), Point(3, 1)]
+
+
+def test_point_repr():
+    assert repr(Point("3", 4)) == "Point(x=3, y=4)"
+
+
 ######## Test Line ########
 
 def test_line_initialize():
@@ -256,6 +559,11 @@ def test_line_get_points_for_horizontal_line():
     assert points == expected_points
 
 
+def test_line_get_points_for_reversed_line():
+    line = Line(Point(1, 3), Point(1, 1))
+    assert line.get_points() == [Point(1, 3), Point(1, 2), Point(1, 1)]
+
+
 def test_line_get_points_for_vertical_line():
     from_point = Point(1, 1)
     to_point = Point(5, 1)
@@ -265,6 +573,33 @@ def test_line_get_points_for_vertical_line():
     assert points == expected_points
 
 
+def test_line_get_points_for_diagonal_line():
+    line = Line(Point(3, 0), Point(0, 3))
+    assert line.get_points() == [Point(3, 0), Point(2, 1), Point(1, 2), Point(0, 3)]
+
+
+def test_line_iter_coordinates_for_sloped_line():
+    line = Line(Point(0, 0), Point(2, 5))
+    assert list(line.iter_coordinates()) == [(0, 0), (0, 1), (1, 2), (1, 3), (2, 4), (2, 5)]
+
+
+def test_line_iter_runs_for_axis_lines():
+    assert list(Line(Point(2, 7), Point(2, 3)).iter_runs()) == [(COLUMN, 2, 3, 8)]
+    assert list(Line(Point(1, 4), Point(6, 4)).iter_runs()) == [(ROW, 4, 1, 7)]
+
+
+def test_line_iter_runs_covers_the_line_cells():
+    for to_point in [Point(9, 3), Point(3, 9), Point(-9, 4), Point(-2, -9), Point(9, -9)]:
+        line = Line(Point(0, 0), to_point)
+        cells = []
+        for kind, fixed, start, stop in line.iter_runs():
+            if kind == ROW:
+                cells.extend((x, fixed) for x in range(start, stop))
+            else:
+                cells.extend((fixed, y) for y in range(start, stop))
+        assert sorted(cells) == sorted(line.iter_coordinates())
+
+
 ######## Test Rectangle ########
 
 def test_rectangle_initialize():
@@ -288,3 +623,31 @@ def test_rectangle_get_lines():
     ]
     lines = rectangle.get_lines()
     assert lines == expected_lines
+
+
+######## Test Canvas bucket fill component index ########
+
+def test_repeated_bucket_fill_reuses_known_component():
+    canvas = Canvas(6, 4)
+    canvas.draw_rectangle(Rectangle(Point(0, 0), Point(3, 3)))
+    canvas.bucket_fill(Point(1, 1), 'o')
+    canvas.bucket_fill(Point(5, 0), 'a')
+    assert len(canvas._components) == 2
+    canvas.bucket_fill(Point(2, 2), 'p')
+    canvas.bucket_fill(Point(4, 3), 'b')
+    assert len(canvas._components) == 2
+    canvas.delete(Point(1, 2))
+    canvas.draw_line(Line(Point(0, 0), Point(5, 0)))
+    canvas.bucket_fill(Point(1, 1), 'q')
+
+    expected_canvas = Canvas(6, 4)
+    expected_canvas.draw_rectangle(Rectangle(Point(0, 0), Point(3, 3)))
+    expected_canvas.bucket_fill(Point(4, 3), 'b')
+    expected_canvas.draw_line(Line(Point(0, 0), Point(5, 0)))
+    expected_canvas.bucket_fill(Point(1, 1), 'q')
+    assert str(canvas) == str(expected_canvas)
+    canvas.undo()
+    canvas.undo()
+    canvas.undo()
+    canvas.bucket_fill(Point(1, 1), 'r')
+    assert canvas.cells[2][2] == (CanvasCellContentType.Empty, 'r')
@@ -0,0 +1,130 @@
+import io
+
+from canvas import Canvas, Line, Point
+from commandlog import CommandLogWriter, replay
+from instrumentation import Instrumentation
+from pipeline import ScriptExecutor, compile_script
+from workspace import Workspace
+
+import pytest
+
+SCRIPT = """C 20 10
+L 0 5 19 5
+R 2 1 8 8
+B 0 0 o
+N other 300 200
+F 10 10 250 150
+W main
+D 3 3
+U
+U
+Y
+B 15 8 .
+"""
+
+
+def execute(script, workspace, command_log=None):
+    sizes = workspace.sizes()
+    operations, errors = compile_script(
+        script.splitlines(), sizes.get(workspace.current_name), sizes, workspace.current_name)
+    assert errors == []
+    executor = ScriptExecutor(workspace=workspace, command_log=command_log)
+    for operation in operations:
+        assert executor.execute(operation) is None
+
+
+def log_script(script, checkpoint_every=None, workspace=None, close=True):
+    workspace = workspace or Workspace()
+    file = io.BytesIO()
+    command_log = CommandLogWriter(file, workspace, checkpoint_every)
+    execute(script, workspace, command_log)
+    if close:
+        command_log.close()
+    else:
+        command_log.flush()
+    file.seek(0)
+    return workspace, file
+
+
+def assert_same_canvases(workspace, other_workspace):
+    assert workspace.sizes() == other_workspace.sizes()
+    assert workspace.current_name == other_workspace.current_name
+    for name in workspace.sizes():
+        assert str(workspace.get(name)) == str(other_workspace.get(name))
+
+######## Test replay ########
+
+@pytest.mark.parametrize('checkpoint_every', [None, 1, 3])
+@pytest.mark.parametrize('from_checkpoint', [False, True])
+def test_replay_reproduces_canvases(checkpoint_every, from_checkpoint):
+    workspace, file = log_script(SCRIPT, checkpoint_every)
+    assert_same_canvases(workspace, replay(file, from_checkpoint=from_checkpoint))
+
+
+def test_replay_from_the_beginning_reproduces_undo_histories():
+    workspace, file = log_script(SCRIPT)
+    replayed = replay(file, from_checkpoint=False)
+    execute("U\nU\nW other\nU\n", workspace)
+    execute("U\nU\nW other\nU\n", replayed)
+    assert_same_canvases(workspace, replayed)
+
+
+def test_replay_only_records_the_undo_histories_after_the_last_checkpoint():
+    _, file = log_script("C 20 10\nL 0 0 19 0\nL 0 1 19 1\nL 0 2 19 2\nL 0 3 19 3\n"
+                         "L 0 4 19 4\nU\nL 0 5 19 5\n", checkpoint_every=3)
+    replayed = replay(file, from_checkpoint=False)
+    file.seek(0)
+    replayed_from_checkpoint = replay(file)
+    assert_same_canvases(replayed, replayed_from_checkpoint)
+    assert replayed.current.history_nbytes == replayed_from_checkpoint.current.history_nbytes
+    execute("U\nU\nU\n", replayed)
+    execute("U\nU\nU\n", replayed_from_checkpoint)
+    assert_same_canvases(replayed, replayed_from_checkpoint)
+
+
+def test_replay_reports_the_replayed_canvases_to_instrumentation():
+    instrumentation = Instrumentation()
+    _, file = log_script("C 20 10\nL 0 5 19 5\nU\n", checkpoint_every=1)
+    replay(file, from_checkpoint=False, instrumentation=instrumentation)
+    assert instrumentation.totals['draw_line']['cells'] == 20
+    assert instrumentation.totals['undo']['cells'] == 20
+
+
+def test_replay_of_unclosed_log_starts_from_the_beginning():
+    workspace, file = log_script(SCRIPT, checkpoint_every=2, close=False)
+    assert_same_canvases(workspace, replay(file))
+
+
+def test_undo_before_checkpoint_writes_a_checkpoint():
+    workspace, _ = log_script("C 4 1\nL 0 0 3 0\n")
+    # the new log starts with a checkpoint, before which the first line is drawn
+    _, file = log_script("L 0 0 0 0\nU\nU\n", workspace=workspace)
+    replayed = replay(file)
+    assert str(replayed.current) == str(workspace.current) == " ---- \n|    |\n ---- "
+
+
+def test_replay_logs_opened_canvases(tmp_path):
+    path = str(tmp_path / 'canvas')
+    canvas = Canvas(6, 3)
+    canvas.bucket_fill(Point(0, 0), '#')
+    canvas.save(path)
+    workspace, file = log_script("C 2 2\nO {}\nL 0 1 5 1\n".format(path))
+    # the log does not depend on the file
+    canvas.draw_line(Line(Point(0, 0), Point(5, 0)))
+    canvas.save(path)
+    assert_same_canvases(workspace, replay(file, from_checkpoint=False))
+
+
+def test_writer_rejects_operations_it_cannot_log():
+    workspace, _ = log_script("C 3 3\n")
+    command_log = CommandLogWriter(io.BytesIO(), workspace)
+    with pytest.raises(TypeError):
+        command_log.write(object())
+
+
+def test_replay_rejects_invalid_logs():
+    with pytest.raises(ValueError):
+        replay(io.BytesIO(b'not a log at all'))
+    _, file = log_script("C 300 200\nL 0 0 299 199\n")
+    with pytest.raises(ValueError):
+        replay(io.BytesIO(file.getvalue()[:-20]))
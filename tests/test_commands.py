@@ -8,12 +8,18 @@ from canvas import (
 from commands import (
     ExitCommand,
     CreateCanvasCommand,
+    OpenCanvasCommand,
+    SaveCanvasCommand,
     DrawLineCommand,
     DrawRectangleCommand,
+    DrawFilledRectangleCommand,
     BucketFillCommand,
     DeleteCommand,
-    UndoCommand
+    UndoCommand,
+    RedoCommand,
+    StatsCommand
 )
+from pipeline import DrawLine
 
 import pytest
 
@@ -33,6 +39,59 @@ def test_create_canvas_command_execute():
     command.execute(width, height)
 
 
+def test_create_canvas_command_execute_with_empty_size():
+    callback, log_fn = Mock(), Mock()
+    command = CreateCanvasCommand(callback, log_fn)
+    with pytest.raises(ValueError):
+        command.execute('0', '3')
+    callback.assert_not_called()
+    log_fn.assert_not_called()
+
+
+def test_draw_line_command_logs_executed_line():
+    log_fn = Mock()
+    command = DrawLineCommand(lambda: Canvas(10, 10), log_fn)
+    command.execute('1', '2', '6', '2')
+    log_fn.assert_called_once_with(DrawLine(None, Line(Point(1, 2), Point(6, 2))))
+
+
+def test_save_canvas_command_execute():
+    canvas = Mock(spec=Canvas)
+    command = SaveCanvasCommand(lambda: canvas)
+    command.execute('my', 'canvas.bin')
+    canvas.save.assert_called_once_with('my canvas.bin')
+
+
+def test_save_canvas_command_execute_with_incorrect_path(tmp_path):
+    command = SaveCanvasCommand(lambda: Canvas(5, 5))
+    with pytest.raises(ValueError):
+        command.execute(str(tmp_path / 'missing' / 'canvas.bin'))
+
+
+def test_open_canvas_command_execute(tmp_path):
+    path = str(tmp_path / 'canvas.bin')
+    Canvas(100, 50).save(path)
+    def callback(result):
+        assert isinstance(result, Canvas)
+        assert result.width == 100
+        assert result.height == 50
+    command = OpenCanvasCommand(callback)
+    command.execute(path)
+
+
+def test_open_canvas_command_execute_with_incorrect_nb_args():
+    command = OpenCanvasCommand(lambda _: None)
+    with pytest.raises(ValueError) as ex:
+        command.execute()
+    assert str(ex.value) == "1 argument expected (path)"
+
+
+def test_open_canvas_command_execute_with_missing_file(tmp_path):
+    command = OpenCanvasCommand(lambda _: None)
+    with pytest.raises(ValueError):
+        command.execute(str(tmp_path / 'missing.bin'))
+
+
 def test_draw_line_command_execute():
     canvas = Mock(spec=Canvas)
     command = DrawLineCommand(lambda: canvas)
@@ -67,6 +126,23 @@ def test_draw_rectangle_command_execute_with_incorrect_nb_args():
     assert str(ex.value) == "4 arguments expected (x1, y1, x2, y2)"
 
 
+def test_draw_filled_rectangle_command_execute():
+    canvas = Mock(spec=Canvas)
+    command = DrawFilledRectangleCommand(lambda: canvas)
+    x1, y1, x2, y2 = 1, 1, 10, 10
+    rectangle = Rectangle(Point(x1, y1), Point(x2, y2))
+    command.execute(x1, y1, x2, y2)
+    canvas.draw_filled_rectangle.assert_called_once_with(rectangle)
+
+
+def test_draw_filled_rectangle_command_execute_with_incorrect_nb_args():
+    canvas = Mock(spec=Canvas)
+    command = DrawFilledRectangleCommand(lambda: canvas)
+    with pytest.raises(ValueError) as ex:
+        command.execute(1, 1, 1)
+    assert str(ex.value) == "4 arguments expected (x1, y1, x2, y2)"
+
+
 def test_bucket_fill_command_execute():
     canvas = Mock(spec=Canvas)
     command = BucketFillCommand(lambda: canvas)
@@ -106,3 +182,19 @@ def test_undo_command_execute():
     command = UndoCommand(lambda: canvas)
     command.execute()
     canvas.undo.assert_called_once()
+
+
+def test_redo_command_execute():
+    canvas = Mock(spec=Canvas)
+    command = RedoCommand(lambda: canvas)
+    command.execute()
+    canvas.redo.assert_called_once()
+
+
+def test_stats_command_execute():
+    instrumentation = Mock()
+    instrumentation.summary.return_value = "summary"
+    assert StatsCommand(lambda: instrumentation).execute() == "summary"
+    with pytest.raises(ValueError) as ex:
+        StatsCommand(lambda: None).execute()
+    assert str(ex.value) == "Instrumentation is disabled (see --instrument)"
@@ -0,0 +1,35 @@
+from components import ComponentIndex
+from storage import DenseGrid, TiledGrid
+
+
+######## Test ComponentIndex ########
+
+def test_find_returns_runs_of_known_component():
+    grid = DenseGrid(10, 3)
+    index = ComponentIndex(grid)
+    runs = [(0, 2, 5), (1, 3, 4)]
+    index.add(runs)
+    assert index.find(2, 0) is runs
+    assert index.find(3, 1) is runs
+    assert index.find(1, 0) is None
+    assert index.find(5, 0) is None
+    assert index.find(3, 2) is None
+    assert len(index) == 1
+
+
+def test_index_is_stale_after_write():
+    grid = TiledGrid(10, 3)
+    index = ComponentIndex(grid)
+    index.add([(0, 0, 10)])
+    grid.set(0, 2, 1, 1)
+    assert index.find(0, 0) is None
+    assert len(index) == 0
+
+
+def test_validate_keeps_index_after_write():
+    grid = DenseGrid(10, 3)
+    index = ComponentIndex(grid)
+    index.add([(0, 0, 10)])
+    grid.fill_span(0, 0, 10, 0, 7)
+    index.validate()
+    assert index.find(9, 0) == [(0, 0, 10)]
@@ -0,0 +1,97 @@
+import random
+
+from canvas import Canvas, Line, Point, Rectangle
+from diff import CELLS, ROWS, DiffEncoder, decode
+from instrumentation import Instrumentation
+
+import pytest
+
+
+def canvas_rows(canvas):
+    return [line[1:-1] for line in str(canvas).splitlines()[1:-1]]
+
+
+######## Test DiffEncoder ########
+
+def test_diff_encoder_outputs_changed_rows():
+    canvas = Canvas(5, 3)
+    encoder = DiffEncoder(ROWS)
+    assert encoder.encode(canvas).splitlines()[0] == "K 5 3"
+    canvas.draw_line(Line(Point(0, 1), Point(4, 1)))
+    assert encoder.encode(canvas) == "R 1\n1 xxxxx"
+    assert encoder.encode(canvas) == "R 0"
+
+
+def test_diff_encoder_outputs_run_length_encoded_cells():
+    canvas = Canvas(8, 3)
+    encoder = DiffEncoder(CELLS)
+    encoder.encode(canvas)
+    canvas.draw_line(Line(Point(2, 0), Point(5, 0)))
+    canvas.bucket_fill(Point(0, 2), '*')
+    assert encoder.encode(canvas) == "C 3\n0 0 2**4*x2**\n1 0 8**\n2 0 8**"
+
+
+def test_diff_encoder_skips_rows_changed_back_between_renders():
+    canvas = Canvas(4, 2)
+    encoder = DiffEncoder(CELLS)
+    encoder.encode(canvas)
+    canvas.bucket_fill(Point(0, 0), 'o')
+    str(canvas)
+    canvas.undo()
+    assert encoder.encode(canvas) == "C 0"
+
+
+def test_diff_encoder_outputs_keyframes():
+    canvas = Canvas(4, 4)
+    encoder = DiffEncoder(ROWS, keyframe_every=2)
+    encoder.encode(canvas)
+    canvas.draw_line(Line(Point(0, 0), Point(3, 0)))
+    assert encoder.encode(canvas).startswith("R 1")
+    assert encoder.encode(canvas).startswith("R 0")
+    assert encoder.encode(canvas).startswith("K 4 4")
+    assert encoder.encode(Canvas(4, 4)).startswith("K 4 4")
+
+
+def test_diff_encoder_outputs_keyframe_instead_of_larger_diff():
+    canvas = Canvas(4, 4)
+    encoder = DiffEncoder(CELLS)
+    encoder.encode(canvas)
+    canvas.draw_line(Line(Point(0, 0), Point(0, 3)))
+    canvas.draw_line(Line(Point(2, 0), Point(2, 3)))
+    assert encoder.encode(canvas).startswith("K 4 4")
+
+
+@pytest.mark.parametrize('mode', [ROWS, CELLS])
+def test_diff_encoder_renders_are_instrumented(mode):
+    instrumentation = Instrumentation()
+    canvas = Canvas(5, 3, instrumentation=instrumentation)
+    encoder = DiffEncoder(mode)
+    encoder.encode(canvas)
+    with instrumentation.measure('L'):
+        canvas.draw_line(Line(Point(0, 1), Point(4, 1)))
+        assert encoder.encode(canvas).startswith('R 1' if mode == ROWS else 'C 1')
+    assert instrumentation.totals['L']['render_time'] > 0
+
+
+def test_decoded_diffs_match_canvas():
+    random.seed(3)
+    for mode in (ROWS, CELLS):
+        canvas = Canvas(12, 9)
+        encoder = DiffEncoder(mode)
+        rows = decode(encoder.encode(canvas))
+        for _ in range(40):
+            first = Point(random.randrange(12), random.randrange(9))
+            second = Point(random.randrange(12), random.randrange(9))
+            action = random.choice(['line', 'rectangle', 'fill', 'delete', 'undo'])
+            if action == 'line':
+                canvas.draw_line(Line(first, second))
+            elif action == 'rectangle':
+                canvas.draw_rectangle(Rectangle(first, second))
+            elif action == 'fill':
+                canvas.bucket_fill(first, random.choice('0*o '))
+            elif action == 'delete':
+                canvas.delete(first)
+            else:
+                canvas.undo()
+            rows = decode(encoder.encode(canvas), rows)
+            assert rows == canvas_rows(canvas)
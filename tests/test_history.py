@@ -0,0 +1,207 @@
+from history import UndoJournal
+from storage import DenseGrid, RunGrid
+
+######## Test UndoJournal ########
+
+def test_undo_journal_record_and_undo():
+    grid = DenseGrid(5, 5, 1, 32)
+    expected_grid_after_undo = grid.copy()
+    journal = UndoJournal()
+    with journal.record(grid):
+        grid.fill_span(1, 0, 5, 2, ord('x'))
+        grid.fill_column(2, 0, 5, 2, ord('o'))
+        grid.set(4, 4, 2, ord('z'))
+    assert len(journal) == 1
+    assert journal.undo(grid)
+    assert grid == expected_grid_after_undo
+    assert len(journal) == 0
+    journal.clear()
+    assert journal.nbytes == 0
+
+
+def test_undo_journal_undo_when_empty():
+    grid = DenseGrid(5, 5, 1, 32)
+    assert not UndoJournal().undo(grid)
+
+
+def test_undo_journal_records_only_changed_cells():
+    grid = DenseGrid(1000, 1000, 1, 32)
+    journal = UndoJournal()
+    with journal.record(grid) as changes:
+        grid.fill_span(10, 0, 10, 2, ord('x'))
+    assert len(changes) == 1
+    assert journal.nbytes < 1000
+
+
+def test_undo_journal_does_not_record_outside_record_block():
+    grid = DenseGrid(5, 5, 1, 32)
+    journal = UndoJournal()
+    with journal.record(grid):
+        pass
+    grid.set(0, 0, 2, ord('x'))
+    assert grid.recorder is None
+    journal.undo(grid)
+    assert grid.get(0, 0) == (2, ord('x'))
+
+
+def test_undo_journal_disabled_forgets_entries_instead_of_recording():
+    grid = DenseGrid(5, 5, 1, 32)
+    journal = UndoJournal()
+    with journal.record(grid):
+        grid.set(0, 0, 2, ord('x'))
+    journal.enabled = False
+    with journal.record(grid) as changes:
+        assert changes is None and grid.recorder is None
+        grid.set(1, 0, 2, ord('y'))
+    journal.enabled = True
+    assert journal.nbytes == 0
+    assert not journal.undo(grid)
+    assert grid.get(0, 0) == (2, ord('x')) and grid.get(1, 0) == (2, ord('y'))
+
+
+def test_undo_journal_evicts_oldest_entries_over_max_depth():
+    grid = DenseGrid(5, 5, 1, 32)
+    journal = UndoJournal(max_depth=2)
+    for y in range(4):
+        with journal.record(grid):
+            grid.fill_span(y, 0, 5, 2, ord('x'))
+    assert len(journal) == 2
+    while journal.undo(grid):
+        pass
+    assert grid.row_colours(1) == b'xxxxx' and grid.row_colours(2) == b'     '
+
+
+def test_undo_journal_evicts_oldest_entries_over_max_bytes():
+    grid = DenseGrid(100, 100, 1, 32)
+    journal = UndoJournal(max_bytes=1000)
+    for y in range(10):
+        with journal.record(grid):
+            grid.fill_span(y, 0, 100, 2, ord('x'))
+    assert 1 <= len(journal) < 10
+    assert journal.nbytes <= 1000
+
+
+def test_undo_journal_keeps_latest_entry_over_max_bytes():
+    grid = DenseGrid(100, 100, 1, 32)
+    journal = UndoJournal(max_bytes=10)
+    with journal.record(grid):
+        grid.fill_span(0, 0, 100, 2, ord('x'))
+    assert len(journal) == 1
+
+
+def test_undo_journal_redo():
+    grid = DenseGrid(5, 5, 1, 32)
+    journal = UndoJournal()
+    with journal.record(grid):
+        grid.fill_span(1, 0, 5, 2, ord('x'))
+    expected_grid_after_redo = grid.copy()
+    journal.undo(grid)
+    assert journal.redo(grid)
+    assert grid == expected_grid_after_redo
+    assert not journal.redo(grid)
+
+
+def test_undo_journal_redo_is_forgotten_after_a_new_entry():
+    grid = DenseGrid(5, 5, 1, 32)
+    journal = UndoJournal()
+    with journal.record(grid):
+        grid.fill_span(1, 0, 5, 2, ord('x'))
+    journal.undo(grid)
+    with journal.record(grid):
+        grid.fill_span(2, 0, 5, 2, ord('x'))
+    assert not journal.redo(grid)
+    assert grid.row_colours(1) == b'     '
+
+
+def test_undo_journal_compresses_old_entries():
+    grid = DenseGrid(200, 200, 1, 32)
+    expected_grids = []
+    journal = UndoJournal(hot_entries=1)
+    for y in range(10):
+        expected_grids.append(grid.copy())
+        with journal.record(grid):
+            grid.fill_span(y, 0, 200, 2, ord('x'))
+            grid.write_span(y, 0, b'\x01\x02', b'ab')
+    assert journal.nbytes < 10 * 4 * 200
+    expected_grid_after_redo = grid.copy()
+    for expected_grid in reversed(expected_grids):
+        journal.undo(grid)
+        assert grid == expected_grid
+    while journal.redo(grid):
+        pass
+    assert grid == expected_grid_after_redo
+
+
+def test_undo_journal_records_runs_of_run_grid_rows():
+    grid, dense_grid = RunGrid(1000, 200, 1, 32), DenseGrid(1000, 200, 1, 32)
+    journal, dense_journal = UndoJournal(hot_entries=1), UndoJournal(hot_entries=1)
+    expected_grids = []
+    for colour in b'xo':
+        expected_grids.append(grid.copy())
+        for target, target_journal in ((grid, journal), (dense_grid, dense_journal)):
+            with target_journal.record(target):
+                for y in range(200):
+                    target.fill_span(y, 0, 1000, 2, colour)
+    assert journal.nbytes < dense_journal.nbytes // 10
+    expected_grid_after_redo = grid.copy()
+    for expected_grid in reversed(expected_grids):
+        journal.undo(grid)
+        assert grid == expected_grid
+        assert grid.dense_row_count == 0
+    while journal.redo(grid):
+        pass
+    assert grid == expected_grid_after_redo
+
+
+def test_undo_journal_spills_oldest_entries_over_max_bytes():
+    grid = DenseGrid(100, 100, 1, 32)
+    expected_grids = []
+    journal = UndoJournal(max_bytes=2000, spill=True, hot_entries=0)
+    for y in range(50):
+        expected_grids.append(grid.copy())
+        with journal.record(grid):
+            grid.fill_column(y, 0, 100, 2, ord('0') + y % 10)
+    assert len(journal) == 50
+    assert journal.nbytes <= 2000
+    assert journal.spilled_bytes > 0
+    for expected_grid in reversed(expected_grids):
+        journal.undo(grid)
+        assert grid == expected_grid
+    assert journal.spilled_bytes == 0
+
+
+def test_undo_journal_spill_file_is_reclaimed_when_entries_are_forgotten():
+    grid = DenseGrid(100, 100, 1, 32)
+    journal = UndoJournal(max_depth=10, max_bytes=600, spill=True, hot_entries=0)
+    largest_spilled_bytes = 0
+    for y in range(500):
+        with journal.record(grid):
+            grid.fill_span(y % 100, 0, 100, 2, ord('0') + y % 10)
+        largest_spilled_bytes = max(largest_spilled_bytes, journal.spilled_bytes)
+    assert len(journal) == 10
+    assert 0 < largest_spilled_bytes < 10 * 200
+    while journal.undo(grid):
+        pass
+    assert journal.spilled_bytes == 0
+
+
+def test_undo_journal_copy_is_independent():
+    grid = DenseGrid(100, 100, 1, 32)
+    expected_grids = []
+    journal = UndoJournal(max_bytes=2000, spill=True, hot_entries=2)
+    for y in range(30):
+        expected_grids.append(grid.copy())
+        with journal.record(grid):
+            grid.fill_column(y, 0, 100, 2, ord('0') + y % 10)
+    journal.undo(grid)
+    copied_grid, copied_journal = grid.copy(), journal.copy()
+    assert len(copied_journal) == len(journal) == 29
+    assert copied_journal.nbytes <= 2000
+    assert copied_journal.redo(copied_grid)
+    assert copied_grid != grid
+    copied_journal.undo(copied_grid)
+    for expected_grid in reversed(expected_grids[:29]):
+        journal.undo(grid)
+        copied_journal.undo(copied_grid)
+        assert grid == copied_grid == expected_grid
+    assert journal.redo(grid) and not copied_journal.undo(copied_grid)
@@ -0,0 +1,69 @@
+import io
+import json
+
+from canvas import Canvas, Line, Point
+from instrumentation import Instrumentation
+
+
+######## Test Instrumentation ########
+
+def test_instrumentation_records_canvas_calls_per_command():
+    instrumentation = Instrumentation()
+    canvas = Canvas(10, 5, instrumentation=instrumentation)
+    with instrumentation.measure('L'):
+        canvas.draw_line(Line(Point(0, 0), Point(9, 0)))
+        canvas.draw_line(Line(Point(0, 1), Point(4, 1)))
+    with instrumentation.measure('P'):
+        str(canvas)
+    canvas.undo()
+    assert instrumentation.totals['L']['count'] == 1
+    assert instrumentation.totals['L']['cells'] == 15
+    assert instrumentation.totals['L']['undo_bytes'] == canvas.history_nbytes
+    assert instrumentation.totals['P']['render_time'] > 0
+    assert instrumentation.totals['undo']['cells'] == 5
+    assert instrumentation.summary().splitlines()[0].split() == [
+        'command', 'count', 'wall', 'time', 'cells', 'undo', 'bytes', 'render']
+
+
+def test_instrumentation_counts_cells_written_by_lazy_canvas_when_applied():
+    instrumentation = Instrumentation()
+    canvas = Canvas(10, 5, instrumentation=instrumentation, lazy=True)
+    with instrumentation.measure('L'):
+        canvas.draw_line(Line(Point(0, 0), Point(9, 0)))
+    with instrumentation.measure('B'):
+        canvas.bucket_fill(Point(0, 1), 'o')
+    with instrumentation.measure('P'):
+        str(canvas)
+    with instrumentation.measure('U'):
+        canvas.undo()
+    assert [instrumentation.totals[command]['cells'] for command in 'LBPU'] == [0, 0, 50, 40]
+
+
+def test_instrumentation_dumps_records_as_json_lines():
+    dump = io.StringIO()
+    instrumentation = Instrumentation(dump, dump_every=2)
+    canvas = Canvas(10, 5, instrumentation=instrumentation)
+    canvas.bucket_fill(Point(0, 0), 'o')
+    assert dump.getvalue() == ""
+    canvas.delete(Point(0, 0))
+    records = [json.loads(line) for line in dump.getvalue().splitlines()]
+    assert [(record['command'], record['cells']) for record in records] == [
+        ('bucket_fill', 50), ('delete', 50)]
+    canvas.redo()
+    instrumentation.flush()
+    assert len(dump.getvalue().splitlines()) == 3
+
+
+def test_canvas_without_instrumentation():
+    canvas = Canvas(10, 5)
+    canvas.draw_line(Line(Point(0, 0), Point(9, 0)))
+    assert canvas.last_cell_count == 10
+
+
+def test_instrumented_methods_accept_keyword_arguments():
+    instrumentation = Instrumentation()
+    canvas = Canvas(10, 5, instrumentation=instrumentation)
+    canvas.draw_line(line=Line(Point(0, 0), Point(9, 0)))
+    assert instrumentation.totals['draw_line']['cells'] == 10
+    assert Canvas.draw_line.__wrapped__.__name__ == 'draw_line'
+    assert Canvas.draw_line.__doc__ == Canvas.draw_line.__wrapped__.__doc__
@@ -0,0 +1,99 @@
+import io
+
+from canvas import Canvas, Line, Point, Rectangle
+from history import UndoJournal
+from lazy import PendingLog
+from storage import TILE_SIZE, TiledGrid
+
+import pytest
+
+STORAGES = [{'sparse': False}, {'sparse': True}, {'run_length': True}]
+
+
+def draw_shapes(canvas):
+    canvas.draw_rectangle(Rectangle(Point(10, 10), Point(150, 100)))
+    canvas.draw_line(Line(Point(0, 70), Point(199, 70)))
+    canvas.bucket_fill(Point(20, 20), 'o')
+    canvas.draw_filled_rectangle(Rectangle(Point(60, 0), Point(70, 129)))
+    canvas.draw_line(Line(Point(100, 0), Point(100, 129)))
+    canvas.bucket_fill(Point(180, 120), '.')
+    canvas.delete(Point(10, 10))
+    canvas.draw_line(Line(Point(5, 5), Point(5, 120)))
+
+######## Test lazy Canvas ########
+
+@pytest.mark.parametrize('storage', STORAGES)
+def test_lazy_canvas_matches_eager_canvas(storage):
+    eager, lazy = Canvas(200, 130, **storage), Canvas(200, 130, lazy=True, **storage)
+    draw_shapes(eager)
+    draw_shapes(lazy)
+    assert str(lazy) == str(eager)
+    for _ in range(3):
+        eager.undo()
+        lazy.undo()
+        assert str(lazy) == str(eager)
+    lazy.redo()
+    eager.redo()
+    assert lazy.cells == eager.cells
+
+
+def test_lazy_canvas_renders_region_from_its_tiles():
+    lazy, eager = Canvas(200, 130, lazy=True), Canvas(200, 130)
+    for canvas in (lazy, eager):
+        canvas.bucket_fill(Point(0, 0), 'o')
+        canvas.draw_line(Line(Point(0, 3), Point(199, 3)))
+        canvas.draw_line(Line(Point(150, 0), Point(150, 129)))
+    region = Rectangle(Point(0, 0), Point(20, 10))
+    lazy_output, eager_output = io.StringIO(), io.StringIO()
+    lazy.render_to(lazy_output, region)
+    eager.render_to(eager_output, region)
+    assert lazy_output.getvalue() == eager_output.getvalue()
+    # the fill is applied, the parts of the lines outside the region are not
+    assert lazy._grid.get(199, 3)[1] == ord('o')
+    assert lazy._grid.get(150, 100)[1] == ord('o')
+    assert lazy._grid.get(150, 3)[1] == ord('o')
+    assert len(lazy._pending) == 2
+    lazy.flush()
+    assert len(lazy._pending) == 0
+    assert str(lazy) == str(eager)
+
+
+def test_lazy_canvas_fill_crosses_tiles():
+    size = TILE_SIZE * 3
+    lazy, eager = Canvas(size, size, lazy=True, sparse=True), Canvas(size, size, sparse=True)
+    for canvas in (lazy, eager):
+        canvas.draw_rectangle(Rectangle(Point(1, 1), Point(size - 2, size - 2)))
+        canvas.draw_line(Line(Point(1, TILE_SIZE), Point(size - 2, TILE_SIZE)))
+        canvas.bucket_fill(Point(size - 3, size - 3), '#')
+    output = io.StringIO()
+    lazy.render_to(output, Rectangle(Point(2, 2), Point(4, TILE_SIZE + 2)))
+    assert output.getvalue() == " --- \n" + "|   |\n" * (TILE_SIZE - 2) + \
+        "|xxx|\n|###|\n|###|\n --- "
+    assert str(lazy) == str(eager)
+
+
+def test_lazy_canvas_switched_off_flushes():
+    canvas = Canvas(5, 3, lazy=True)
+    canvas.draw_line(Line(Point(0, 1), Point(4, 1)))
+    assert canvas.lazy and canvas.history_nbytes == 0
+    canvas.lazy = False
+    assert not canvas.lazy
+    assert str(canvas) == " ----- \n|     |\n|xxxxx|\n|     |\n ----- "
+    canvas.undo()
+    assert str(canvas) == " ----- \n|     |\n|     |\n|     |\n ----- "
+
+######## Test PendingLog ########
+
+def test_pending_log_applies_draws_by_tile():
+    grid = TiledGrid(TILE_SIZE * 2, TILE_SIZE, 0, ord(' '))
+    journal = UndoJournal()
+    log = PendingLog(journal, None)
+    log.append_draw([(0, 0, TILE_SIZE * 2, 1)], 1, ord('x'))
+    log.flush(grid, (0, 0, 1, 1))
+    assert grid.get(0, 0) == (1, ord('x')) and grid.get(TILE_SIZE, 0) == (0, ord(' '))
+    assert journal.nbytes == 0 and len(log) == 1
+    log.flush(grid)
+    assert grid.get(TILE_SIZE, 0) == (1, ord('x'))
+    assert len(log) == 0
+    journal.undo(grid)
+    assert grid.get(0, 0) == (0, ord(' ')) and grid.get(TILE_SIZE, 0) == (0, ord(' '))
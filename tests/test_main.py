@@ -0,0 +1,151 @@
+import io
+
+import main
+
+import pytest
+
+@pytest.fixture(autouse=True)
+def reset_workspace():
+    main.workspace = main.Workspace()
+    main.viewport = None
+    main.command_log = None
+
+
+def run(script, render='final'):
+    output = io.StringIO()
+    main.run_script(io.StringIO(script), output, render)
+    return output.getvalue()
+
+
+def test_run_script_renders_final_canvas():
+    expected_output = (" --- " "\n"
+                       "|ooo|" "\n"
+                       "|xxx|" "\n"
+                       " --- " "\n")
+    assert run("C 3 2\nL 0 1 2 1\nB 0 0 o\n") == expected_output
+
+
+def test_run_script_renders_every_n_commands():
+    output = run("C 3 1\n\nL 0 0 0 0\nL 1 0 1 0\nL 2 0 2 0\n", render='2')
+    assert output.splitlines() == [" --- ", "|x  |", " --- ", " --- ", "|xxx|", " --- "]
+
+
+def test_run_script_renders_on_print_command():
+    output = run("C 3 1\nP\nL 0 0 2 0\n", render='never')
+    assert output.splitlines() == [" --- ", "|   |", " --- "]
+
+
+def test_run_script_reports_errors_with_line_numbers():
+    output = run("C 3 1\nX\nL 0 0 9 0\nL 0 0\n", render='never')
+    assert output.splitlines() == [
+        "line 2: Unknown command",
+        "line 3: Out of canvas bounds",
+        "line 4: 4 arguments expected (x1, y1, x2, y2)",
+    ]
+
+
+def test_run_script_stops_on_exit_command():
+    output = run("C 3 1\nQ\nL 0 0 2 0\n")
+    assert output.splitlines() == [" --- ", "|   |", " --- "]
+
+
+def test_run_script_reports_errors_before_executing_commands():
+    output = run("C 3 1\nL 0 0 2 0\nB 0 0\nP\nD 5 0\n", render='never')
+    assert output.splitlines() == [
+        "line 3: 3 arguments expected (x, y, colour)",
+        "line 5: Out of canvas bounds",
+        " --- ", "|xxx|", " --- ",
+    ]
+
+
+def test_run_script_check_only_compiles_the_script():
+    output = io.StringIO()
+    assert main.run_script(io.StringIO("C 3 1\nL 0 0 2 0\n"), output, check=True)
+    assert output.getvalue() == ""
+    assert main.workspace.current is None
+    assert not main.run_script(io.StringIO("L 0 0 2 0\n"), output, check=True)
+    assert output.getvalue() == "line 1: No canvas, create one first\n"
+
+
+def test_run_script_prints_stats_when_instrumented():
+    output = io.StringIO()
+    main.run_script(io.StringIO("C 3 1\nL 0 0 2 0\nT\n"), output, 'never',
+                    instrumentation_to_use=main.Instrumentation())
+    lines = output.getvalue().splitlines()
+    assert [line.split()[:2] for line in lines[1:]] == [['C', '1'], ['L', '1']]
+    assert lines[2].split()[4] == '3'
+    assert run("C 3 1\nT\n", render='never') == (
+        "line 2: Instrumentation is disabled (see --instrument)\n")
+
+
+def test_run_script_draws_on_named_canvases():
+    output = run("C 3 1\nN small 2 1\nL 0 0 1 0\nW main\nF 0 0 2 0\nA\n"
+                 "W small\nB 0 0 o\nW nope\n")
+    assert output.splitlines() == [
+        "line 9: No canvas named nope",
+        "* main 3x1",
+        "  small 2x1",
+        " -- ", "|oo|", " -- ",
+    ]
+    assert str(main.workspace.get('main')).splitlines()[1] == "|xxx|"
+
+
+def test_interactive_workspace_commands(capsys):
+    commands = main._create_commands_dictionary()
+    for user_input in ["N first 2 1", "L 0 0 1 0", "N second 3 1", "A", "W first", "W nope"]:
+        main._interact(commands, user_input)
+    assert capsys.readouterr().out.splitlines() == [
+        " -- ", "|  |", " -- ",
+        " -- ", "|xx|", " -- ",
+        " --- ", "|   |", " --- ",
+        "  first 2x1", "* second 3x1",
+        " -- ", "|xx|", " -- ",
+        "No canvas named nope",
+    ]
+
+
+def test_interactive_draw_without_canvas_is_an_error(capsys):
+    commands = main._create_commands_dictionary()
+    main._interact(commands, "L 1 1 2 2")
+    assert capsys.readouterr().out == "No canvas, create one first\n"
+
+
+def test_interactive_bucket_fill_without_colour_is_an_error(capsys):
+    commands = main._create_commands_dictionary()
+    main._interact(commands, "C 3 1")
+    capsys.readouterr()
+    main._interact(commands, "B 1 1")
+    assert capsys.readouterr().out == "3 arguments expected (x, y, colour)\n"
+
+
+def test_interactive_commands_are_logged(capsys):
+    file = io.BytesIO()
+    main.command_log = main.CommandLogWriter(file, main.workspace)
+    commands = main._create_commands_dictionary()
+    for user_input in ["C 5 3", "L 0 0 4 0", "C 0 3", "N other 2 2", "B 0 0 o", "W main", "U"]:
+        main._interact(commands, user_input)
+    main.command_log.close()
+    assert "Width and heigth must be positive" in capsys.readouterr().out
+    file.seek(0)
+    replayed = main.replay(file, from_checkpoint=False)
+    assert replayed.sizes() == main.workspace.sizes()
+    for name in replayed.sizes():
+        assert str(replayed.get(name)) == str(main.workspace.get(name))
+
+
+def test_main_outputs_viewport(monkeypatch, capfd):
+    monkeypatch.setattr('sys.stdin', io.StringIO("C 5 3\nL 0 1 4 1\nQ\n"))
+    main.main(['--script', '-', '--viewport', '1', '0', '2', '1'])
+    assert capfd.readouterr().out == " -- \n|  |\n|xx|\n -- \n"
+
+
+def test_main_logs_and_replays_commands(monkeypatch, capfd, tmp_path):
+    log_path = str(tmp_path / 'session.log')
+    monkeypatch.setattr('sys.stdin', io.StringIO("C 5 2\nL 0 1 4 1\nB 0 0 o\nP\nQ\n"))
+    main.main(['--script', '-', '--render', 'never', '--log', log_path])
+    assert capfd.readouterr().out == " ----- \n|ooooo|\n|xxxxx|\n ----- \n"
+    main.workspace = main.Workspace()
+    main.command_log = None
+    monkeypatch.setattr('sys.stdin', io.StringIO("U\n"))
+    main.main(['--script', '-', '--replay', log_path])
+    assert capfd.readouterr().out == " ----- \n|     |\n|xxxxx|\n ----- \n"
@@ -0,0 +1,95 @@
+from multiprocessing import shared_memory
+
+from canvas import Canvas, CanvasCellContentType, Point, Line, Rectangle
+from diff import CELLS, DiffEncoder, decode
+from parallel import ParallelEngine
+from storage import ROW
+
+import pytest
+
+def draw_maze(canvas):
+    canvas.draw_rectangle(Rectangle(Point(2, 2), Point(57, 37)))
+    for x in range(5, 55, 4):
+        canvas.draw_line(Line(Point(x, 3), Point(x, 33)))
+        canvas.draw_line(Line(Point(x + 2, 6), Point(x + 2, 36)))
+    canvas.draw_line(Line(Point(0, 39), Point(59, 0)))
+
+
+def test_parallel_canvas_behaves_as_serial_canvas():
+    serial_canvas = Canvas(60, 40)
+    parallel_canvas = Canvas(60, 40, workers=2)
+    try:
+        for canvas in (serial_canvas, parallel_canvas):
+            draw_maze(canvas)
+            canvas.bucket_fill(Point(4, 4), 'o')
+            canvas.bucket_fill(Point(0, 0), 'b')
+            canvas.delete(Point(2, 2))
+            canvas.bucket_fill(Point(2, 2), 'z')
+        assert str(parallel_canvas) == str(serial_canvas)
+        assert parallel_canvas.cells == serial_canvas.cells
+        for canvas in (serial_canvas, parallel_canvas):
+            canvas.undo()
+            canvas.undo()
+        assert str(parallel_canvas) == str(serial_canvas)
+        assert parallel_canvas.cells == serial_canvas.cells
+    finally:
+        parallel_canvas.close()
+
+
+def test_parallel_engine_fill_across_many_bands():
+    serial_canvas = Canvas(60, 40)
+    draw_maze(serial_canvas)
+    serial_canvas.bucket_fill(Point(4, 4), 'o')
+    engine = ParallelEngine(60, 40, 1, ord(' '), workers=1, bands=40)
+    try:
+        canvas = Canvas(60, 40, grid=engine.grid)
+        draw_maze(canvas)
+        engine.grid.recorder = []
+        engine.bucket_fill(4, 4, 1, ord('o'))
+        assert canvas.cells == serial_canvas.cells
+        assert all(change[0] == ROW for change in engine.grid.recorder)
+        engine.grid.dirty_rows.clear()
+        engine.grid.dirty_rows.add(5)
+        assert engine.render() == str(serial_canvas)
+    finally:
+        engine.close()
+
+
+def test_parallel_canvas_close_releases_shared_memory():
+    canvas = Canvas(10, 10, workers=1)
+    name = canvas._parallel._cells.name
+    canvas.close()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_parallel_canvas_creation_fails_with_sparse_storage():
+    with pytest.raises(ValueError):
+        Canvas(10, 10, sparse=True, workers=2)
+
+
+def test_parallel_canvas_diffs_decode_as_serial_canvas():
+    canvas = Canvas(30, 20, workers=1)
+    try:
+        encoder = DiffEncoder(CELLS)
+        rows = decode(encoder.encode(canvas))
+        canvas.draw_line(Line(Point(0, 5), Point(29, 5)))
+        canvas.bucket_fill(Point(0, 0), 'o')
+        rows = decode(encoder.encode(canvas), rows)
+        assert rows == [line[1:-1] for line in str(canvas).splitlines()[1:-1]]
+    finally:
+        canvas.close()
+
+
+def test_parallel_canvas_clone_copies_its_cells():
+    canvas = Canvas(30, 20, workers=1)
+    try:
+        canvas.draw_line(Line(Point(0, 5), Point(29, 5)))
+        clone = canvas.clone()
+        canvas.bucket_fill(Point(0, 0), 'o')
+        canvas.close()
+        assert clone.cells[0][0] == (CanvasCellContentType.Empty, ' ')
+        clone.undo()
+        assert clone.cells[0][5] == (CanvasCellContentType.Empty, ' ')
+    finally:
+        canvas.close()
@@ -0,0 +1,140 @@
+from canvas import Canvas, Line, Point, Rectangle
+from pipeline import (
+    BucketFill,
+    CreateCanvas,
+    DrawLine,
+    DrawRectangle,
+    Exit,
+    NewCanvas,
+    OpenCanvas,
+    SaveCanvas,
+    ScriptExecutor,
+    SwitchCanvas,
+    compile_script,
+    optimize
+)
+
+
+######## Test compile_script ########
+
+def test_compile_script_builds_typed_operations():
+    operations, errors = compile_script(["C 4 3\n", "\n", "L 0 0 3 2\n", "R 0 0 1 1\n",
+                                         "B 3 0 o\n", "Q\n", "X\n"])
+    assert errors == []
+    assert operations == [
+        CreateCanvas(1, 4, 3),
+        DrawLine(3, Line(Point(0, 0), Point(3, 2))),
+        DrawRectangle(4, Rectangle(Point(0, 0), Point(1, 1))),
+        BucketFill(5, Point(3, 0), 'o'),
+        Exit(6),
+    ]
+
+
+def test_compile_script_reports_every_invalid_line():
+    _, errors = compile_script(["L 0 0 1 1", "C 3 a", "C 3 2", "X", "L 0  0 1 1",
+                                "B 0 0 oo", "D 0 2", "R 0 0 1"])
+    assert errors == [
+        (1, "No canvas, create one first"),
+        (2, "Width and heigth must be convertible to integers"),
+        (4, "Unknown command"),
+        (5, "Coordinates must be convertible to integers"),
+        (6, "Colour must be a single latin-1 character"),
+        (7, "Out of canvas bounds"),
+        (8, "4 arguments expected (x1, y1, x2, y2)"),
+    ]
+
+
+def test_compile_script_follows_the_size_of_saved_and_opened_canvases(tmpdir):
+    path = str(tmpdir.join('saved canvas'))
+    operations, errors = compile_script(["C 2 2", "S " + path, "C 5 5", "O " + path,
+                                         "L 0 0 4 0"])
+    assert operations[3] == OpenCanvas(4, path, 2, 2)
+    assert errors == [(5, "Out of canvas bounds")]
+
+
+def test_compile_script_follows_the_size_of_named_canvases():
+    operations, errors = compile_script(["N first 2 2", "C 3 3", "N second 5 1",
+                                         "W first", "L 0 2 2 2", "W third", "W main",
+                                         "W second", "L 0 0 4 0"], canvas_sizes={'main': (1, 1)})
+    assert operations[2] == NewCanvas(3, 'second', 5, 1)
+    assert operations[3] == SwitchCanvas(4, 'first')
+    assert errors == [(6, "No canvas named third")]
+    operations, errors = compile_script(["C 2 2", "W main", "L 0 0 1 1"])
+    assert errors == []
+
+
+######## Test ScriptExecutor ########
+
+def test_executor_runs_operations_on_canvas(tmpdir):
+    path = str(tmpdir.join('canvas'))
+    operations, _ = compile_script(["C 3 1", "L 0 0 1 0", "B 2 0 o", "U", "S " + path])
+    executor = ScriptExecutor()
+    assert [executor.execute(operation) for operation in operations] == [None] * 5
+    expected_canvas = Canvas(3, 1)
+    expected_canvas.draw_line(Line(Point(0, 0), Point(1, 0)))
+    assert executor.canvas.cells == expected_canvas.cells
+    assert Canvas.load(path).cells == expected_canvas.cells
+
+
+def test_executor_returns_file_errors(tmpdir):
+    executor = ScriptExecutor(Canvas(2, 2))
+    path = str(tmpdir.join('missing', 'canvas'))
+    assert executor.execute(SaveCanvas(1, path)).startswith("Cannot save the canvas: ")
+    assert executor.execute(OpenCanvas(2, path, 2, 2)).startswith("Cannot open the canvas: ")
+
+
+######## Test optimize ########
+
+def test_optimize_eliminates_operations_before_new_canvas():
+    operations, _ = compile_script(["C 3 3", "L 0 0 2 0", "P", "L 0 1 2 1", "U", "C 2 2"])
+    remaining, eliminated_count = optimize(operations)
+    assert [operation.line_number for operation in remaining] == [1, 2, 3, 6]
+    assert eliminated_count == 2
+
+
+def test_optimize_keeps_operations_before_stats():
+    operations, _ = compile_script(["C 5 3", "L 0 0 4 0", "T", "C 4 2"])
+    remaining, eliminated_count = optimize(operations)
+    assert [operation.line_number for operation in remaining] == [1, 2, 3, 4]
+    assert eliminated_count == 0
+
+
+def test_optimize_keeps_operations_on_other_named_canvases():
+    operations, _ = compile_script(["C 3 3", "L 0 0 2 0", "N other 2 2", "L 0 0 1 0",
+                                    "W main", "C 2 2"])
+    remaining, eliminated_count = optimize(operations)
+    assert [operation.line_number for operation in remaining] == [1, 2, 3, 4, 5, 6]
+    assert eliminated_count == 0
+
+
+def test_optimize_eliminates_covered_draws_and_repeated_fills():
+    operations, _ = compile_script(["C 5 5", "L 0 0 2 0", "R 0 0 1 1", "L 0 0 2 0",
+                                    "F 0 0 3 3", "B 4 4 o", "B 4 4 p", "D 4 4",
+                                    "L 0 4 1 4", "B 0 4 q", "L 0 4 1 4"])
+    remaining, eliminated_count = optimize(operations)
+    assert [operation.line_number for operation in remaining] == [1, 5, 8, 9, 10, 11]
+    assert eliminated_count == 5
+
+
+def test_optimize_keeps_operations_before_undo():
+    operations, _ = compile_script(["C 3 3", "L 0 0 2 0", "L 0 0 2 0", "U", "B 0 0 o",
+                                    "B 0 0 p"])
+    remaining, eliminated_count = optimize(operations)
+    assert [operation.line_number for operation in remaining] == [1, 2, 3, 4, 6]
+    assert eliminated_count == 1
+
+
+def test_optimized_script_draws_identical_canvas():
+    script = ["C 6 4", "B 0 0 a", "L 0 0 5 3", "F 1 1 4 2", "R 1 1 4 2", "L 2 1 3 2",
+              "B 5 0 b", "D 5 0", "B 5 0 c", "L 0 3 5 3", "B 0 3 d", "U", "Y",
+              "L 0 0 1 1", "F 0 0 2 2", "B 5 1 e", "B 5 1 f"]
+    operations, _ = compile_script(script)
+    remaining, eliminated_count = optimize(operations)
+    assert eliminated_count == 2
+    executor, optimized_executor = ScriptExecutor(), ScriptExecutor()
+    for operation in operations:
+        executor.execute(operation)
+    for operation in remaining:
+        optimized_executor.execute(operation)
+    assert str(optimized_executor.canvas) == str(executor.canvas)
+    assert optimized_executor.canvas.cells == executor.canvas.cells
@@ -0,0 +1,45 @@
+from render import CanvasRenderer
+from storage import DenseGrid
+
+######## Test CanvasRenderer ########
+
+def test_canvas_renderer_render():
+    expected_canvas_str = (" --- " "\n"
+                           "|x  |" "\n"
+                           "| oo|" "\n"
+                           " --- ")
+    grid = DenseGrid(3, 2, 1, ord(' '))
+    grid.set(0, 0, 2, ord('x'))
+    grid.fill_span(1, 1, 3, 1, ord('o'))
+    assert CanvasRenderer(grid).render() == expected_canvas_str
+
+
+def test_canvas_renderer_only_renders_dirty_rows():
+    grid = DenseGrid(3, 3, 1, ord(' '))
+    renderer = CanvasRenderer(grid)
+    renderer.render()
+    grid.fill_span(1, 0, 3, 1, ord('o'))
+    grid._colours[0] = ord('z')
+    assert renderer.render().splitlines()[1:4] == ["|   |", "|ooo|", "|   |"]
+    grid.dirty_rows.add(0)
+    assert renderer.render().splitlines()[1:4] == ["|z  |", "|ooo|", "|   |"]
+
+
+def test_canvas_renderer_renders_rows_modified_by_column_writes():
+    grid = DenseGrid(3, 3, 1, ord(' '))
+    renderer = CanvasRenderer(grid)
+    renderer.render()
+    grid.fill_column(2, 0, 3, 2, ord('x'))
+    assert renderer.render().splitlines()[1:4] == ["|  x|", "|  x|", "|  x|"]
+
+
+def test_canvas_renderer_takes_changed_rows():
+    grid = DenseGrid(3, 3, 1, ord(' '))
+    renderer = CanvasRenderer(grid)
+    assert renderer.take_changed_rows() == [(0, None, '   '), (1, None, '   '), (2, None, '   ')]
+    grid.fill_span(2, 0, 2, 1, ord('o'))
+    grid.fill_span(0, 0, 3, 1, ord(' '))
+    renderer.render()
+    grid.set(1, 1, 1, ord('z'))
+    assert renderer.take_changed_rows() == [(1, '   ', ' z '), (2, '   ', 'oo ')]
+    assert renderer.take_changed_rows() == []
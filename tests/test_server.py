@@ -0,0 +1,112 @@
+import asyncio
+import threading
+
+from diff import ROWS, DiffEncoder
+from instrumentation import Instrumentation
+import server
+from server import CanvasServer
+
+
+async def send(reader, writer, line):
+    writer.write((line + '\n').encode('latin-1'))
+    header = (await reader.readline()).decode('latin-1').rstrip('\n')
+    kind, _, argument = header.partition(' ')
+    if kind in ('FRAME', 'DIFF', 'TEXT'):
+        lines = [(await reader.readline()).decode('latin-1').rstrip('\n')
+                 for _ in range(int(argument))]
+        return kind, lines
+    return kind, argument
+
+
+def run_sessions(*scripts, **server_kwargs):
+    async def run_session(port, script):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        responses = [await send(reader, writer, line) for line in script]
+        writer.close()
+        return responses
+
+    async def run_all():
+        server = CanvasServer(**server_kwargs)
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            return await asyncio.gather(*[run_session(port, script) for script in scripts])
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            server.close()
+
+    return asyncio.run(run_all())
+
+
+######## Test CanvasServer ########
+
+def test_server_keeps_a_canvas_per_session():
+    first, second = run_sessions(["C 3 1", "L 0 0 1 0", "B 2 0 o"],
+                                 ["C 2 2", "B 0 0 z", "U"])
+    assert first == [
+        ('FRAME', [' --- ', '|   |', ' --- ']),
+        ('FRAME', [' --- ', '|xx |', ' --- ']),
+        ('FRAME', [' --- ', '|xxo|', ' --- ']),
+    ]
+    assert second[1] == ('FRAME', [' -- ', '|zz|', '|zz|', ' -- '])
+    assert second[2] == ('FRAME', [' -- ', '|  |', '|  |', ' -- '])
+
+
+def test_server_reports_errors_and_ends_sessions():
+    responses, = run_sessions(["L 0 0 1 1", "C 2 2", "X", "B 5 5 o", "T", "Q"])
+    assert responses == [
+        ('ERROR', "No canvas, create one first"),
+        ('FRAME', [' -- ', '|  |', '|  |', ' -- ']),
+        ('ERROR', "Unknown command"),
+        ('ERROR', "Out of canvas bounds"),
+        ('ERROR', "Instrumentation is disabled (see --instrument)"),
+        ('BYE', ''),
+    ]
+
+
+def test_server_runs_the_commands_changing_or_rendering_canvases_in_threads(monkeypatch):
+    threads = []
+    execute = server.Session.execute
+
+    def record_thread(session, user_input):
+        threads.append((user_input[0], threading.current_thread() is threading.main_thread()))
+        return execute(session, user_input)
+
+    monkeypatch.setattr(server.Session, 'execute', record_thread)
+    run_sessions(["C 3 1", "F 0 0 2 0", "U", "Y", "L 0 0 1 0", "T", "Q"])
+    assert threads == [('C', False), ('F', False), ('U', False), ('Y', False), ('L', False),
+                       ('T', True), ('Q', True)]
+
+
+def test_server_instruments_sessions_over_unix_socket(tmpdir):
+    path = str(tmpdir.join('canvas.sock'))
+
+    async def run():
+        server = CanvasServer(instrumentation_fn=Instrumentation)
+        listener = await server.start(path=path)
+        try:
+            reader, writer = await asyncio.open_unix_connection(path)
+            await send(reader, writer, "C 4 4")
+            await send(reader, writer, "B 0 0 o")
+            kind, lines = await send(reader, writer, "T")
+            writer.close()
+            return kind, lines
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            server.close()
+
+    kind, lines = asyncio.run(run())
+    assert kind == 'TEXT'
+    assert [line.split()[:2] for line in lines[1:]] == [['B', '1'], ['C', '1']]
+    assert lines[1].split()[4] == '16'
+
+
+def test_server_sends_diffs():
+    responses, = run_sessions(["C 3 2", "L 0 1 2 1"],
+                              encoder_fn=lambda: DiffEncoder(ROWS))
+    assert responses == [
+        ('DIFF', ['K 3 2', ' --- ', '|   |', '|   |', ' --- ']),
+        ('DIFF', ['R 1', '1 xxx']),
+    ]
@@ -0,0 +1,306 @@
+import io
+
+from storage import TILE_SIZE, DenseGrid, RunGrid, Runs, TiledGrid, dump_cells, load_cells
+
+import pytest
+
+######## Test DenseGrid ########
+
+def test_dense_grid_initialize():
+    grid = DenseGrid(4, 3, 1, 32)
+    assert grid.width == 4 and grid.height == 3
+    assert grid.nbytes == 2 * 4 * 3
+    for y in range(3):
+        assert grid.row_types(y) == b'\x01' * 4
+        assert grid.row_colours(y) == b' ' * 4
+
+
+def test_dense_grid_creation_fails_with_incorrect_planes():
+    with pytest.raises(ValueError):
+        DenseGrid(4, 3, types=bytearray(5), colours=bytearray(12))
+
+
+def test_dense_grid_set_and_get():
+    grid = DenseGrid(4, 3, 1, 32)
+    grid.set(3, 2, 2, ord('x'))
+    assert grid.get(3, 2) == (2, ord('x'))
+    assert grid.row_colours(2) == b'   x'
+
+
+def test_dense_grid_fill_span():
+    grid = DenseGrid(5, 2, 1, 32)
+    grid.fill_span(1, 1, 4, 2, ord('o'))
+    assert grid.row_types(1) == b'\x01\x02\x02\x02\x01'
+    assert grid.row_colours(1, 1, 4) == b'ooo'
+    assert grid.row_colours(0) == b'     '
+
+
+def test_dense_grid_fill_column():
+    grid = DenseGrid(3, 4, 1, 32)
+    grid.fill_column(1, 1, 3, 2, ord('x'))
+    assert [grid.row_colours(y) for y in range(4)] == [b'   ', b' x ', b' x ', b'   ']
+
+
+def test_dense_grid_copy_is_independent():
+    grid = DenseGrid(3, 3, 1, 32)
+    copy = grid.copy()
+    assert copy == grid
+    copy.set(0, 0, 2, ord('x'))
+    assert copy != grid
+    assert grid.get(0, 0) == (1, 32)
+
+
+def test_dense_grid_copy_only_duplicates_written_rows():
+    grid = DenseGrid(4, 3, 1, 32)
+    copy = grid.copy()
+    copy.set(1, 1, 2, ord('x'))
+    copy.fill_column(3, 1, 3, 2, ord('y'))
+    assert copy._types is grid._types and sorted(copy._rows) == [1, 2]
+    assert grid.get(1, 1) == (1, 32) and copy.get(1, 1) == (2, ord('x'))
+    assert copy.row_colours(1) == b' x y' and grid.row_colours(1) == b'    '
+    assert copy.nbytes == grid.nbytes + 2 * 2 * 4
+    second_copy = copy.copy()
+    second_copy.set(0, 1, 2, ord('z'))
+    assert copy.row_colours(1) == b' x y' and second_copy.row_colours(1) == b'zx y'
+    del grid, second_copy
+    # the last grid sharing the planes writes its private rows back to them
+    planes = copy._types
+    copy.set(0, 0, 2, ord('w'))
+    assert copy._types is planes and copy._rows is None
+    assert [copy.row_colours(y) for y in range(3)] == [b'w   ', b' x y', b'   y']
+
+
+def test_dense_grid_save_and_load(tmp_path):
+    path = str(tmp_path / 'grid.canvas')
+    grid = DenseGrid(7, 3, 1, 32)
+    grid.fill_span(1, 2, 6, 2, ord('x'))
+    grid.save(path)
+    loaded_grid = DenseGrid.load(path)
+    assert loaded_grid == grid
+    assert loaded_grid.row_colours(1) == b'  xxxx '
+
+
+def test_dense_grid_loaded_modifications_are_not_written_to_file(tmp_path):
+    path = str(tmp_path / 'grid.canvas')
+    grid = DenseGrid(4, 4, 1, 32)
+    grid.save(path)
+    loaded_grid = DenseGrid.load(path)
+    loaded_grid.fill_column(1, 0, 4, 2, ord('x'))
+    loaded_grid.set(3, 3, 2, ord('z'))
+    assert DenseGrid.load(path) == grid
+    loaded_grid.save(path)
+    assert DenseGrid.load(path) == loaded_grid
+
+
+def test_dense_grid_load_fails_with_incorrect_file(tmp_path):
+    path = tmp_path / 'grid.canvas'
+    path.write_bytes(b'not a canvas file at all')
+    with pytest.raises(ValueError):
+        DenseGrid.load(str(path))
+    DenseGrid(4, 4, 1, 32).save(str(path))
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        DenseGrid.load(str(path))
+
+
+######## Test TiledGrid ########
+
+def test_tiled_grid_initialize():
+    grid = TiledGrid(200, 100, 1, 32)
+    assert grid.width == 200 and grid.height == 100
+    assert grid.get(150, 99) == (1, 32)
+    assert grid.row_colours(42) == b' ' * 200
+    assert grid.tile_count == 0 and grid.nbytes == 0
+
+
+def test_tiled_grid_allocates_tiles_on_first_write():
+    grid = TiledGrid(1000, 1000, 1, 32)
+    grid.set(500, 500, 2, ord('x'))
+    assert grid.tile_count == 1
+    assert grid.get(500, 500) == (2, ord('x'))
+    grid.fill_span(10, 0, 1000, 1, 32)
+    grid.fill_column(20, 0, 1000, 1, 32)
+    assert grid.tile_count == 1
+
+
+def test_tiled_grid_writes_across_tiles():
+    grid = TiledGrid(3 * TILE_SIZE, 3 * TILE_SIZE, 1, 32)
+    grid.fill_span(TILE_SIZE + 1, 10, 2 * TILE_SIZE + 10, 2, ord('x'))
+    grid.fill_column(TILE_SIZE - 1, 5, 3 * TILE_SIZE, 2, ord('o'))
+    assert grid.tile_count == 5
+    assert grid.row_colours(TILE_SIZE + 1, 8, 12) == b'  xx'
+    assert grid.row_colours(TILE_SIZE + 1, TILE_SIZE - 2, TILE_SIZE + 1) == b'xox'
+    assert grid.get(TILE_SIZE - 1, 3 * TILE_SIZE - 1) == (2, ord('o'))
+    assert grid.get(TILE_SIZE - 1, 4) == (1, 32)
+
+
+def test_tiled_grid_behaves_as_dense_grid():
+    size = 2 * TILE_SIZE + 7
+    dense_grid, tiled_grid = DenseGrid(size, size, 1, 32), TiledGrid(size, size, 1, 32)
+    for grid in (dense_grid, tiled_grid):
+        grid.recorder = []
+        grid.fill_span(3, 0, size, 2, ord('x'))
+        grid.fill_column(size - 1, 2, size, 2, ord('y'))
+        grid.write_span(TILE_SIZE, TILE_SIZE - 2, b'\x01\x02\x02\x01', b'abcd')
+        grid.write_column(70, 60, b'\x02' * 10, b'0123456789')
+        grid.set(0, size - 1, 2, ord('z'))
+    assert tiled_grid == dense_grid
+    assert dense_grid == tiled_grid
+    assert tiled_grid.dirty_rows == dense_grid.dirty_rows
+    assert tiled_grid.recorder == dense_grid.recorder
+    copy = tiled_grid.copy()
+    copy.set(1, 1, 2, ord('x'))
+    assert copy != tiled_grid and tiled_grid == dense_grid
+
+
+def test_tiled_grid_copy_only_duplicates_written_tiles():
+    grid = TiledGrid(3 * TILE_SIZE, TILE_SIZE, 1, 32)
+    grid.fill_span(0, 0, 3 * TILE_SIZE, 2, ord('x'))
+    copy = grid.copy()
+    copy.set(TILE_SIZE, 1, 2, ord('o'))
+    assert copy._tiles[(1, 0)] is not grid._tiles[(1, 0)]
+    assert copy._tiles[(0, 0)] is grid._tiles[(0, 0)]
+    assert grid.get(TILE_SIZE, 1) == (1, 32)
+    grid.set(0, 1, 2, ord('o'))
+    assert copy.get(0, 1) == (1, 32)
+    copy_of_copy = copy.copy()
+    copy.fill_span(2, 0, 3 * TILE_SIZE, 2, ord('y'))
+    assert copy_of_copy.row_colours(2) == b' ' * 3 * TILE_SIZE
+
+
+def test_tiled_grid_save_and_load(tmp_path):
+    path = str(tmp_path / 'grid.canvas')
+    grid = TiledGrid(100, 70, 1, 32)
+    grid.fill_span(65, 3, 90, 2, ord('x'))
+    grid.save(path)
+    assert DenseGrid.load(path) == grid
+
+
+######## Test RunGrid ########
+
+def test_run_grid_initialize():
+    grid = RunGrid(200, 100, 1, 32)
+    assert grid.width == 200 and grid.height == 100
+    assert grid.get(150, 99) == (1, 32)
+    assert grid.row_colours(42) == b' ' * 200
+    assert grid.row_runs(42) == [(200, 1, 32)]
+    assert grid.dense_row_count == 0
+
+
+def test_run_grid_fill_span_splices_and_merges_runs():
+    grid = RunGrid(10, 2, 1, 32)
+    grid.fill_span(0, 2, 5, 2, ord('x'))
+    assert grid.row_runs(0) == [(2, 1, 32), (3, 2, ord('x')), (5, 1, 32)]
+    assert grid.row_runs(1) == [(10, 1, 32)]
+    grid.fill_span(0, 5, 7, 2, ord('x'))
+    grid.set(1, 0, 1, ord('o'))
+    assert grid.row_runs(0) == [(1, 1, 32), (1, 1, ord('o')), (5, 2, ord('x')), (3, 1, 32)]
+    assert grid.row_colours(0) == b' oxxxxx   '
+    grid.fill_span(0, 0, 10, 1, 32)
+    assert grid.row_runs(0) == [(10, 1, 32)]
+
+
+def test_run_grid_switches_fragmented_rows_to_dense():
+    grid = RunGrid(100, 3, 1, 32, max_runs=8)
+    for x in range(0, 20, 2):
+        grid.set(x, 1, 2, ord('x'))
+    assert grid.dense_row_count == 1
+    assert grid.row_colours(1, 0, 6) == b'x x x '
+    grid.write_span(2, 0, b'\x02\x01' * 10, b'x ' * 10)
+    assert grid.dense_row_count == 2
+    grid.fill_span(1, 0, 100, 2, ord('o'))
+    assert grid.dense_row_count == 1
+    assert grid.row_runs(1) == [(100, 2, ord('o'))]
+    assert grid.get(3, 2) == (1, 32)
+
+
+def test_run_grid_behaves_as_dense_grid():
+    size = 90
+    dense_grid, run_grid = DenseGrid(size, size, 1, 32), RunGrid(size, size, 1, 32, max_runs=4)
+    for grid in (dense_grid, run_grid):
+        grid.recorder = []
+        grid.fill_span(3, 0, size, 2, ord('x'))
+        grid.fill_column(size - 1, 2, size, 2, ord('y'))
+        grid.write_span(40, 30, b'\x01\x02\x02\x01\x02', b'abcde')
+        grid.write_column(70, 60, b'\x02' * 10, b'0123456789')
+        grid.fill_span(40, 20, 33, 2, ord('z'))
+        grid.set(0, size - 1, 2, ord('z'))
+    assert run_grid == dense_grid
+    assert dense_grid == run_grid
+    assert run_grid.dirty_rows == dense_grid.dirty_rows
+    assert [expand_old_runs(change) for change in run_grid.recorder] == dense_grid.recorder
+    copy = run_grid.copy()
+    copy.set(1, 1, 2, ord('x'))
+    copy.set(31, 40, 2, ord('x'))
+    assert copy != run_grid and run_grid == dense_grid
+
+
+def expand_old_runs(change):
+    if change[4] is None:
+        return change[:3] + change[3].planes() + change[5:]
+    return change
+
+
+def test_run_grid_records_old_runs_and_writes_them_back():
+    grid = RunGrid(100, 2, 1, 32, max_runs=4)
+    grid.fill_span(0, 10, 20, 2, ord('x'))
+    grid.recorder = []
+    grid.fill_span(0, 0, 100, 2, ord('o'))
+    # the row is stored dense after this write, so the next one records bytes
+    grid.write_span(1, 0, b'\x02\x01' * 5, b'x ' * 5)
+    grid.write_span(1, 0, b'\x02\x01', b'x ')
+    old_runs = grid.recorder[0][3]
+    assert isinstance(old_runs, Runs) and grid.recorder[0][4] is None
+    assert old_runs.runs == [(10, 1, 32), (10, 2, ord('x')), (80, 1, 32)]
+    assert len(old_runs) == 100
+    assert isinstance(grid.recorder[1][3], Runs)
+    assert grid.recorder[2][3:5] == (b'\x02\x01', b'x ')
+    grid.recorder = None
+    grid.write_runs(0, 0, old_runs.runs)
+    assert grid.row_runs(0) == old_runs.runs
+    grid.write_runs(1, 0, [(4, 2, ord('y'))])
+    assert grid.row_colours(1, 0, 6) == b'yyyyx '
+
+
+def test_run_grid_copy_only_duplicates_written_rows():
+    grid = RunGrid(100, 3, 1, 32, max_runs=4)
+    grid.write_span(0, 0, b'\x02\x01' * 5, b'x ' * 5)
+    grid.write_span(1, 0, b'\x02\x01' * 5, b'x ' * 5)
+    copy = grid.copy()
+    copy.set(1, 0, 2, ord('o'))
+    copy.fill_span(2, 0, 3, 2, ord('o'))
+    assert copy._rows[1] is grid._rows[1]
+    assert grid.row_colours(0, 0, 4) == b'x x ' and copy.row_colours(0, 0, 4) == b'xox '
+    assert grid.row_colours(2, 0, 4) == b'    '
+
+
+def test_run_grid_save_and_load(tmp_path):
+    path = str(tmp_path / 'grid.canvas')
+    grid = RunGrid(100, 70, 1, 32)
+    grid.fill_span(65, 3, 90, 2, ord('x'))
+    grid.save(path)
+    assert DenseGrid.load(path) == grid
+
+
+######## Test dump_cells ########
+
+@pytest.mark.parametrize('grid_class', [DenseGrid, TiledGrid, RunGrid])
+def test_dump_cells_and_load_cells(grid_class):
+    size = 2 * TILE_SIZE + 7
+    grid = grid_class(size, size, 1, 32)
+    grid.fill_span(3, 0, size, 2, ord('x'))
+    grid.fill_column(size - 1, 2, size, 2, ord('y'))
+    grid.write_span(TILE_SIZE, TILE_SIZE - 2, b'\x01\x02\x02\x01', b'abcd')
+    file = io.BytesIO()
+    dump_cells(grid, file)
+    file.seek(0)
+    loaded_grid = grid_class(size, size, 1, 32)
+    load_cells(file, loaded_grid)
+    assert loaded_grid == grid
+    if grid_class is TiledGrid:
+        assert loaded_grid.tile_count == grid.tile_count
+    file.seek(0)
+    with pytest.raises(ValueError):
+        load_cells(file, grid_class(size, size + 1, 1, 32))
+    with pytest.raises(ValueError):
+        load_cells(io.BytesIO(file.getvalue()[:-10]), grid_class(size, size, 1, 32))
@@ -0,0 +1,64 @@
+import os
+
+from canvas import Canvas, CanvasCellContentType, Line, Point, Rectangle
+from workspace import Workspace
+
+import pytest
+
+######## Test Workspace ########
+
+def test_workspace_add_and_switch():
+    workspace = Workspace()
+    assert workspace.current is None
+    first, second = Canvas(3, 2), Canvas(4, 4)
+    workspace.add('first', first)
+    workspace.add('second', second)
+    assert workspace.current is second
+    workspace.switch('first')
+    assert workspace.current is first and workspace.current_name == 'first'
+    assert workspace.sizes() == {'first': (3, 2), 'second': (4, 4)}
+    assert workspace.describe() == "* first 3x2\n  second 4x4"
+    with pytest.raises(ValueError):
+        workspace.switch('third')
+    workspace.close()
+    assert len(workspace) == 0
+
+
+def test_workspace_evicts_least_recently_used_canvases(tmp_path):
+    workspace = Workspace(max_bytes=2 * 100 * 100 * 2 + 10000, directory=str(tmp_path))
+    canvases = [Canvas(100, 100) for _ in range(3)]
+    for index, canvas in enumerate(canvases):
+        canvas.draw_rectangle(Rectangle(Point(index, index), Point(90, 90)))
+        workspace.add(str(index), canvas)
+    assert workspace.is_evicted('0')
+    assert not workspace.is_evicted('1') and not workspace.is_evicted('2')
+    assert len(os.listdir(str(tmp_path))) == 1
+    assert workspace.describe().splitlines()[0] == "  0 100x100 (on disk)"
+    assert workspace.nbytes <= workspace.max_bytes
+
+    workspace.switch('0')
+    assert not workspace.is_evicted('0') and workspace.is_evicted('1')
+    assert canvases[0].cells[0][0] == (CanvasCellContentType.Line, 'x')
+    canvases[0].undo()
+    assert canvases[0].cells[0][0] == (CanvasCellContentType.Empty, ' ')
+    workspace.add('1', Canvas(10, 10))
+    workspace.close()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_workspace_restores_the_storage_of_evicted_canvases():
+    workspace = Workspace(max_bytes=0)
+    canvas = Canvas(50000, 50000)
+    canvas.draw_line(Line(Point(10, 10), Point(10, 20)))
+    expected_text = str(Canvas(30, 30, run_length=True))
+    run_length_canvas = Canvas(30, 30, run_length=True)
+    workspace.add('sparse', canvas)
+    workspace.add('runs', run_length_canvas)
+    assert workspace.is_evicted('sparse') and canvas.is_evicted
+    workspace.switch('sparse')
+    assert canvas._grid.tile_count == 1
+    assert canvas.cells[10][15] == (CanvasCellContentType.Line, 'x')
+    assert workspace.is_evicted('runs')
+    assert str(workspace.get('runs')) == expected_text
+    assert run_length_canvas._grid.dense_row_count == 0
+    workspace.close()
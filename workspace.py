@@ -0,0 +1,181 @@
+"""
+This module defines the workspace holding the named canvases of the application
+
+The canvases are kept in memory within a memory budget: when the canvases in
+memory use more than the budget, the least recently used ones are evicted, their
+cells being written to a temporary file in a compressed form (see
+Canvas.evict), and they are transparently restored from it when they are used
+again. The current canvas is never evicted, and the evicted canvases keep their
+undo history in memory.
+"""
+
+from collections import OrderedDict
+import os
+import tempfile
+
+DEFAULT_NAME = 'main'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class Workspace(object):
+    """
+    Holds named canvases, one of them being the current one
+
+    The memory budget is enforced whenever the current canvas changes, i.e.
+    when a canvas is added or switched to.
+
+    Args:
+        max_bytes: the memory budget of the canvases (see Canvas.nbytes), None
+            for no limit
+        directory: the directory the evicted canvases are written to, a new
+            temporary directory by default
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, directory=None):
+        self.max_bytes = max_bytes
+        self.current_name = None
+        # name -> canvas, the least recently used first
+        self._canvases = OrderedDict()
+        # name -> the path of the file holding the cells of an evicted canvas
+        self._evicted_paths = {}
+        self._directory = directory
+        self._temporary_directory = None
+        self._file_count = 0
+
+    @property
+    def current(self):
+        """
+        The current canvas, None if there is none yet
+        """
+        if self.current_name is None:
+            return None
+        return self.get(self.current_name)
+
+    def get(self, name):
+        """
+        Returns a canvas, restoring it first if it has been evicted
+
+        Args:
+            name: the name of the canvas
+        """
+        canvas = self._canvases.get(name)
+        if canvas is None:
+            raise ValueError("No canvas named " + name)
+        self._canvases.move_to_end(name)
+        path = self._evicted_paths.pop(name, None)
+        if path is not None:
+            with open(path, 'rb') as file:
+                canvas.restore(file)
+            os.remove(path)
+        return canvas
+
+    def add(self, name, canvas):
+        """
+        Adds a canvas under a name, replacing the canvas of that name if any,
+        and makes it the current one
+
+        Args:
+            name: the name of the canvas
+            canvas: the canvas to add
+        """
+        if name in self._canvases:
+            self._forget(name)
+        self._canvases[name] = canvas
+        self.current_name = name
+        self._enforce_budget()
+
+    def switch(self, name):
+        """
+        Makes a canvas the current one
+
+        Args:
+            name: the name of the canvas
+        """
+        self.get(name)
+        self.current_name = name
+        self._enforce_budget()
+
+    def sizes(self):
+        """
+        Returns the (width, height) of the canvases by name, without restoring
+        the evicted ones
+        """
+        return {name: (canvas.width, canvas.height) for name, canvas in self._canvases.items()}
+
+    def is_evicted(self, name):
+        """
+        Returns whether the cells of a canvas are on disk rather than in memory
+        """
+        return name in self._evicted_paths
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes used in memory by the canvases
+        """
+        return sum(canvas.nbytes for canvas in self._canvases.values())
+
+    def describe(self):
+        """
+        Returns the list of the canvases as text, one per line with its size,
+        the current one being marked with '*'
+        """
+        lines = []
+        for name in sorted(self._canvases):
+            canvas = self._canvases[name]
+            lines.append("{} {} {}x{}{}".format(
+                '*' if name == self.current_name else ' ', name, canvas.width, canvas.height,
+                " (on disk)" if name in self._evicted_paths else ""))
+        return '\n'.join(lines)
+
+    def close(self):
+        """
+        Closes the canvases and removes their files
+        """
+        for name in list(self._canvases):
+            self._forget(name)
+        self.current_name = None
+        if self._temporary_directory is not None:
+            self._temporary_directory.cleanup()
+            self._temporary_directory = None
+
+    def __contains__(self, name):
+        return name in self._canvases
+
+    def __len__(self):
+        return len(self._canvases)
+
+    def _forget(self, name):
+        self._canvases.pop(name).close()
+        path = self._evicted_paths.pop(name, None)
+        if path is not None:
+            os.remove(path)
+
+    def _enforce_budget(self):
+        if self.max_bytes is None:
+            return
+        nbytes = self.nbytes
+        for name, canvas in list(self._canvases.items()):
+            if nbytes <= self.max_bytes:
+                break
+            if name == self.current_name or name in self._evicted_paths:
+                continue
+            nbytes -= canvas.nbytes
+            path = self._new_path()
+            try:
+                with open(path, 'wb') as file:
+                    canvas.evict(file)
+            except ValueError:
+                # a parallel canvas stays in memory
+                os.remove(path)
+            else:
+                self._evicted_paths[name] = path
+            nbytes += canvas.nbytes
+
+    def _new_path(self):
+        directory = self._directory
+        if directory is None:
+            if self._temporary_directory is None:
+                self._temporary_directory = tempfile.TemporaryDirectory(prefix='canvases')
+            directory = self._temporary_directory.name
+        self._file_count += 1
+        return os.path.join(directory, '{}.canvas'.format(self._file_count))